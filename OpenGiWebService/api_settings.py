@@ -0,0 +1,53 @@
+"""
+Lean profile for serving the JSON API only.
+
+The API is a stateless JSON to SOAP bridge, so the admin, sessions, messages, static files and django.contrib.auth
+are left out, along with their middleware. DRF authenticates with API keys instead.
+
+    DJANGO_SETTINGS_MODULE=OpenGiWebService.api_settings gunicorn OpenGiWebService.wsgi
+
+`python -m benchmarks.bench_settings_profile` compares its per-request overhead and boot time with settings.py.
+"""
+import os
+from .settings import *
+
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'api'
+]
+
+MIDDLEWARE = [
+    'api.middleware.EndpointMiddleware',
+    'api.middleware.AdmissionMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    # Kept for ALLOWED_HOSTS validation of every request
+    'django.middleware.common.CommonMiddleware',
+]
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+SECURE_CONTENT_TYPE_NOSNIFF = True
+
+SECURE_BROWSER_XSS_FILTER = True
+
+# Keys accepted in the X-Api-Key header, comma separated. Requests are not authenticated while there are none
+API_KEYS = [key for key in os.environ.get('OPENGI_API_KEYS', '').split(',') if key]
+
+REST_FRAMEWORK = {
+    'NUM_PROXIES': REST_FRAMEWORK['NUM_PROXIES'],
+    'DEFAULT_AUTHENTICATION_CLASSES': ['api.authentication.ApiKeyAuthentication'],
+    'DEFAULT_PERMISSION_CLASSES': ['api.authentication.HasApiKey'],
+    'DEFAULT_THROTTLE_CLASSES': ['api.throttling.TokenBucketThrottle'],
+    'DEFAULT_RENDERER_CLASSES': ['api.fast_json.FastJSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['api.fast_json.FastJSONParser'],
+    # The default, AnonymousUser, would import django.contrib.auth models
+    'UNAUTHENTICATED_USER': None,
+}
+
+try:
+    from .local_settings import *
+except ImportError:
+    pass
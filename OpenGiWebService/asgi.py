@@ -0,0 +1,25 @@
+"""
+ASGI config for OpenGiWebService project.
+
+Serves /api/prospect and /api/risk from async views so a single worker can keep many XStream calls in flight, e.g.
+
+    uvicorn OpenGiWebService.asgi:application
+
+Requires the packages in requirements/async.txt.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "OpenGiWebService.settings")
+
+wsgi_application = get_wsgi_application()
+
+from api import jobs  # noqa: E402
+from api.asgi import ApiApplication  # noqa: E402
+from api.async_views import routes, soap_service, check_request  # noqa: E402
+
+jobs.start_in_process()
+
+application = ApiApplication(routes, wsgi_application, on_shutdown=soap_service.close, check_request=check_request)
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.EndpointMiddleware',
+    'api.middleware.AdmissionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -183,13 +185,36 @@ LOGGING = {
         'api': {
             'handlers': ['console', 'mail_admins', 'logfile'],
             'level': 'DEBUG'
+        },
+        'api.payloads': {
+            'level': 'DEBUG'
         }
     }
 }
 
+# Handlers of these loggers run on a background QueueListener thread per logger, so file writes and admin email never
+# block a request
+# queue_size - records waiting before new ones are dropped (counted in log_records_dropped)
+ASYNC_LOGGING = {
+    'enabled': True,
+    'loggers': ['api', 'django.request'],
+    'queue_size': 10000
+}
+
 # Project Specific
 WSDL = "file://{}".format(os.path.abspath(os.path.join(BASE_DIR, 'templates', 'UAT.wsdl')))
 
+# Overrides the soap:address in WSDL, e.g. to point at a local stub. None uses the wsdl address
+XSTREAM_ADDRESS = None
+
+# Offline copy of WSDL and its remote schemas, written by `manage.py vendor_wsdl`
+# max_age - seconds before the cache is treated as stale, None to only check the source wsdl hash
+WSDL_CACHE = {
+    'dir': os.path.abspath(os.path.join(BASE_DIR, 'templates', 'wsdl_cache')),
+    'max_age': None,
+    'fetch_timeout': 30
+}
+
 XML_TEMPLATES = {
     'prospect_create': {
         'template': 'templates\\prospect_create.xml',
@@ -261,4 +286,282 @@ VALIDATORS = {
             }
         }
     }
-}
\ No newline at end of file
+}
+
+# size - max zeep clients per worker process, built lazily on demand
+# max_uses - a client is rebuilt after this many borrows
+# acquire_timeout - seconds to wait for a free client before failing the request
+SOAP_CLIENT_POOL = {
+    'size': 4,
+    'max_uses': 1000,
+    'acquire_timeout': 10
+}
+
+# Shared keep-alive HTTP session used by every soap client in a worker process, new connections resume the TLS session
+# of the last one to the host (counted in xstream_tls_sessions_resumed)
+# pool_maxsize - max open connections to the XStream host
+# pool_block - wait for a free connection rather than opening one over pool_maxsize
+# connect_timeout / read_timeout - seconds, applied to processMessage calls
+# load_timeout - seconds, applied to remote wsdl/xsd loads
+XSTREAM_TRANSPORT = {
+    'pool_maxsize': 8,
+    'pool_block': True,
+    'connect_timeout': 5,
+    'read_timeout': 60,
+    'load_timeout': 30
+}
+
+# ASGI mode (OpenGiWebService/asgi.py) only
+# max_connections - max concurrent XStream connections per worker event loop
+XSTREAM_ASYNC = {
+    'max_connections': 200
+}
+
+# Fields read from each xmlreply, paths are relative to <xmlreply>
+# many - collect every match instead of the first
+XSTREAM_REPLY_FIELDS = {
+    'result': {'path': 'messages/result'},
+    'errors': {'path': 'messages/error', 'many': True},
+    'refno': {'path': 'apmdata/prospect/p.cm/refno'}
+}
+
+# Opt-in result cache for idempotent XStream function types (char20.1), create-* and convert-* are never cached
+# backend - api.response_cache.MemoryBackend (per process LRU) or api.response_cache.DjangoCacheBackend (shared)
+# options - backend kwargs, max_entries for MemoryBackend, alias (CACHES key) for DjangoCacheBackend
+# functions - function type to {'ttl': seconds}, e.g. {'update-cliv': {'ttl': 300}}
+XSTREAM_RESPONSE_CACHE = {
+    'backend': 'api.response_cache.MemoryBackend',
+    'options': {'max_entries': 1000},
+    'functions': {}
+}
+
+# /api/prospect/bulk and `manage.py import_prospects`
+# workers - max concurrent create_prospect calls per import
+# rate_limit - max create_prospect calls per second, shared by the imports of a process through the ADMISSION rate
+#              limit buckets (of every process with api.admission.DatabaseBuckets), None for no limit
+BULK_IMPORT = {
+    'workers': 4,
+    'rate_limit': 10
+}
+
+# Database backed queue for deferred XStream work (api.jobs), no external broker needed
+# policy_async - queue every /api/risk submission and return 202, otherwise only when sent `Prefer: respond-async`
+# in_process - run workers as threads in each web process, started with the WSGI / ASGI application, set False when
+#              running `manage.py run_jobs` instead
+# workers - worker threads per process
+# poll_interval - seconds between polls of an empty queue
+# running_timeout - seconds after which a job claimed by a worker that died is queued again
+JOB_QUEUE = {
+    'policy_async': False,
+    'in_process': True,
+    'workers': 2,
+    'poll_interval': 1,
+    'running_timeout': 10 * 60
+}
+
+# Durable outbox (api.outbox): /api/prospect and /api/risk messages XStream never received (circuit open, connection
+# refused or timed out connecting) are stored and answered 202, then replayed in the background, in order per client
+# Refno. Failures after the message may have reached XStream, such as read timeouts, still answer 500 and are dead
+# lettered on replay, as resending them could duplicate the prospect or policy. `manage.py outbox` inspects and
+# requeues them.
+# enabled - otherwise such requests fail with 503 / 500 as before
+# in_process - run the replayer as a thread in each web process, set False when running `manage.py outbox replay`
+# batch_size - messages claimed per replay round
+# workers - max concurrent XStream calls per replay round
+# max_attempts - unsent attempts before a message is dead lettered, sends refused by an open circuit are not counted
+# backoff / max_backoff - seconds before a failed send is retried, doubled per attempt up to max_backoff
+# poll_interval - seconds between polls of an empty outbox
+# sending_timeout - seconds after which a message claimed by a replayer that died is sent again
+# retention - seconds sent messages are kept, deleted every compact_interval seconds by the replayer
+OUTBOX = {
+    'enabled': True,
+    'in_process': True,
+    'batch_size': 20,
+    'workers': 2,
+    'max_attempts': 10,
+    'backoff': 5,
+    'max_backoff': 10 * 60,
+    'poll_interval': 1,
+    'sending_timeout': 5 * 60,
+    'retention': 7 * 24 * 60 * 60,
+    'compact_interval': 60 * 60
+}
+
+# Per function type (char20.1) circuit breaker and retry around processMessage, views answer 503 while open
+# failure_threshold - consecutive transport failures that open the circuit
+# reset_timeout - seconds an open circuit fails fast before letting a probe call through (half-open)
+# max_retries - extra attempts after a transport failure, create-* and convert-* are never retried
+# backoff_base / backoff_cap - seconds, retry n waits a random time up to min(backoff_cap, backoff_base * 2 ** n)
+# retry_budget - retries earned per request, 0.2 allows at most 20% extra load on XStream
+# retry_budget_min - retries always available to a process, so a quiet worker can still retry
+XSTREAM_CIRCUIT_BREAKER = {
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+    'max_retries': 2,
+    'backoff_base': 0.1,
+    'backoff_cap': 2,
+    'retry_budget': 0.2,
+    'retry_budget_min': 10
+}
+
+# Defaults for `manage.py xstream_simulator`, a local stand-in for XStream. Point XSTREAM_ADDRESS at it to use it
+# latency - fixed:MS, uniform:LOW_MS,HIGH_MS, lognormal:MEDIAN_MS,SIGMA or exponential:MEAN_MS
+# error_rate - fraction of calls answered with a business Error xmlreply
+# fault_rate - fraction of calls answered with a 500 soap fault
+XSTREAM_SIMULATOR = {
+    'host': '127.0.0.1',
+    'port': 8088,
+    'latency': 'lognormal:120,0.5',
+    'error_rate': 0.02,
+    'fault_rate': 0
+}
+
+# XStream messages and replies logged at DEBUG by the 'api.payloads' logger
+# max_length - characters logged per payload, the rest is truncated
+# redact - p.cm elements whose text is replaced with ***
+XSTREAM_PAYLOAD_LOG = {
+    'max_length': 4096,
+    'redact': ['Name', 'Addr1', 'Addr2', 'Addr3', 'Addr4', 'Pcode', 'Tel', 'Email']
+}
+
+# Identical XStream messages in flight at the same time share one call and its Result (single-flight)
+# backend - None to coalesce within each process, or api.single_flight.DjangoCacheLockBackend to also coalesce across
+#           processes through a shared cache
+# options - backend kwargs: alias (CACHES key), lock_timeout, wait_timeout, result_ttl, poll_interval (seconds)
+# linger - seconds a successful Result is still shared after its call completes, 0 for in-flight calls only
+XSTREAM_SINGLE_FLIGHT = {
+    'enabled': True,
+    'backend': None,
+    'options': {},
+    'linger': 0
+}
+
+# Idempotency-Key support on /api/prospect and /api/risk, keys are scoped to the client's API key (or address)
+# ttl - seconds a response is replayed for retries of the same request
+# in_progress_timeout - seconds before an unfinished first request is treated as abandoned and may be retried
+# compact_interval - seconds between deletes of expired records, run by idle job workers (started with each web
+#                    process, or `manage.py run_jobs`, see JOB_QUEUE). Run `manage.py compact_idempotency` from cron
+#                    if neither runs
+IDEMPOTENCY = {
+    'ttl': 24 * 60 * 60,
+    'in_progress_timeout': 120,
+    'compact_interval': 60 * 60
+}
+
+# /api/transact transfer and buy (api.transact.STEPS)
+# workers - max concurrent XStream calls per transaction, steps that do not depend on each other run together
+TRANSACT = {
+    'workers': 2
+}
+
+# /api/quote memoises rating results per process, keyed on the policy and its normalised rating sections
+# max_entries - least recently used quotes are dropped beyond this
+# ttl - seconds a memoised quote is served before XStream is asked again
+QUOTE_MEMO = {
+    'max_entries': 10000,
+    'ttl': 15 * 60
+}
+
+# Operations sent together, e.g. by /api/prospect-and-risk, are merged into one xmlexecute envelope where a rule
+# matches, otherwise sent in turn over the same keep-alive connection
+# merge - list of {'operations': [function types, in order], 'function_type': char20.1 of the merged envelope}. Only
+#         add rules the XStream scheme accepts, e.g. {'operations': ['create-cliv-prospect', 'create-cliv-policy'],
+#         'function_type': 'create-cliv'} (the simulator does)
+XSTREAM_BATCH = {
+    'merge': []
+}
+
+# orjson backed JSON parsing and rendering (api.fast_json), with DRF's error messages for malformed bodies
+# NUM_PROXIES - proxies in front of the api (OPENGI_NUM_PROXIES). Requests without an API key are identified, and rate
+#               limited, by the address that many hops back in X-Forwarded-For, or by REMOTE_ADDR when 0. Unset, DRF
+#               would trust the whole header, so a client could send a new address with each request to dodge its limit
+REST_FRAMEWORK = {
+    'NUM_PROXIES': int(os.environ.get('OPENGI_NUM_PROXIES', 0)),
+    'DEFAULT_PARSER_CLASSES': [
+        'api.fast_json.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser'
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.fast_json.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle'
+    ]
+}
+
+# Admission control in front of the api views
+# rate_limit - token bucket per client (API key id, otherwise client address), answered 429 with Retry-After when empty
+#   backend - api.admission.MemoryBuckets (the default, per process: each worker, and each `manage.py import_prospects`,
+#             enforces the full rate on its own, so a client can get up to rate times the number of workers) or
+#             api.admission.DatabaseBuckets (shared by every process, at the cost of an UPDATE per api request)
+#   rate - tokens added per second, None for no limit
+#   burst - bucket size, the requests a quiet client can make at once
+#   clients - API key id or address to {'rate', 'burst'}, overriding the defaults for that client
+#   compact_interval - seconds between deletes of idle buckets, run by the throttle of the next request due
+# shedding - CoDel on the queueing delay in the X-Request-Start header set by the proxy (e.g. nginx
+#            `proxy_set_header X-Request-Start "t=${msec}";`), answered 503 with Retry-After
+#   target - seconds of queueing delay tolerated
+#   interval - seconds the delay must stay over target before requests are shed
+#   path_prefix - only these requests are shed, /metrics keeps answering
+ADMISSION = {
+    'rate_limit': {
+        'backend': 'api.admission.MemoryBuckets',
+        'rate': 20,
+        'burst': 40,
+        'clients': {},
+        'compact_interval': 60 * 60
+    },
+    'shedding': {
+        'enabled': True,
+        'target': 0.1,
+        'interval': 1,
+        'path_prefix': '/api/'
+    }
+}
+
+# Priority scheduling of outbound XStream calls (api.scheduler). Website requests run as default_class, bulk imports
+# and queued jobs as background_class. Waiting calls are admitted by weighted fair queuing between classes.
+# capacity - max concurrent XStream calls per process, None for SOAP_CLIENT_POOL['size']
+# timeout - seconds a call waits for a slot before failing
+# classes - name to:
+#   weight - share of the slots while classes are competing for them
+#   max_concurrent - max slots held by the class, None for capacity, keeps slots free for the other classes
+#   queue - XStream <job><queue> value of the class's messages
+XSTREAM_SCHEDULER = {
+    'enabled': True,
+    'capacity': None,
+    'timeout': 10,
+    'default_class': 'interactive',
+    'background_class': 'batch',
+    'classes': {
+        'interactive': {'weight': 8, 'max_concurrent': None, 'queue': '1'},
+        'batch': {'weight': 1, 'max_concurrent': 2, 'queue': '2'}
+    }
+}
+
+# Audit trail of every XStream processMessage request and xmlreply (api.audit), written by a background thread per
+# process into compressed, append-only segments indexed on Refno, Polref and function type. `manage.py audit` looks
+# records up.
+# Records hold the full request and reply, so client personal data (names, addresses, phone numbers, email) is kept
+# for retention_days outside the database. It is off by default: enable it where the trail is needed, with dir on
+# storage readable only by the service account (it is created 0700) and the people allowed to run `manage.py audit`,
+# and retention_days no longer than disputes with XStream require. A client's records are only erased when their
+# segment expires.
+# enabled - record every call, leave off for the tests and benchmarks, which would record their traffic into dir
+# dir - segment directory outside the source tree, shared by the processes of a host (OPENGI_AUDIT_DIR)
+# segment_bytes - compressed size at which a segment is sealed and indexed
+# block_records - max records per compressed block
+# queue_size - records waiting to be written before new ones are dropped (counted in audit_records_dropped)
+# retention_days - sealed segments older than this are deleted
+# compact_interval - seconds between passes deleting expired segments and merging small ones, run by the writer
+XSTREAM_AUDIT = {
+    'enabled': False,
+    'dir': os.environ.get('OPENGI_AUDIT_DIR', '/var/lib/opengi/audit'),
+    'segment_bytes': 16 * 1024 * 1024,
+    'block_records': 256,
+    'queue_size': 10000,
+    'retention_days': 90,
+    'compact_interval': 60 * 60
+}
@@ -16,7 +16,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from api import urls as api_urls
+from api.views import Metrics
 
 urlpatterns = [
     path('api/', include(api_urls)),
+    path('metrics', Metrics.as_view()),
 ]
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "OpenGiWebService.settings")
 
 application = get_wsgi_application()
+
+from api import jobs  # noqa: E402
+
+jobs.start_in_process()
@@ -0,0 +1,238 @@
+import json
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from api import admission
+from api.admission import CoDel, DatabaseBuckets, MemoryBuckets
+from api.metrics import counters
+from api.models import RateLimitBucket
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryBucketsTests(TestCase):
+
+    @mock.patch('api.admission.time.monotonic')
+    def test_burst_then_refill(self, mock_monotonic):
+        # Arrange
+        mock_monotonic.return_value = 100.0
+        buckets = MemoryBuckets()
+
+        # Act
+        burst = [buckets.take('client', 2, 3) for _ in range(4)]
+        mock_monotonic.return_value = 100.5
+        refilled = buckets.take('client', 2, 3)
+        other = buckets.take('other', 2, 3)
+
+        # Assert
+        self.assertEqual(burst, [0, 0, 0, 0.5])
+        self.assertEqual(refilled, 0)
+        self.assertEqual(other, 0)
+
+    @mock.patch('api.admission.time.monotonic')
+    def test_compact(self, mock_monotonic):
+        # Arrange
+        mock_monotonic.return_value = 100.0
+        buckets = MemoryBuckets()
+        buckets.take('idle', 1, 1)
+        mock_monotonic.return_value = 200.0
+        buckets.take('active', 1, 1)
+
+        # Act
+        buckets.compact(50)
+
+        # Assert
+        self.assertEqual(list(buckets._buckets), ['active'])
+
+
+class DatabaseBucketsTests(TestCase):
+
+    @mock.patch('api.admission.time.time')
+    def test_burst_then_refill(self, mock_time):
+        # Arrange
+        mock_time.return_value = 1000.0
+        buckets = DatabaseBuckets()
+
+        # Act
+        burst = [buckets.take('client', 2, 3) for _ in range(4)]
+        mock_time.return_value = 1000.5
+        refilled = buckets.take('client', 2, 3)
+
+        # Assert
+        self.assertEqual(burst, [0, 0, 0, 0.5])
+        self.assertEqual(refilled, 0)
+        bucket = RateLimitBucket.objects.get(key='client')
+        self.assertAlmostEqual(bucket.tokens, 0)
+        self.assertEqual(bucket.updated, 1000.5)
+
+    @mock.patch('api.admission.time.time')
+    def test_refill_capped_at_burst(self, mock_time):
+        # Arrange
+        mock_time.return_value = 1000.0
+        buckets = DatabaseBuckets()
+        buckets.take('client', 1, 2)
+        mock_time.return_value = 5000.0
+
+        # Act
+        taken = [buckets.take('client', 1, 2) for _ in range(3)]
+
+        # Assert
+        self.assertEqual(taken, [0, 0, 1])
+
+    @mock.patch('api.admission.time.time')
+    def test_compact(self, mock_time):
+        # Arrange
+        RateLimitBucket.objects.create(key='idle', tokens=0, updated=100)
+        RateLimitBucket.objects.create(key='active', tokens=0, updated=180)
+        mock_time.return_value = 200.0
+
+        # Act
+        DatabaseBuckets().compact(50)
+
+        # Assert
+        self.assertEqual(list(RateLimitBucket.objects.values_list('key', flat=True)), ['active'])
+
+
+class LimitsTests(TestCase):
+
+    def test_client_override(self):
+        # Arrange
+        config = dict(settings.ADMISSION, rate_limit=dict(
+            settings.ADMISSION['rate_limit'], rate=5, burst=10, clients={'batch': {'rate': None, 'burst': 0}}
+        ))
+
+        # Act
+        with override_settings(ADMISSION=config):
+            limits = admission.limits_for('batch'), admission.limits_for('127.0.0.1')
+
+        # Assert
+        self.assertEqual(limits, ((None, 0), (5, 10)))
+
+
+    @mock.patch('api.admission._last_compacted', float('-inf'))
+    def test_compacted_by_throttled_requests(self):
+        # Arrange
+        buckets = mock.Mock()
+        buckets.take.return_value = 0
+
+        # Act
+        with mock.patch('api.admission._buckets', buckets):
+            responses = [self.client.get('/api/jobs/00000000-0000-0000-0000-000000000000') for _ in range(2)]
+
+        # Assert
+        self.assertEqual([response.status_code for response in responses], [404, 404])
+        rate_limit = settings.ADMISSION['rate_limit']
+        buckets.compact.assert_called_once_with(rate_limit['burst'] / rate_limit['rate'])
+
+
+class CoDelTests(TestCase):
+
+    def test_sheds_after_interval_over_target(self):
+        # Arrange
+        clock = Clock()
+        codel = CoDel(0.1, 1, clock)
+
+        # Act
+        decisions = []
+        for now in (0, 0.5, 1.0, 1.5, 2.0, 2.6, 2.8):
+            clock.now = now
+            decisions.append(codel.should_shed(0.5))
+
+        # Assert
+        self.assertEqual(decisions, [False, False, True, False, True, False, True])
+
+    def test_recovers_under_target(self):
+        # Arrange
+        clock = Clock()
+        codel = CoDel(0.1, 1, clock)
+        codel.should_shed(0.5)
+        clock.now = 1.0
+        codel.should_shed(0.5)
+
+        # Act
+        clock.now = 1.1
+        under = codel.should_shed(0.05)
+        clock.now = 1.2
+        over_again = codel.should_shed(0.5)
+
+        # Assert
+        self.assertFalse(under)
+        self.assertFalse(over_again)
+
+    def test_short_spike_not_shed(self):
+        # Arrange
+        clock = Clock()
+        codel = CoDel(0.1, 1, clock)
+
+        # Act
+        decisions = []
+        for now, delay in ((0, 0.5), (0.9, 0.5), (0.95, 0.01), (1.5, 0.5)):
+            clock.now = now
+            decisions.append(codel.should_shed(delay))
+
+        # Assert
+        self.assertEqual(decisions, [False] * 4)
+
+
+class QueueDelayTests(TestCase):
+
+    def test_formats(self):
+        # Act
+        delays = [admission.queue_delay(header, now=1700000000.25) for header in (
+            't=1700000000.000', '1700000000000', '1700000000000000', 't=1700000000000000', '1700000001'
+        )]
+
+        # Assert
+        self.assertEqual(delays, [0.25, 0.25, 0.25, 0.25, 0.0])
+
+    def test_missing_or_invalid(self):
+        # Act
+        delays = [admission.queue_delay(header, now=1000) for header in (None, '', 't=soon')]
+
+        # Assert
+        self.assertEqual(delays, [None, None, None])
+
+
+class AdmissionMiddlewareTests(TestCase):
+
+    def setUp(self):
+        clock = Clock()
+        patcher = mock.patch.object(admission, '_codel', CoDel(0.1, 1, clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = clock
+
+    @mock.patch('api.middleware.admission.queue_delay', return_value=0.5)
+    def test_sheds_when_delayed(self, mock_queue_delay):
+        # Arrange
+        shed_before = counters.get('admission_shed')
+        self.client.post('/api/prospect', data='{}', content_type='application/json', HTTP_X_REQUEST_START='t=1')
+        self.clock.now = 1.0
+
+        # Act
+        response = self.client.post('/api/prospect', data='{}', content_type='application/json',
+                                    HTTP_X_REQUEST_START='t=1')
+
+        # Assert
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'message': 'Service unavailable'})
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(counters.get('admission_shed'), shed_before + 1)
+        mock_queue_delay.assert_called_with('t=1')
+
+    def test_served_without_header(self):
+        # Arrange
+        self.clock.now = 10.0
+
+        # Act
+        response = self.client.post('/api/prospect', data='{}', content_type='application/json')
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
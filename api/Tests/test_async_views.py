@@ -0,0 +1,250 @@
+import asyncio
+import json
+from unittest import mock
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.test import TestCase, TransactionTestCase, override_settings
+from api import admission, async_views, views
+from api.asgi import ApiApplication
+from api.authentication import ApiKeyAuthentication, HasApiKey
+from api.models import OutboxMessage
+from api.services import Result, XStreamError
+
+
+def call_asgi(app, method: str, path: str, body: bytes = b'', headers: list = ()) -> list:
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'client': ('127.0.0.1', 50000),
+             'headers': [(b'content-type', b'application/json')] + list(headers)}
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def run_asgi(app, method: str, path: str, body: bytes = b'', headers: list = ()):
+    sent = call_asgi(app, method, path, body, headers)
+    return sent[0]['status'], sent[1]['body']
+
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        self.prospect = {
+            'Name': 'Bob Test',
+            'Addr1': '3 Test Rd',
+            'Pcode': 'TT1 TT2',
+            'Tel': '1234567890',
+            'Email': 'j@j.com',
+        }
+
+    @mock.patch('api.async_views.soap_service.process_message')
+    def test_prospect_created(self, mock_process: mock.MagicMock):
+        # Arrange
+        result = Result(data={'Refno': 'ABCD01'})
+        result.status = True
+
+        async def process(xml):
+            return result
+        mock_process.side_effect = process
+
+        # Act
+        response = asyncio.run(async_views.prospect(self.prospect))
+
+        # Assert
+        self.assertEqual(response, (200, {'Refno': 'ABCD01'}))
+        self.assertIn('<char20.1>create-cliv-prospect</char20.1>', mock_process.call_args[0][0])
+
+    @mock.patch('api.async_views.soap_service.process_message')
+    def test_prospect_malformed(self, mock_process: mock.MagicMock):
+        # Act
+        result = asyncio.run(async_views.prospect({'Name': 'Bob Test'}))
+
+        # Assert
+        self.assertEqual(result, (400, {'message': 'Malformed request'}))
+        mock_process.assert_not_called()
+
+
+@override_settings(OUTBOX=dict(settings.OUTBOX, in_process=False))
+class AsyncOutboxTests(TransactionTestCase):
+    """
+    The outbox is written from the executor's threads, which do not see a TestCase transaction
+    """
+
+    @mock.patch('api.async_views.soap_service.process_message')
+    def test_unsent_prospect_stored(self, mock_process: mock.MagicMock):
+        # Arrange
+        mock_process.side_effect = XStreamError('Failed to post to xstream, error: Refused', sent=False)
+
+        # Act
+        status_code, data, headers = asyncio.run(async_views.prospect(PROSPECT))
+
+        # Assert
+        message = OutboxMessage.objects.get()
+        self.assertEqual((status_code, data), (202, {'outbox': message.id}))
+        self.assertEqual(headers, {'Location': '/api/outbox/{}'.format(message.id)})
+
+    @mock.patch('api.async_views.soap_service.process_message')
+    def test_prospect_that_may_have_been_sent_not_stored(self, mock_process: mock.MagicMock):
+        # Arrange
+        mock_process.side_effect = XStreamError('Failed to post to xstream, error: Read timed out')
+
+        # Act
+        result = asyncio.run(async_views.prospect(PROSPECT))
+
+        # Assert
+        self.assertEqual(result, (500, {'message': 'Error'}, {}))
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class ApiApplicationTests(TestCase):
+
+    def setUp(self):
+        async def echo(data):
+            return 200, data
+
+        self.wsgi_application = mock.Mock(side_effect=self.fake_wsgi)
+        self.app = ApiApplication({'/api/echo': echo}, self.wsgi_application)
+
+    @staticmethod
+    def fake_wsgi(environ, start_response):
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [environ['PATH_INFO'].encode('utf-8')]
+
+    def test_async_route(self):
+        # Act
+        status_code, body = run_asgi(self.app, 'POST', '/api/echo', b'{"a": 1}')
+
+        # Assert
+        self.assertEqual(status_code, 200)
+        self.assertEqual(json.loads(body.decode('utf-8')), {'a': 1})
+        self.wsgi_application.assert_not_called()
+
+    def test_malformed_json(self):
+        # Act
+        status_code, body = run_asgi(self.app, 'POST', '/api/echo', b'{')
+
+        # Assert
+        self.assertEqual(status_code, 400)
+        self.assertIn('JSON parse error', json.loads(body.decode('utf-8'))['detail'])
+
+    def test_method_not_allowed(self):
+        # Act
+        status_code, body = run_asgi(self.app, 'GET', '/api/echo')
+
+        # Assert
+        self.assertEqual(status_code, 405)
+
+    def test_other_paths_fall_back_to_wsgi(self):
+        # Act
+        status_code, body = run_asgi(self.app, 'POST', '/api/transact', b'{}')
+
+        # Assert
+        self.assertEqual(status_code, 404)
+        self.assertEqual(body, b'/api/transact')
+
+    @mock.patch('api.bulk.create_prospect')
+    def test_streamed_response_sent_in_chunks(self, mock_create: mock.MagicMock):
+        # Arrange
+        result = Result(data={'Refno': 'ABCD01'})
+        result.status = True
+        mock_create.return_value = result
+        line = json.dumps(PROSPECT).encode('utf-8') + b'\n'
+        parts = [line, line]
+        sent = []
+
+        async def receive():
+            body = parts.pop(0)
+            return {'type': 'http.request', 'body': body, 'more_body': bool(parts)}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/prospect/bulk', 'client': ('127.0.0.1', 50000),
+                 'headers': [(b'host', b'testserver'), (b'content-type', b'application/x-ndjson'),
+                             (b'content-length', str(len(line) * 2).encode('latin1'))]}
+        app = ApiApplication({}, get_wsgi_application())
+
+        # Act
+        asyncio.run(app(scope, receive, send))
+
+        # Assert
+        bodies = [message['body'] for message in sent if message['type'] == 'http.response.body' and message['body']]
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual([json.loads(body)['row'] for body in bodies], [1, 2])
+        self.assertEqual(sent[-1], {'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    def test_sync_headers_fall_back_to_wsgi(self):
+        # Act
+        status_code, body = run_asgi(self.app, 'POST', '/api/echo', b'{}', [(b'idempotency-key', b'abc')])
+
+        # Assert
+        self.assertEqual((status_code, body), (404, b'/api/echo'))
+
+    def test_shed_when_delayed(self):
+        # Arrange
+        patcher = mock.patch.object(admission, '_codel', mock.Mock(**{'should_shed.return_value': True}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Act
+        status_code, body = run_asgi(self.app, 'POST', '/api/echo', b'{}', [(b'x-request-start', b't=1')])
+
+        # Assert
+        self.assertEqual(status_code, 503)
+        self.wsgi_application.assert_not_called()
+
+
+class CheckRequestTests(TestCase):
+
+    def setUp(self):
+        self.handler = mock.Mock(side_effect=self.created)
+        self.app = ApiApplication({'/api/prospect': self.handler}, mock.Mock(),
+                                  check_request=async_views.check_request)
+        patcher = mock.patch.object(admission, '_buckets', admission.MemoryBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    async def created(data):
+        return 200, {'Refno': 'ABCD01'}
+
+    @override_settings(API_KEYS=['first-key'])
+    @mock.patch.object(views.Prospect, 'permission_classes', [HasApiKey])
+    @mock.patch.object(views.Prospect, 'authentication_classes', [ApiKeyAuthentication])
+    def test_api_key_required(self):
+        # Act
+        refused = dict(call_asgi(self.app, 'POST', '/api/prospect', b'{}')[0]['headers'])
+        allowed = run_asgi(self.app, 'POST', '/api/prospect', b'{}', [(b'x-api-key', b'first-key')])
+
+        # Assert
+        self.assertEqual(refused[b'www-authenticate'], b'Api-Key')
+        self.assertEqual(allowed, (200, b'{"Refno":"ABCD01"}'))
+        self.handler.assert_called_once_with({})
+
+    def test_throttled(self):
+        # Arrange
+        rate_limit = dict(settings.ADMISSION['rate_limit'], rate=1, burst=1, clients={})
+
+        # Act
+        with override_settings(ADMISSION=dict(settings.ADMISSION, rate_limit=rate_limit)):
+            responses = [run_asgi(self.app, 'POST', '/api/prospect', b'{}') for _ in range(2)]
+            headers = dict(call_asgi(self.app, 'POST', '/api/prospect', b'{}')[0]['headers'])
+
+        # Assert
+        self.assertEqual([status_code for status_code, body in responses], [200, 429])
+        self.assertIn(b'retry-after', headers)
+        self.assertEqual(self.handler.call_count, 1)
@@ -0,0 +1,169 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from api import audit
+from api.audit import AuditStore
+from api.services import build_policy_xml, build_prospect_xml
+
+PROSPECT_REPLY = '<xmlreply><messages><result>OK</result></messages>' \
+                 '<apmdata><prospect><p.cm><refno>ABCD01</refno></p.cm></prospect></apmdata></xmlreply>'
+
+
+def exchange(refno: str, function_type: str = 'create-cliv-policy', at: float = 0) -> dict:
+    request = build_policy_xml({'Ref': refno, 'Ptype': 'YT', 'Risk': {}}).replace(
+        '<char20.1>create-cliv-policy</char20.1>', '<char20.1>{}</char20.1>'.format(function_type))
+    return {'time': at, 'keys': audit.record_keys(request), 'duration': 0.1, 'request': request,
+            'response': '<xmlreply/>', 'error': None}
+
+
+class AuditStoreTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def store(self, **kwargs) -> AuditStore:
+        return AuditStore(self.directory, **kwargs)
+
+    def test_record_keys(self):
+        # Act
+        keys = audit.record_keys(build_prospect_xml({'Name': 'Bob'}), PROSPECT_REPLY)
+
+        # Assert
+        self.assertEqual(keys, ['function_type:create-cliv-prospect', 'refno:ABCD01'])
+
+    def test_find_in_active_and_sealed_segments(self):
+        # Arrange
+        store = self.store()
+        store.append([exchange('ABCD01X', at=1), exchange('WXYZ01X', at=2)])
+        store.seal()
+        store.append([exchange('ABCD01X', 'update-cliv', at=3)])
+
+        # Act
+        found = store.find(refno='ABCD01X')
+        updates = store.find(refno='ABCD01X', function_type='update-cliv')
+
+        # Assert
+        self.assertEqual([record['time'] for record in found], [3, 1])
+        self.assertEqual([record['time'] for record in updates], [3])
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith('.idx')]), 1)
+
+    def test_index_binary_search(self):
+        # Arrange
+        store = self.store(block_records=10)
+        for start in range(0, 200, 10):
+            store.append([exchange('R{:05d}X'.format(n), at=n) for n in range(start, start + 10)])
+        store.seal()
+        index = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.idx')][0]
+
+        # Act
+        offsets = audit.search_index(index, 'refno:R00123X')
+        missing = audit.search_index(index, 'refno:R99999X')
+        found = store.find(refno='R00123X')
+
+        # Assert
+        self.assertEqual(len(offsets), 1)
+        self.assertEqual(missing, [])
+        self.assertEqual([record['time'] for record in found], [123])
+
+    def test_sealed_at_segment_bytes(self):
+        # Arrange
+        store = self.store(segment_bytes=1)
+
+        # Act
+        store.append([exchange('ABCD01X')])
+        time.sleep(0.002)
+        store.append([exchange('ABCD01X')])
+
+        # Assert
+        self.assertEqual(len(store.segments()), 2)
+        self.assertTrue(all(os.path.exists(segment[:-4] + '.idx') for segment in store.segments()))
+
+    @mock.patch('api.audit._is_alive', return_value=False)
+    def test_orphaned_segment_sealed(self, mock_is_alive):
+        # Arrange
+        store = self.store()
+        store.append([exchange('ABCD01X', at=1)])
+        segment = store.segments()[0]
+        store._file.close()
+        with open(segment, 'ab') as f:
+            f.write(b'\x00\x00\x10\x00torn')
+
+        # Act
+        self.store().compact()
+
+        # Assert
+        self.assertTrue(os.path.exists(segment[:-4] + '.idx'))
+        self.assertEqual([record['time'] for record in self.store().find(refno='ABCD01X')], [1])
+
+    def test_expired_segments_deleted(self):
+        # Arrange
+        store = self.store(retention_days=1)
+        store.append([exchange('ABCD01X')])
+        store.seal()
+        old = time.time() - 2 * 24 * 60 * 60
+        for name in os.listdir(self.directory):
+            os.utime(os.path.join(self.directory, name), (old, old))
+
+        # Act
+        store.compact()
+
+        # Assert
+        self.assertEqual(store.segments(), [])
+
+    def test_small_segments_merged(self):
+        # Arrange
+        store = self.store()
+        for n in range(3):
+            store.append([exchange('ABCD01X', at=n), exchange('WXYZ01X', at=n)])
+            store.seal()
+            time.sleep(0.002)
+
+        # Act
+        store.compact()
+
+        # Assert
+        self.assertEqual(len(store.segments()), 1)
+        self.assertEqual([record['time'] for record in store.find(refno='ABCD01X')], [2, 1, 0])
+        self.assertEqual(len(store.find(polref=None, function_type='create-cliv-policy')), 6)
+
+
+class AuditRecordTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = override_settings(XSTREAM_AUDIT=dict(settings.XSTREAM_AUDIT, enabled=True, dir=directory))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        for name, value in (('_store', None), ('_queue', None), ('_queue_pid', None), ('_writer', None)):
+            patcher = mock.patch.object(audit, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(audit.stop_writer)
+
+    def test_written_in_background(self):
+        # Act
+        audit.record(build_prospect_xml({'Name': 'Bob'}), PROSPECT_REPLY, duration=0.25)
+        deadline = time.monotonic() + 2
+        while not audit.get_store().find(refno='ABCD01') and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        audit.stop_writer()
+
+        # Assert
+        record = audit.get_store().find(refno='ABCD01')[0]
+        self.assertEqual((record['duration'], record['response'], record['error']), (0.25, PROSPECT_REPLY, None))
+        self.assertEqual(len(os.listdir(settings.XSTREAM_AUDIT['dir'])), 2)
+
+    @override_settings(XSTREAM_AUDIT=dict(settings.XSTREAM_AUDIT, enabled=False))
+    def test_disabled(self):
+        # Act
+        audit.record(build_prospect_xml({'Name': 'Bob'}), PROSPECT_REPLY)
+
+        # Assert
+        self.assertIsNone(audit._queue)
@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from api.authentication import ApiKeyAuthentication, HasApiKey
+from api import admission
+from api.throttling import TokenBucketThrottle
+
+
+class ThrottledView(APIView):
+    authentication_classes = [ApiKeyAuthentication]
+    permission_classes = [HasApiKey]
+    throttle_classes = [TokenBucketThrottle]
+
+    def get(self, request):
+        return Response({'client': str(request.user)})
+
+
+@override_settings(API_KEYS=['first-key', 'second-key'])
+class ApiKeyTests(TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        patcher = mock.patch.object(admission, '_buckets', admission.MemoryBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **extra):
+        return ThrottledView.as_view()(self.factory.get('/', **extra))
+
+    def test_valid_key(self):
+        # Act
+        response = self.get(HTTP_X_API_KEY='second-key')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['client']), 12)
+
+    def test_invalid_key(self):
+        # Act
+        response = self.get(HTTP_X_API_KEY='wrong-key')
+
+        # Assert
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Api-Key')
+
+    def test_missing_key(self):
+        # Act
+        response = self.get()
+
+        # Assert
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(API_KEYS=[])
+    def test_open_without_keys(self):
+        # Act
+        response = self.get()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+
+    def test_throttled_per_key(self):
+        # Arrange
+        config = dict(settings.ADMISSION, rate_limit=dict(settings.ADMISSION['rate_limit'], rate=0.5, burst=2))
+
+        # Act
+        with override_settings(ADMISSION=config):
+            responses = [self.get(HTTP_X_API_KEY='first-key') for _ in range(3)]
+            other = self.get(HTTP_X_API_KEY='second-key')
+
+        # Assert
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertEqual(responses[2]['Retry-After'], '2')
+        self.assertEqual(other.status_code, 200)
+
+    @override_settings(API_KEYS=[])
+    def test_spoofed_forwarded_for_throttled(self):
+        # Arrange
+        config = dict(settings.ADMISSION, rate_limit=dict(settings.ADMISSION['rate_limit'], rate=0.5, burst=2))
+
+        # Act
+        with override_settings(ADMISSION=config):
+            responses = [self.get(HTTP_X_FORWARDED_FOR='10.0.0.{}'.format(n)) for n in range(3)]
+
+        # Assert
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertEqual(len(admission.get_buckets()._buckets), 1)
+
+
+class ApiSettingsProfileTests(TestCase):
+
+    def test_serves_api(self):
+        # Arrange
+        script = (
+            'import django, json, logging; django.setup(); logging.disable(logging.CRITICAL)\n'
+            'from django.conf import settings\n'
+            'settings.ADMISSION["rate_limit"]["backend"] = "api.admission.MemoryBuckets"\n'
+            'from django.test import Client\n'
+            'client = Client(HTTP_HOST="localhost")\n'
+            'responses = [client.post("/api/prospect", data="{}", content_type="application/json", **extra)\n'
+            '             for extra in ({}, {"HTTP_X_API_KEY": "key"})]\n'
+            'print(json.dumps([[r.status_code, r.get("X-Content-Type-Options"), len(r.cookies)] for r in responses]))\n'
+        )
+
+        # Act
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, stdout=subprocess.PIPE, check=True,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='OpenGiWebService.api_settings', OPENGI_API_KEYS='key')
+        ).stdout
+
+        # Assert
+        self.assertEqual(json.loads(output.decode('utf-8').splitlines()[-1]), [[401, 'nosniff', 0], [400, 'nosniff', 0]])
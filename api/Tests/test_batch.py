@@ -0,0 +1,160 @@
+import json
+from unittest import mock
+from django.test import TestCase, override_settings
+from api.batch import Batch
+from api.services import Result, function_type_of, prospect_parser, policy_parser
+
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {
+    'Ptype': 'YT',
+    'Risk': {'CLT1': {'indem.yn': 'yes'}}
+}
+
+MERGE = [{'operations': ['create-cliv-prospect', 'create-cliv-policy'], 'function_type': 'create-cliv'}]
+
+
+def ok(refno: str = 'BOBT01') -> Result:
+    result = Result(data={'Refno': refno})
+    result.status = True
+    return result
+
+
+def failed() -> Result:
+    result = Result(data=[])
+    result.status = False
+    return result
+
+
+def prospect_and_policy(merge_rules) -> Batch:
+    batch = Batch(merge_rules)
+    prospect = batch.add(prospect_parser(PROSPECT))
+    batch.add(policy_parser(POLICY), refno_from=prospect)
+    return batch
+
+
+@mock.patch('api.batch.SoapService.process_message')
+class BatchTests(TestCase):
+
+    def test_merged_envelope(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = ok()
+        batch = prospect_and_policy(MERGE)
+
+        # Act
+        results = batch.run()
+
+        # Assert
+        self.assertEqual(batch.plan(), [('create-cliv', [0, 1])])
+        xml = mock_process_message.call_args[0][0]
+        self.assertEqual(function_type_of(xml), 'create-cliv')
+        self.assertIn('<Name>Bob Test</Name>', xml)
+        self.assertIn('<p.py><Ptype>YT</Ptype></p.py><CLT1><indem.yn>yes</indem.yn></CLT1>', xml)
+        self.assertEqual(results[0], results[1])
+
+    def test_sent_in_turn_without_merge_rule(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = [ok(), ok()]
+
+        # Act
+        results = prospect_and_policy([]).run()
+
+        # Assert
+        prospect_xml, policy_xml = [call[0][0] for call in mock_process_message.call_args_list]
+        self.assertEqual(function_type_of(prospect_xml), 'create-cliv-prospect')
+        self.assertEqual(function_type_of(policy_xml), 'create-cliv-policy')
+        self.assertIn('<Refno>BOBT01</Refno>', policy_xml)
+        self.assertTrue(all(result.status for result in results))
+
+    def test_dependants_of_failure_not_sent(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = failed()
+
+        # Act
+        results = prospect_and_policy([]).run()
+
+        # Assert
+        mock_process_message.assert_called_once()
+        self.assertIsNone(results[1])
+
+    def test_refno_from_must_be_earlier(self, mock_process_message):
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            Batch([]).add(policy_parser(POLICY), refno_from=0)
+
+
+@mock.patch('api.batch.SoapService.process_message')
+class ProspectAndRiskTests(TestCase):
+
+    def post(self, data):
+        return self.client.post('/api/prospect-and-risk', data=json.dumps(data), content_type='application/json')
+
+    @override_settings(XSTREAM_BATCH={'merge': MERGE})
+    def test_created(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = ok()
+
+        # Act
+        response = self.post({'Prospect': PROSPECT, 'Policy': POLICY})
+
+        # Assert
+        mock_process_message.assert_called_once()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'Prospect': {'Refno': 'BOBT01'}, 'Policy': dict(POLICY, Ref='BOBT01')})
+
+    def test_policy_failed(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = [ok(), failed()]
+
+        # Act
+        response = self.post({'Prospect': PROSPECT, 'Policy': POLICY})
+
+        # Assert
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['Refno'], 'BOBT01')
+
+    def test_policy_unsent_keeps_refno(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = [ok(), IOError('Failed to post to xstream, error: Timed out')]
+
+        # Act
+        response = self.post({'Prospect': PROSPECT, 'Policy': POLICY})
+
+        # Assert
+        self.assertEqual((response.status_code, response.json()), (500, {'message': 'Error', 'Refno': 'BOBT01'}))
+
+    def test_prospect_unsent(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = IOError('Failed to post to xstream, error: Timed out')
+
+        # Act
+        response = self.post({'Prospect': PROSPECT, 'Policy': POLICY})
+
+        # Assert
+        self.assertEqual((response.status_code, response.json()), (500, {'message': 'Error'}))
+
+    def test_prospect_failed(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = failed()
+
+        # Act
+        response = self.post({'Prospect': PROSPECT, 'Policy': POLICY})
+
+        # Assert
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn('Refno', response.json())
+
+    def test_malformed_request(self, mock_process_message):
+        # Act
+        response = self.post({'Prospect': PROSPECT, 'Policy': dict(POLICY, Ref='BOBT01X')})
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
+        mock_process_message.assert_not_called()
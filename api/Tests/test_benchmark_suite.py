@@ -0,0 +1,44 @@
+from django.test import TestCase
+from benchmarks import suite
+
+
+class CompareTests(TestCase):
+
+    def test_per_stage_changes(self):
+        # Arrange
+        baseline = {
+            'validate_json.prospect': {'seconds': 10e-6},
+            'xstream_parser.prospect': {'seconds': 20e-6},
+            'view.prospect_post': {'seconds': 2e-3},
+            'handle_response.error': {'seconds': 30e-6},
+        }
+        current = {
+            'validate_json.prospect': {'seconds': 10.5e-6},
+            'xstream_parser.prospect': {'seconds': 30e-6},
+            'view.prospect_post': {'seconds': 1e-3},
+            'view.policy_post': {'seconds': 2e-3},
+        }
+
+        # Act
+        changes = {change.stage: change for change in suite.compare(baseline, current, threshold=0.1)}
+
+        # Assert
+        self.assertEqual({name: change.status for name, change in changes.items()}, {
+            'validate_json.prospect': 'ok',
+            'xstream_parser.prospect': 'slower',
+            'view.prospect_post': 'faster',
+            'view.policy_post': 'new',
+            'handle_response.error': 'missing',
+        })
+        self.assertAlmostEqual(changes['xstream_parser.prospect'].ratio, 1.5)
+        self.assertRegex(suite.format_changes(list(changes.values())),
+                         r'xstream_parser.prospect +20.0 +30.0 +\+50.0%  SLOWER')
+
+    def test_stages_run(self):
+        # Act
+        results = suite.run([suite.Stage('noop', lambda: None, 10)], repeat=2)
+
+        # Assert
+        self.assertEqual(list(results), ['noop'])
+        self.assertEqual((results['noop']['number'], results['noop']['repeat']), (10, 2))
+        self.assertGreaterEqual(results['noop']['seconds'], 0)
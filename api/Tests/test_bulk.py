@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+from api import bulk
+from api.admission import MemoryBuckets
+from api.services import Result
+
+
+def created(prospect_json: dict) -> Result:
+    result = Result(data={'Refno': prospect_json['Name'].upper()})
+    result.status = True
+    return result
+
+
+class ImportProspectsTests(TestCase):
+
+    def setUp(self):
+        self.valid = {'Name': 'bob', 'Addr1': '3 Test Rd', 'Pcode': 'TT1 TT2', 'Tel': '1234567890', 'Email': 'j@j.com'}
+
+    @mock.patch('api.bulk.create_prospect')
+    def test_results_in_input_order(self, mock_create: mock.MagicMock):
+        # Arrange
+        def slow_created(prospect_json):
+            time.sleep(0.02 if prospect_json['Name'] == 'a' else 0)
+            return created(prospect_json)
+        mock_create.side_effect = slow_created
+        rows = [dict(self.valid, Name=name) for name in 'abcdef']
+
+        # Act
+        results = list(bulk.import_prospects(rows, workers=3))
+
+        # Assert
+        self.assertEqual([r['Refno'] for r in results], list('ABCDEF'))
+        self.assertEqual([r['row'] for r in results], [1, 2, 3, 4, 5, 6])
+
+    @mock.patch('api.bulk.create_prospect')
+    def test_invalid_rows_not_sent(self, mock_create: mock.MagicMock):
+        # Arrange
+        mock_create.side_effect = created
+        rows = [self.valid, {'Name': 'missing fields'}, ValueError('JSON parse error')]
+
+        # Act
+        results = list(bulk.import_prospects(rows, workers=2))
+
+        # Assert
+        mock_create.assert_called_once_with(self.valid)
+        self.assertEqual([r['status'] for r in results], ['created', 'invalid', 'invalid'])
+        self.assertEqual(len(results[1]['errors']), 4)
+
+    @mock.patch('api.bulk.create_prospect')
+    def test_upstream_errors_reported_per_row(self, mock_create: mock.MagicMock):
+        # Arrange
+        mock_create.side_effect = IOError('Failed to post to xstream, error: Timed out')
+
+        # Act
+        results = list(bulk.import_prospects([self.valid], workers=1))
+
+        # Assert
+        self.assertEqual(results, [
+            {'row': 1, 'status': 'error', 'message': 'Failed to post to xstream, error: Timed out'}
+        ])
+
+    @mock.patch('api.admission._buckets', MemoryBuckets())
+    @mock.patch('api.bulk.create_prospect')
+    def test_rate_limit_shared_by_concurrent_imports(self, mock_create: mock.MagicMock):
+        # Arrange
+        mock_create.side_effect = created
+        rows = [dict(self.valid, Name=name) for name in 'abc']
+        start = time.monotonic()
+
+        # Act
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for _ in executor.map(lambda r: list(bulk.import_prospects(r, workers=1, rate_limit=50)), [rows, rows]):
+                pass
+
+        # Assert
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_read_csv_drops_empty_cells(self):
+        # Arrange
+        rows = csv.DictReader(io.StringIO('Name,Addr1,Addr2\nBob,3 Test Rd,\n'))
+
+        # Act
+        result = list(bulk.read_csv(rows))
+
+        # Assert
+        self.assertEqual(result, [{'Name': 'Bob', 'Addr1': '3 Test Rd'}])
+
+
+class ProspectBulkViewTests(TestCase):
+
+    @mock.patch('api.bulk.create_prospect')
+    def test_ndjson_streamed(self, mock_create: mock.MagicMock):
+        # Arrange
+        mock_create.side_effect = created
+        body = '{"Name": "bob", "Addr1": "3 Test Rd", "Pcode": "TT1", "Tel": "1", "Email": "j@j.com"}\n{bad\n'
+
+        # Act
+        response = self.client.post('/api/prospect/bulk', data=body, content_type='application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(lines[0]), {'row': 1, 'status': 'created', 'Refno': 'BOB'})
+        self.assertEqual(json.loads(lines[1])['status'], 'invalid')
+
+    def test_json_body_must_be_array(self):
+        # Act
+        response = self.client.post('/api/prospect/bulk', data='{}', content_type='application/json')
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportProspectsCommandTests(TestCase):
+
+    @mock.patch('api.bulk.create_prospect')
+    def test_csv_imported(self, mock_create: mock.MagicMock):
+        # Arrange
+        mock_create.side_effect = created
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        path = os.path.join(directory, 'prospects.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.write('Name,Addr1,Pcode,Tel,Email\nbob,3 Test Rd,TT1 TT2,1234567890,j@j.com\nann,,,,\n')
+        self.addCleanup(os.remove, path)
+        out = io.StringIO()
+
+        # Act
+        call_command('import_prospects', path, '--workers', '1', '--rate-limit', '0', stdout=out)
+
+        # Assert
+        lines = out.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0]), {'row': 1, 'status': 'created', 'Refno': 'BOB'})
+        self.assertEqual(json.loads(lines[1])['status'], 'invalid')
@@ -0,0 +1,251 @@
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from api import circuit_breaker, services, wsdl_cache
+from api.circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget, RetryPolicy
+from api.metrics import counters, gauges
+from api.services import SoapService, XStreamParser
+from api.simulator import XStreamSimulator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def read_xml(function_type: str) -> str:
+    parser = XStreamParser()
+    parser.add_ref('ABCD01')
+    parser.add_function_type(function_type)
+    return parser.parse_to_xml()
+
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+        gauges.reset()
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('read-cliv', failure_threshold=2, reset_timeout=10, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        # Act
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        still_closed = self.breaker.state
+        self.breaker.record_failure()
+
+        # Assert
+        self.assertEqual(still_closed, circuit_breaker.CLOSED)
+        self.assertEqual(self.breaker.state, circuit_breaker.OPEN)
+        self.assertEqual(gauges.get('xstream_circuit_state:read-cliv'), 2)
+        self.assertEqual(counters.get('xstream_circuit_opened:read-cliv'), 1)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 10)
+        self.assertEqual(counters.get('xstream_circuit_rejected:read-cliv'), 1)
+
+    def test_half_open_probe(self):
+        # Arrange
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+
+        # Act
+        self.breaker.before_call()
+
+        # Assert
+        self.assertEqual(self.breaker.state, circuit_breaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, circuit_breaker.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        # Arrange
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+        self.breaker.before_call()
+
+        # Act
+        self.breaker.record_failure()
+
+        # Assert
+        self.assertEqual(self.breaker.state, circuit_breaker.OPEN)
+        self.clock.now = 19
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+
+class RetryPolicyTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+
+    def test_state_changing_function_types_not_retried(self):
+        # Arrange
+        policy = RetryPolicy(RetryBudget(min_tokens=10), max_retries=2)
+
+        # Act / Assert
+        self.assertFalse(policy.should_retry('create-cliv-prospect', 0))
+        self.assertFalse(policy.should_retry('convert-cliv-policy', 0))
+        self.assertTrue(policy.should_retry('read-cliv', 1))
+        self.assertFalse(policy.should_retry('read-cliv', 2))
+
+    def test_retries_limited_by_budget(self):
+        # Arrange
+        policy = RetryPolicy(RetryBudget(ratio=0.5, min_tokens=1), max_retries=5)
+
+        # Act
+        first = policy.should_retry('read-cliv', 0)
+        second = policy.should_retry('read-cliv', 0)
+        policy.budget.record_request()
+        policy.budget.record_request()
+        third = policy.should_retry('read-cliv', 0)
+
+        # Assert
+        self.assertEqual((first, second, third), (True, False, True))
+        self.assertEqual(counters.get('xstream_retry_budget_exhausted'), 1)
+
+    def test_delay_jittered_and_capped(self):
+        # Arrange
+        policy = RetryPolicy(RetryBudget(), backoff_base=0.1, backoff_cap=0.3)
+
+        # Act
+        delays = [policy.delay(attempt) for attempt in range(6) for _ in range(20)]
+
+        # Assert
+        self.assertTrue(all(0 <= delay <= 0.3 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+
+@override_settings(XSTREAM_CIRCUIT_BREAKER=dict(settings.XSTREAM_CIRCUIT_BREAKER, failure_threshold=1))
+class LocalFailureTests(TestCase):
+
+    def setUp(self):
+        circuit_breaker.reset()
+        self.addCleanup(circuit_breaker.reset)
+
+    @mock.patch('api.services.SoapService._post_to_xstream')
+    @mock.patch('api.services.SoapService._get_client_pool')
+    def test_pool_exhaustion_not_counted(self, mock_get_client_pool, mock_post_to_xstream):
+        # Arrange
+        mock_get_client_pool.return_value.client.side_effect = IOError('Timed out waiting for a soap client after 10s')
+
+        # Act
+        with self.assertRaises(IOError):
+            SoapService.process_message(read_xml('read-cliv'))
+
+        # Assert
+        mock_post_to_xstream.assert_not_called()
+        self.assertEqual(circuit_breaker.states(), {'read-cliv': circuit_breaker.CLOSED})
+
+
+@override_settings(OUTBOX=dict(settings.OUTBOX, enabled=False))
+class CircuitOpenViewTests(TestCase):
+
+    @mock.patch('api.views.create_prospect')
+    def test_open_circuit_returns_503(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.side_effect = CircuitOpenError('create-cliv-prospect', 4.2)
+        prospect = {'Name': 'Bob Test', 'Addr1': '1 Street', 'Pcode': 'AB1 2CD', 'Tel': '0123',
+                    'Email': 'bob@test.com'}
+
+        # Act
+        response = self.client.post('/api/prospect', data=json.dumps(prospect), content_type='application/json')
+
+        # Assert
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class ChaosTests(TestCase):
+    """
+    Drives the breaker end to end through zeep against the XStream simulator injecting faults
+    """
+    def setUp(self):
+        self.simulator = XStreamSimulator()
+        address = self.simulator.start()
+        cache_dir = tempfile.mkdtemp()
+        overrides = override_settings(
+            WSDL_CACHE=dict(settings.WSDL_CACHE, dir=cache_dir),
+            XSTREAM_ADDRESS=address,
+            XSTREAM_CREDENTIALS=('chaos', 'chaos'),
+            XSTREAM_CIRCUIT_BREAKER=dict(settings.XSTREAM_CIRCUIT_BREAKER, failure_threshold=3, reset_timeout=0.2,
+                                         max_retries=2, backoff_base=0.01, backoff_cap=0.01),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        def fetch(url):
+            with open(os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'UAT.xsd'), 'rb') as f:
+                return f.read()
+
+        wsdl_cache.build_cache(fetch=fetch)
+        services._client_pool = None
+        circuit_breaker.reset()
+        counters.reset()
+
+    def tearDown(self):
+        self.simulator.stop()
+        services._client_pool = None
+        circuit_breaker.reset()
+
+    def test_breaker_fails_fast_and_recovers(self):
+        # Arrange
+        self.simulator.fault = 'error'
+
+        # Act
+        with self.assertRaises(IOError) as failed:
+            SoapService.process_message(read_xml('read-cliv'))
+        calls_while_failing = self.simulator.requests
+        with self.assertRaises(CircuitOpenError):
+            SoapService.process_message(read_xml('read-cliv'))
+        calls_while_open = self.simulator.requests - calls_while_failing
+
+        self.simulator.fault = None
+        time.sleep(0.25)
+        recovered = SoapService.process_message(read_xml('read-cliv'))
+
+        # Assert
+        self.assertNotIsInstance(failed.exception, CircuitOpenError)
+        self.assertEqual(calls_while_failing, 3)
+        self.assertEqual(calls_while_open, 0)
+        self.assertEqual(counters.get('xstream_retries:read-cliv'), 2)
+        self.assertTrue(recovered.status)
+        self.assertEqual(circuit_breaker.states(), {'read-cliv': circuit_breaker.CLOSED})
+
+    def test_state_changing_calls_not_retried(self):
+        # Arrange
+        self.simulator.fault = 'drop'
+
+        # Act
+        with self.assertRaises(IOError):
+            SoapService.process_message(read_xml('create-cliv-prospect'))
+
+        # Assert
+        self.assertEqual(self.simulator.requests, 1)
+        self.assertEqual(circuit_breaker.states(), {'create-cliv-prospect': circuit_breaker.CLOSED})
+
+    def test_breakers_isolated_per_function_type(self):
+        # Arrange
+        self.simulator.fault = 'error'
+        with self.assertRaises(IOError):
+            SoapService.process_message(read_xml('read-cliv'))
+        self.simulator.fault = None
+
+        # Act
+        result = SoapService.process_message(read_xml('read-cliv-claims'))
+
+        # Assert
+        self.assertTrue(result.status)
+        self.assertEqual(circuit_breaker.states()['read-cliv'], circuit_breaker.OPEN)
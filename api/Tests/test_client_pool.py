@@ -0,0 +1,96 @@
+import threading
+from unittest import mock
+from django.test import TestCase
+from api.client_pool import ClientPool
+from api.metrics import counters
+
+
+class ClientPoolTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+        self.factory = mock.Mock(side_effect=lambda: object())
+
+    def test_clients_built_lazily_and_reused(self):
+        # Arrange
+        pool = ClientPool(self.factory, size=2)
+
+        # Act
+        with pool.client() as first:
+            pass
+        with pool.client() as second:
+            pass
+
+        # Assert
+        self.assertIs(first, second)
+        self.assertEqual(self.factory.call_count, 1)
+        self.assertEqual(counters.get('soap_client_pool_hits'), 1)
+        self.assertEqual(counters.get('soap_client_pool_builds'), 1)
+
+    def test_recycled_after_max_uses(self):
+        # Arrange
+        pool = ClientPool(self.factory, size=1, max_uses=2)
+
+        # Act
+        clients = []
+        for _ in range(3):
+            with pool.client() as client:
+                clients.append(client)
+
+        # Assert
+        self.assertIs(clients[0], clients[1])
+        self.assertIsNot(clients[1], clients[2])
+        self.assertEqual(counters.get('soap_client_pool_recycled'), 1)
+
+    def test_recycled_on_transport_error(self):
+        # Arrange
+        pool = ClientPool(self.factory, size=1)
+
+        # Act
+        with self.assertRaises(IOError):
+            with pool.client() as first:
+                raise IOError('Timed out')
+        with pool.client() as second:
+            pass
+
+        # Assert
+        self.assertIsNot(first, second)
+        self.assertEqual(self.factory.call_count, 2)
+
+    def test_unhealthy_client_rebuilt(self):
+        # Arrange
+        pool = ClientPool(self.factory, size=1, health_check=lambda client: False)
+
+        # Act
+        with pool.client() as first:
+            pass
+        with pool.client() as second:
+            pass
+
+        # Assert
+        self.assertIsNot(first, second)
+        self.assertEqual(counters.get('soap_client_pool_recycled'), 1)
+
+    def test_waits_for_release_when_exhausted(self):
+        # Arrange
+        pool = ClientPool(self.factory, size=1, acquire_timeout=5)
+        borrowed = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, args=(borrowed,))
+
+        # Act
+        timer.start()
+        with pool.client() as client:
+            pass
+
+        # Assert
+        self.assertIs(client, borrowed.client)
+        self.assertEqual(counters.get('soap_client_pool_waits'), 1)
+
+    def test_acquire_times_out(self):
+        # Arrange
+        pool = ClientPool(self.factory, size=1, acquire_timeout=0.01)
+        pool.acquire()
+
+        # Act / Assert
+        with self.assertRaises(IOError):
+            pool.acquire()
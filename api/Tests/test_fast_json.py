@@ -0,0 +1,75 @@
+import io
+import uuid
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from api import fast_json
+from api.reply_parser import ReplyError
+
+
+DOCUMENTS = [
+    {'Name': 'Bob Test', 'Addr1': '3 Test Rd', 'Pcode': 'TT1 TT2', 'Tel': '1234567890', 'Email': 'j@j.com'},
+    {'Ref': 'ABCD01X', 'Ptype': 'YT', 'Risk': {'CLT1': {'indem.yn': 'yes'}}},
+    {'errors': [ReplyError('Mandatory field Pcode is missing', {'code': 'E101'})]},
+    {'created': timezone.now(), 'id': uuid.uuid4(), 'premium': Decimal('12.50'), 'text': 'Café   line'},
+    [None, True, 1.5, -3],
+]
+
+MALFORMED = [b'{', b'[1,', b'', b'{"a": NaN}', b'\xff', b'{"a": 1} x']
+
+
+def parse(parser, body: bytes):
+    try:
+        return parser.parse(io.BytesIO(body), parser_context={'encoding': 'utf-8'})
+    except ParseError as e:
+        return str(e.detail)
+
+
+class FastJSONTests(TestCase):
+
+    def test_renders_as_drf(self):
+        for document in DOCUMENTS:
+            # Act / Assert
+            self.assertEqual(fast_json.FastJSONRenderer().render(document), JSONRenderer().render(document))
+
+    def test_indent_rendered_by_drf(self):
+        # Act
+        rendered = fast_json.FastJSONRenderer().render(DOCUMENTS[1], 'application/json; indent=2')
+
+        # Assert
+        self.assertEqual(rendered, JSONRenderer().render(DOCUMENTS[1], 'application/json; indent=2'))
+
+    def test_parses_as_drf(self):
+        # Arrange
+        body = JSONRenderer().render(DOCUMENTS[1])
+
+        # Act / Assert
+        self.assertEqual(parse(fast_json.FastJSONParser(), body), DOCUMENTS[1])
+
+    def test_malformed_errors_as_drf(self):
+        for body in MALFORMED:
+            # Act / Assert
+            self.assertEqual(parse(fast_json.FastJSONParser(), body), parse(JSONParser(), body))
+
+    def test_without_orjson(self):
+        # Arrange
+        with mock.patch('api.fast_json.orjson', None):
+            # Act
+            rendered = [fast_json.FastJSONRenderer().render(document) for document in DOCUMENTS]
+            errors = [parse(fast_json.FastJSONParser(), body) for body in MALFORMED]
+
+        # Assert
+        self.assertEqual(rendered, [JSONRenderer().render(document) for document in DOCUMENTS])
+        self.assertEqual(errors, [parse(JSONParser(), body) for body in MALFORMED])
+
+    def test_malformed_request(self):
+        # Act
+        response = self.client.post('/api/prospect', data='{"Name": ', content_type='application/json')
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'JSON parse error - Expecting value: line 1 column 10 (char 9)'})
@@ -0,0 +1,163 @@
+import json
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api import idempotency
+from api.circuit_breaker import CircuitOpenError
+from api.models import IdempotencyRecord, Job
+from api.services import Result
+
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+
+def created(refno: str = 'ABCD01') -> Result:
+    result = Result(data={'Refno': refno})
+    result.status = True
+    return result
+
+
+@mock.patch('api.views.create_prospect')
+class IdempotencyKeyTests(TestCase):
+
+    def post(self, data=None, key='key-1'):
+        return self.client.post('/api/prospect', data=json.dumps(data or PROSPECT), content_type='application/json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replayed(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.return_value = created()
+
+        # Act
+        first = self.post()
+        second = self.post(dict(reversed(list(PROSPECT.items()))))
+
+        # Assert
+        mock_create_prospect.assert_called_once()
+        self.assertEqual((second.status_code, second.json()), (200, {'Refno': 'ABCD01'}))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+    def test_keys_are_independent(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.side_effect = [created('ABCD01'), created('ABCD02')]
+
+        # Act
+        first = self.post(key='key-1')
+        second = self.post(key='key-2')
+
+        # Assert
+        self.assertEqual((first.json(), second.json()), ({'Refno': 'ABCD01'}, {'Refno': 'ABCD02'}))
+
+    def test_keys_scoped_to_client(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.side_effect = [created('ABCD01'), created('WXYZ01')]
+
+        # Act
+        first = self.post()
+        other_client = self.client.post('/api/prospect', data=json.dumps(dict(PROSPECT, Name='Alice Test')),
+                                        content_type='application/json', HTTP_IDEMPOTENCY_KEY='key-1',
+                                        REMOTE_ADDR='10.0.0.2')
+
+        # Assert
+        self.assertEqual((first.json(), other_client.json()), ({'Refno': 'ABCD01'}, {'Refno': 'WXYZ01'}))
+        self.assertFalse(other_client.has_header('Idempotent-Replayed'))
+
+    def test_key_reused_for_different_request(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.return_value = created()
+        self.post()
+
+        # Act
+        response = self.post(dict(PROSPECT, Name='Alice Test'))
+
+        # Assert
+        self.assertEqual(response.status_code, 422)
+        mock_create_prospect.assert_called_once()
+
+    def test_in_progress_request(self, mock_create_prospect):
+        # Arrange
+        now = timezone.now()
+        IdempotencyRecord.objects.create(
+            key=idempotency.record_key('127.0.0.1', '/api/prospect', 'key-1'), fingerprint=idempotency.fingerprint(PROSPECT),
+            created=now, expires=now + timedelta(hours=1)
+        )
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 409)
+        mock_create_prospect.assert_not_called()
+
+    @override_settings(OUTBOX=dict(settings.OUTBOX, enabled=False))
+    def test_unavailable_not_stored(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.side_effect = [CircuitOpenError('create-cliv-prospect', 1), created()]
+
+        # Act
+        first = self.post()
+        second = self.post()
+
+        # Assert
+        self.assertEqual((first.status_code, second.status_code), (503, 200))
+        self.assertEqual(mock_create_prospect.call_count, 2)
+
+    def test_expired_record_not_replayed(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.return_value = created()
+        self.post()
+        IdempotencyRecord.objects.update(expires=timezone.now() - timedelta(seconds=1))
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(mock_create_prospect.call_count, 2)
+
+
+@override_settings(JOB_QUEUE=dict(settings.JOB_QUEUE, in_process=False))
+class AsyncReplayTests(TestCase):
+
+    def test_accepted_job_replayed(self):
+        # Arrange
+        policy = {'Ref': 'ABCD01X', 'Ptype': 'YT', 'Risk': {'CLT1': {'indem.yn': 'yes'}}}
+
+        def post():
+            return self.client.post('/api/risk', data=json.dumps(policy), content_type='application/json',
+                                    HTTP_PREFER='respond-async', HTTP_IDEMPOTENCY_KEY='key-1')
+
+        # Act
+        first = post()
+        second = post()
+
+        # Assert
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual((second.status_code, second.json()), (202, first.json()))
+        self.assertEqual(second['Location'], first['Location'])
+
+
+class CompactionTests(TestCase):
+
+    def test_expired_records_deleted(self):
+        # Arrange
+        now = timezone.now()
+        for key, expires in (('live', now + timedelta(hours=1)), ('expired', now - timedelta(seconds=1))):
+            IdempotencyRecord.objects.create(key=key, fingerprint='', status_code=200, response='{"data":{}}',
+                                             created=now, expires=expires)
+
+        # Act
+        deleted = idempotency.compact()
+
+        # Assert
+        self.assertEqual(deleted, 1)
+        self.assertEqual(list(IdempotencyRecord.objects.values_list('key', flat=True)), ['live'])
@@ -0,0 +1,115 @@
+import json
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api import jobs
+from api.models import Job
+from api.reply_parser import ReplyError
+from api.services import Result
+
+
+@override_settings(JOB_QUEUE=dict(settings.JOB_QUEUE, in_process=False))
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.policy = {'Ref': 'ABCD01X', 'Ptype': 'YT', 'Risk': {'CLT1': {'indem.yn': 'yes'}}}
+        self.mock_add_policy = mock.Mock()
+        patcher = mock.patch.dict(jobs.HANDLERS, {'add_policy': self.mock_add_policy})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_async_submission_returns_202(self):
+        # Act
+        response = self.client.post('/api/risk', data=json.dumps(self.policy), content_type='application/json',
+                                    HTTP_PREFER='respond-async')
+
+        # Assert
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(id=response.json()['job'])
+        self.assertEqual(response['Location'], '/api/jobs/{}'.format(job.id))
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.queue, '2')
+        self.mock_add_policy.assert_not_called()
+
+    def test_job_run_and_polled(self):
+        # Arrange
+        result = Result(data={'Refno': 'ABCD01'})
+        result.status = True
+        self.mock_add_policy.return_value = result
+        job = jobs.enqueue('add_policy', self.policy, queue='2')
+
+        # Act
+        ran = jobs.run_once()
+        response = self.client.get('/api/jobs/{}'.format(job.id))
+
+        # Assert
+        self.assertTrue(ran)
+        self.mock_add_policy.assert_called_once_with(self.policy, '2')
+        self.assertEqual(response.json(), {
+            'id': str(job.id),
+            'status': Job.SUCCEEDED,
+            'result': {'status': True, 'data': {'Refno': 'ABCD01'}},
+            'error': None
+        })
+
+    def test_error_reply_fails_job(self):
+        # Arrange
+        result = Result(data=[ReplyError('Invalid Ptype', {})])
+        result.status = False
+        self.mock_add_policy.return_value = result
+        job = jobs.enqueue('add_policy', self.policy)
+
+        # Act
+        jobs.run_once()
+        job.refresh_from_db()
+
+        # Assert
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(json.loads(job.result)['data'], [{'message': 'Invalid Ptype', 'attributes': {}}])
+
+    def test_transport_error_recorded(self):
+        # Arrange
+        self.mock_add_policy.side_effect = IOError('Failed to post to xstream, error: Timed out')
+        job = jobs.enqueue('add_policy', self.policy)
+
+        # Act
+        jobs.run_once()
+        job.refresh_from_db()
+
+        # Assert
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, 'Failed to post to xstream, error: Timed out')
+
+    def test_job_claimed_once(self):
+        # Arrange
+        jobs.enqueue('add_policy', self.policy)
+
+        # Act
+        first = jobs.claim_next()
+        second = jobs.claim_next()
+
+        # Assert
+        self.assertEqual(first.status, Job.RUNNING)
+        self.assertIsNone(second)
+
+    def test_stale_running_job_reclaimed(self):
+        # Arrange
+        job = jobs.enqueue('add_policy', self.policy)
+        jobs.claim_next()
+        Job.objects.filter(id=job.id).update(updated=timezone.now() - timedelta(hours=1))
+
+        # Act
+        reclaimed = jobs.claim_next()
+
+        # Assert
+        self.assertEqual(reclaimed.id, job.id)
+        self.assertGreater(reclaimed.updated, timezone.now() - timedelta(minutes=1))
+
+    def test_unknown_job(self):
+        # Act
+        response = self.client.get('/api/jobs/00000000-0000-0000-0000-000000000000')
+
+        # Assert
+        self.assertEqual(response.status_code, 404)
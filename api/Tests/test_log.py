@@ -0,0 +1,93 @@
+import logging
+import queue
+import threading
+from django.test import TestCase, override_settings
+from api import log
+from api.metrics import counters
+from api.services import build_prospect_xml
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def emit(self, record):
+        self.threads.append(threading.current_thread())
+
+
+class PayloadTests(TestCase):
+
+    def test_personal_details_redacted(self):
+        # Arrange
+        xml = build_prospect_xml({'Name': 'Bob Test', 'Addr1': '3 Test Rd', 'Pcode': 'TT1 TT2', 'Tel': '1234567890',
+                                  'Email': 'j@j.com'})
+
+        # Act
+        result = str(log.Payload(xml))
+
+        # Assert
+        self.assertIn('<Name>***</Name><Addr1>***</Addr1><Pcode>***</Pcode><Tel>***</Tel><Email>***</Email>', result)
+        self.assertIn('<char20.1>create-cliv-prospect</char20.1>', result)
+        self.assertNotIn('Bob', result)
+
+    @override_settings(XSTREAM_PAYLOAD_LOG={'max_length': 10, 'redact': ['Name']})
+    def test_truncated(self):
+        # Act
+        result = str(log.Payload('<xmlreply><refno>ABCD01</refno></xmlreply>'))
+
+        # Assert
+        self.assertEqual(result, '<xmlreply>... [32 more characters]')
+
+    def test_not_rendered_when_disabled(self):
+        # Arrange
+        rendered = []
+
+        class Xml:
+            def __str__(self):
+                rendered.append(True)
+                return '<xml/>'
+
+        disabled = logging.getLogger('api.Tests.disabled')
+        disabled.setLevel(logging.INFO)
+
+        # Act
+        disabled.debug('xml: %s', log.Payload(Xml()))
+
+        # Assert
+        self.assertEqual(rendered, [])
+
+
+class QueueListenerTests(TestCase):
+
+    def test_handlers_run_off_the_calling_thread(self):
+        # Arrange
+        handler = RecordingHandler()
+        target = logging.getLogger('api.Tests.queued')
+        target.handlers = [handler]
+        target.propagate = False
+
+        # Act
+        listeners = log.start_queue_listeners(['api.Tests.queued'])
+        target.error('failed')
+        listeners[0].stop()
+
+        # Assert
+        self.assertEqual(len(handler.threads), 1)
+        self.assertIsNot(handler.threads[0], threading.current_thread())
+        self.assertIsInstance(target.handlers[0], logging.handlers.QueueHandler)
+
+    def test_full_queue_drops_records(self):
+        # Arrange
+        counters.reset()
+        handler = log._DroppingQueueHandler(queue.Queue(1))
+        record = logging.makeLogRecord({'msg': 'failed'})
+
+        # Act
+        handler.handle(record)
+        handler.handle(record)
+
+        # Assert
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(counters.get('log_records_dropped'), 1)
@@ -0,0 +1,125 @@
+import json
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from api import metrics
+from api.metrics import counters, gauges, histograms, Histograms
+
+
+OK_REPLY = '<xmlreply><messages><result>OK</result></messages>' \
+           '<apmdata><prospect><p.cm><refno>ABCD01</refno></p.cm></prospect></apmdata></xmlreply>'
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+
+class HistogramTests(TestCase):
+
+    def test_observations_bucketed(self):
+        # Arrange
+        histogram = Histograms(buckets=(0.1, 1))
+
+        # Act
+        histogram.observe('t', (), 0.05)
+        histogram.observe('t', (), 0.1)
+        histogram.observe('t', (), 0.5)
+        histogram.observe('t', (), 5)
+
+        # Assert
+        self.assertEqual(histogram.get('t', ()), {'counts': [2, 1, 1], 'sum': 5.65, 'count': 4})
+        self.assertIsNone(histogram.get('t', (('stage', 'other'),)))
+
+
+class RenderTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+        gauges.reset()
+        histograms.reset()
+
+    def test_counters_and_gauges(self):
+        # Arrange
+        counters.increment('xstream_requests', 3)
+        counters.increment('xstream_response_cache_hits')
+        counters.increment('xstream_response_cache_hits:update-cliv')
+        gauges.set('xstream_circuit_state:read-cliv', 2)
+
+        # Act
+        text = metrics.render_prometheus()
+
+        # Assert
+        self.assertIn('# TYPE xstream_requests_total counter\nxstream_requests_total 3\n', text)
+        self.assertIn('xstream_response_cache_hits_total{function_type="update-cliv"} 1\n', text)
+        self.assertNotIn('xstream_response_cache_hits_total 1', text)
+        self.assertIn('# TYPE xstream_circuit_state gauge\nxstream_circuit_state{function_type="read-cliv"} 2\n', text)
+
+    def test_histograms_cumulative(self):
+        # Arrange
+        labels = (('stage', 'validate_json'), ('endpoint', '/api/prospect'), ('function_type', ''))
+        histograms.observe('api_stage_duration_seconds', labels, 0.0001)
+        histograms.observe('api_stage_duration_seconds', labels, 0.002)
+
+        # Act
+        text = metrics.render_prometheus()
+
+        # Assert
+        prefix = 'api_stage_duration_seconds_bucket{stage="validate_json",endpoint="/api/prospect",function_type="",'
+        self.assertIn(prefix + 'le="0.0005"} 1\n', text)
+        self.assertIn(prefix + 'le="0.001"} 1\n', text)
+        self.assertIn(prefix + 'le="0.0025"} 2\n', text)
+        self.assertIn(prefix + 'le="+Inf"} 2\n', text)
+        self.assertIn('api_stage_duration_seconds_count{stage="validate_json",endpoint="/api/prospect",'
+                      'function_type=""} 2\n', text)
+
+
+class StageTimingTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+        histograms.reset()
+
+    @mock.patch('api.services.SoapService._post_with_retry')
+    def test_prospect_stages_labelled(self, mock_post):
+        # Arrange
+        mock_post.return_value = OK_REPLY
+
+        # Act
+        self.client.post('/api/prospect', data=json.dumps(PROSPECT), content_type='application/json')
+        response = self.client.get('/metrics')
+
+        # Assert
+        for stage, function_type in (('validate_json', ''), ('build_xml', 'create-cliv-prospect'),
+                                     ('handle_response', 'create-cliv-prospect')):
+            self.assertEqual(histograms.get('api_stage_duration_seconds', (
+                ('stage', stage), ('endpoint', '/api/prospect'), ('function_type', function_type)
+            ))['count'], 1, stage)
+        self.assertEqual(histograms.get('api_request_duration_seconds', (
+            ('endpoint', '/api/prospect'), ('status', '200')
+        ))['count'], 1)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'api_stage_duration_seconds_sum{stage="handle_response",endpoint="/api/prospect",'
+                      b'function_type="create-cliv-prospect"}', response.content)
+
+    def test_endpoint_reset_after_request(self):
+        # Act
+        self.client.get('/metrics')
+
+        # Assert
+        self.assertEqual(metrics.endpoint.get(), '')
+
+    @override_settings(API_KEYS=['key'])
+    def test_scraped_without_key_or_rate_limit(self):
+        # Arrange
+        config = dict(settings.ADMISSION, rate_limit=dict(settings.ADMISSION['rate_limit'], rate=0.1, burst=1))
+
+        # Act
+        with override_settings(ADMISSION=config):
+            responses = [self.client.get('/metrics'), self.client.get('/metrics', HTTP_X_API_KEY='wrong-key')]
+
+        # Assert
+        self.assertEqual([response.status_code for response in responses], [200, 200])
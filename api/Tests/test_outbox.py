@@ -0,0 +1,258 @@
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api import outbox, scheduler
+from api.circuit_breaker import CircuitOpenError
+from api.models import OutboxMessage
+from api.reply_parser import ReplyError
+from api.services import build_policy_xml, Result, XStreamError
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {'Ref': 'ABCD01X', 'Ptype': 'YT', 'Risk': {'CLT1': {'indem.yn': 'yes'}}}
+
+
+def created(refno: str = 'ABCD01') -> Result:
+    result = Result(data={'Refno': refno})
+    result.status = True
+    return result
+
+
+@override_settings(OUTBOX=dict(settings.OUTBOX, in_process=False))
+class OutboxViewTests(TestCase):
+
+    def post(self, path: str, data: dict):
+        return self.client.post(path, data=json.dumps(data), content_type='application/json')
+
+    @mock.patch('api.views.create_prospect')
+    def test_unavailable_prospect_stored(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.side_effect = XStreamError('Failed to post to xstream, error: Refused', sent=False)
+
+        # Act
+        response = self.post('/api/prospect', PROSPECT)
+        status = self.client.get(response['Location'])
+
+        # Assert
+        message = OutboxMessage.objects.get()
+        self.assertEqual((response.status_code, response.json()), (202, {'outbox': message.id}))
+        self.assertEqual(response['Location'], '/api/outbox/{}'.format(message.id))
+        self.assertEqual((message.function_type, message.key, message.status), ('create-cliv-prospect', '', 'pending'))
+        self.assertIn('<Name>Bob Test</Name>', message.xml)
+        self.assertEqual(status.json(), {
+            'id': message.id, 'status': 'pending', 'attempts': 0, 'result': None,
+            'error': 'Failed to post to xstream, error: Refused'
+        })
+
+    @mock.patch('api.views.create_prospect')
+    def test_prospect_that_may_have_been_sent_not_stored(self, mock_create_prospect):
+        # Arrange
+        mock_create_prospect.side_effect = XStreamError('Failed to post to xstream, error: Read timed out')
+
+        # Act
+        response = self.post('/api/prospect', PROSPECT)
+
+        # Assert
+        self.assertEqual((response.status_code, response.json()), (500, {'message': 'Error'}))
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @mock.patch('api.views.add_policy')
+    def test_policy_queued_behind_pending_messages(self, mock_add_policy):
+        # Arrange
+        earlier = outbox.store(build_policy_xml(POLICY), 'ABCD01X', 'Circuit open')
+
+        # Act
+        response = self.post('/api/risk', POLICY)
+
+        # Assert
+        self.assertEqual(response.status_code, 202)
+        mock_add_policy.assert_not_called()
+        self.assertEqual([(m.id > earlier.id, m.key) for m in OutboxMessage.objects.all()],
+                         [(False, 'ABCD01X'), (True, 'ABCD01X')])
+
+    @mock.patch('api.views.add_policy')
+    def test_policy_sent_when_nothing_pending(self, mock_add_policy):
+        # Arrange
+        mock_add_policy.return_value = created()
+        outbox.store(build_policy_xml(dict(POLICY, Ref='WXYZ01X')), 'WXYZ01X')
+
+        # Act
+        response = self.post('/api/risk', POLICY)
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        mock_add_policy.assert_called_once()
+
+    def test_status_not_found(self):
+        # Act
+        response = self.client.get('/api/outbox/1')
+
+        # Assert
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(OUTBOX=dict(settings.OUTBOX, in_process=False, max_attempts=2, backoff=5))
+@mock.patch('api.outbox.SoapService.process_message')
+class ReplayTests(TestCase):
+
+    def store(self, key: str = '') -> OutboxMessage:
+        return outbox.store(build_policy_xml(dict(POLICY, Ref=key or 'ABCD01X')), key)
+
+    def test_one_message_per_key_claimed(self, mock_process_message):
+        # Arrange
+        first, second, unordered, other = self.store('ABCD01X'), self.store('ABCD01X'), self.store(), \
+            self.store('WXYZ01X')
+
+        # Act
+        claimed = outbox.claim(10)
+
+        # Assert
+        self.assertEqual([m.id for m in claimed], [first.id, unordered.id, other.id])
+        self.assertEqual(outbox.claim(10), [])
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'pending')
+
+    def test_sent_in_order(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = lambda xml: created()
+        first, second = self.store('ABCD01X'), self.store('ABCD01X')
+
+        # Act
+        rounds = [outbox.replay_once(), outbox.replay_once(), outbox.replay_once()]
+
+        # Assert
+        self.assertEqual(rounds, [1, 1, 0])
+        self.assertEqual([call[0][0] for call in mock_process_message.call_args_list], [first.xml, second.xml])
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'sent')
+        self.assertEqual(json.loads(first.result), {'status': True, 'data': {'Refno': 'ABCD01'}})
+
+    def test_failures_retried_then_dead_lettered(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = XStreamError('Failed to post to xstream, error: Refused', sent=False)
+        message = self.store('ABCD01X')
+        later = self.store('ABCD01X')
+
+        # Act
+        outbox.replay_once()
+        message.refresh_from_db()
+        retried = (message.status, message.attempts, message.next_attempt > timezone.now())
+        OutboxMessage.objects.filter(id=message.id).update(next_attempt=timezone.now())
+        outbox.replay_once()
+        message.refresh_from_db()
+
+        # Assert
+        self.assertEqual(retried, ('pending', 1, True))
+        self.assertEqual((message.status, message.attempts), ('dead', 2))
+        self.assertEqual([m.id for m in outbox.claim(10)], [later.id])
+
+    def test_replay_that_may_have_been_sent_dead_lettered(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = XStreamError('Failed to post to xstream, error: Read timed out')
+        message = self.store('ABCD01X')
+
+        # Act
+        outbox.replay_once()
+
+        # Assert
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('dead', 1))
+        self.assertEqual(message.error, 'May have reached XStream, check before requeueing: '
+                                        'Failed to post to xstream, error: Read timed out')
+
+    def test_open_circuit_not_counted(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = CircuitOpenError('create-cliv-policy', 30)
+        message = self.store('ABCD01X')
+
+        # Act
+        outbox.replay_once()
+
+        # Assert
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 0))
+        self.assertGreater(message.next_attempt, timezone.now() + timedelta(seconds=25))
+
+    def test_refused_message_dead_lettered(self, mock_process_message):
+        # Arrange
+        result = Result(data=[ReplyError('Invalid Ptype', {'code': 'E1'})])
+        result.status = False
+        mock_process_message.return_value = result
+        message = self.store()
+
+        # Act
+        outbox.replay_once()
+
+        # Assert
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('dead', 0))
+
+    def test_replayed_as_batch_work(self, mock_process_message):
+        # Arrange
+        classes = []
+        mock_process_message.side_effect = lambda xml: classes.append(scheduler.class_name()) or created()
+        self.store()
+
+        # Act
+        outbox.replay_once()
+
+        # Assert
+        self.assertEqual(classes, ['batch'])
+
+    def test_stale_sending_reclaimed(self, mock_process_message):
+        # Arrange
+        message = self.store()
+        outbox.claim(10)
+        OutboxMessage.objects.filter(id=message.id).update(updated=timezone.now() - timedelta(hours=1))
+
+        # Act
+        claimed = outbox.claim(10)
+
+        # Assert
+        self.assertEqual([m.id for m in claimed], [message.id])
+
+
+@override_settings(OUTBOX=dict(settings.OUTBOX, in_process=False))
+class OutboxCommandTests(TestCase):
+
+    def call(self, *args) -> str:
+        out = io.StringIO()
+        call_command('outbox', *args, stdout=out)
+        return out.getvalue()
+
+    def test_requeue_dead(self):
+        # Arrange
+        message = outbox.store(build_policy_xml(POLICY), 'ABCD01X')
+        OutboxMessage.objects.filter(id=message.id).update(status=OutboxMessage.DEAD, attempts=10)
+
+        # Act
+        output = self.call('requeue', '--dead')
+
+        # Assert
+        message.refresh_from_db()
+        self.assertEqual(output, 'Requeued 1 message(s)\n')
+        self.assertEqual((message.status, message.attempts), ('pending', 0))
+
+    def test_stats_and_list(self):
+        # Arrange
+        message = outbox.store(build_policy_xml(POLICY), 'ABCD01X', 'Circuit open')
+
+        # Act
+        stats = self.call('stats')
+        listed = self.call('list', '--status', 'pending')
+
+        # Assert
+        self.assertEqual(stats.split('\n')[0].split(), ['pending', '1'])
+        self.assertIn('{} pending  create-cliv-policy'.format(message.id), listed)
+        self.assertIn('Circuit open', listed)
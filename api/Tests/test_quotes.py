@@ -0,0 +1,203 @@
+import json
+import os
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase
+from api import quotes
+from api.metrics import counters, gauges
+from api.simulator import XStreamSimulator
+
+
+RISK = {
+    'GENI': {'cover': 'Standard', 'excess': '250'},
+    'YTID': {'length': '12'},
+}
+
+QUOTE = {'Polref': 'ABCD01XYT01', 'Risk': RISK}
+
+
+def load_reply(name: str) -> str:
+    with open(os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'replies', name), encoding='utf-8') as f:
+        return f.read()
+
+
+class NormaliseRiskTests(TestCase):
+
+    def test_unrelated_fields_ignored(self):
+        # Arrange
+        edited = dict(RISK, CLT1={'indem.yn': 'yes'}, GENI={'excess': ' 250 ', 'cover': 'Standard', 'notes': ''})
+
+        # Act
+        digests = {quotes.risk_digest(quotes.normalise_risk(risk)) for risk in (RISK, edited)}
+
+        # Assert
+        self.assertEqual(len(digests), 1)
+
+    def test_rating_fields_change_digest(self):
+        # Act
+        before = quotes.risk_digest(quotes.normalise_risk(RISK))
+        after = quotes.risk_digest(quotes.normalise_risk(dict(RISK, YTID={'length': '14'})))
+
+        # Assert
+        self.assertNotEqual(before, after)
+
+
+class QuoteMemoTests(TestCase):
+
+    def setUp(self):
+        self.memo = quotes.QuoteMemo(max_entries=2, ttl=60)
+
+    def test_memoised(self):
+        # Act
+        missed = self.memo.get('ABCD01XYT01', 'a')
+        self.memo.set('ABCD01XYT01', 'a', {'premium': '1.00'})
+
+        # Assert
+        self.assertIsNone(missed)
+        self.assertEqual(self.memo.get('ABCD01XYT01', 'a'), {'premium': '1.00'})
+
+    def test_polref_change_invalidates(self):
+        # Arrange
+        self.memo.get('ABCD01XYT01', 'a')
+        self.memo.set('ABCD01XYT01', 'a', {'premium': '1.00'})
+
+        # Act
+        self.memo.get('ABCD01XYT02', 'a')
+
+        # Assert
+        self.assertIsNone(self.memo.get('ABCD01XYT01', 'a'))
+
+    def test_stale_polref_not_memoised(self):
+        # Arrange
+        self.memo.get('ABCD01XYT02', 'a')
+
+        # Act
+        self.memo.set('ABCD01XYT01', 'a', {'premium': '1.00'})
+
+        # Assert
+        self.assertIsNone(self.memo.get('ABCD01XYT02', 'a'))
+        self.assertEqual(len(self.memo._entries), 0)
+
+    def test_invalidate(self):
+        # Arrange
+        self.memo.set('ABCD01XYT01', 'a', {'premium': '1.00'})
+        self.memo.set('ABCD01XYT01', 'b', {'premium': '2.00'})
+
+        # Act
+        self.memo.invalidate('ABCD01XYT01')
+
+        # Assert
+        self.assertIsNone(self.memo.get('ABCD01XYT01', 'a'))
+        self.assertIsNone(self.memo.get('ABCD01XYT01', 'b'))
+
+    def test_least_recently_used_dropped(self):
+        # Arrange
+        self.memo.set('ABCD01XYT01', 'a', {'premium': '1.00'})
+        self.memo.set('EFGH01XYT01', 'a', {'premium': '2.00'})
+        self.memo.get('ABCD01XYT01', 'a')
+
+        # Act
+        self.memo.set('IJKL01XYT01', 'a', {'premium': '3.00'})
+
+        # Assert
+        self.assertIsNotNone(self.memo.get('ABCD01XYT01', 'a'))
+        self.assertIsNone(self.memo.get('EFGH01XYT01', 'a'))
+
+
+class QuoteReplyTests(TestCase):
+
+    def test_large_quote(self):
+        # Act
+        result = quotes._handle_quote_response(load_reply('quote_large.xml'), 'ABCD01XYT01')
+
+        # Assert
+        self.assertTrue(result.status)
+        self.assertEqual(result.data['lines'], 300)
+        self.assertEqual(result.data['Polref'], 'ABCD01XYT01')
+
+    def test_simulated_quote(self):
+        # Arrange
+        xml = quotes.build_quote_xml('ABCD01XYT01', quotes.normalise_risk(RISK))
+
+        # Act
+        result = quotes._handle_quote_response(XStreamSimulator(seed=1).reply_for(xml), 'ABCD01XYT01')
+
+        # Assert
+        self.assertEqual(result.data, {'Polref': 'ABCD01XYT01', 'lines': 2, 'premium': '72.50', 'ipt': '8.70'})
+
+
+@mock.patch('api.quotes.SoapService._post_with_retry')
+class QuoteViewTests(TestCase):
+
+    def setUp(self):
+        quotes.get_memo().clear()
+        counters.reset()
+        gauges.reset()
+
+    def post(self, data):
+        return self.client.post('/api/quote', data=json.dumps(data), content_type='application/json')
+
+    def test_unchanged_risk_memoised(self, mock_post_with_retry):
+        # Arrange
+        mock_post_with_retry.side_effect = lambda xml: XStreamSimulator(seed=1).reply_for(xml)
+
+        # Act
+        first = self.post(QUOTE)
+        second = self.post(dict(QUOTE, Risk=dict(RISK, CLT1={'indem.yn': 'no'})))
+
+        # Assert
+        mock_post_with_retry.assert_called_once()
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(gauges.get('quote_memo_hit_ratio'), 0.5)
+
+    def test_changed_risk_rated(self, mock_post_with_retry):
+        # Arrange
+        mock_post_with_retry.side_effect = lambda xml: XStreamSimulator(seed=1).reply_for(xml)
+
+        # Act
+        first = self.post(QUOTE)
+        second = self.post(dict(QUOTE, Risk=dict(RISK, TR01={'trailer': 'yes'})))
+
+        # Assert
+        self.assertEqual(mock_post_with_retry.call_count, 2)
+        self.assertEqual((first.json()['lines'], second.json()['lines']), (2, 3))
+
+    def test_error_not_memoised(self, mock_post_with_retry):
+        # Arrange
+        mock_post_with_retry.return_value = load_reply('error.xml')
+
+        # Act
+        response = self.post(QUOTE)
+        self.post(QUOTE)
+
+        # Assert
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(mock_post_with_retry.call_count, 2)
+
+    def test_upstream_failure_returns_error(self, mock_post_with_retry):
+        # Arrange
+        mock_post_with_retry.side_effect = IOError('Failed to post to xstream, error: Timed out')
+
+        # Act
+        response = self.post(QUOTE)
+
+        # Assert
+        self.assertEqual((response.status_code, response.json()), (500, {'message': 'Error'}))
+
+    def test_invalid_premium_returns_error(self, mock_post_with_retry):
+        # Arrange
+        mock_post_with_retry.side_effect = lambda xml: XStreamSimulator(seed=1).reply_for(xml) \
+            .replace('<premium>', '<premium>x')
+
+        # Act
+        response = self.post(QUOTE)
+
+        # Assert
+        self.assertEqual((response.status_code, response.json()), (500, {'message': 'Error'}))
+
+    def test_malformed_request(self, mock_post_with_retry):
+        # Act
+        response = self.post({'Polref': 'ABCD01XYT01'})
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
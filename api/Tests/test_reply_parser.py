@@ -0,0 +1,76 @@
+import os
+from django.conf import settings
+from django.test import TestCase
+from api.reply_parser import ReplyParser, ReplyError
+from api.services import SoapService
+
+
+def load_reply(name: str) -> str:
+    with open(os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'replies', name), encoding='utf-8') as f:
+        return f.read()
+
+
+class HandleResponseTests(TestCase):
+
+    def test_prospect_ok(self):
+        # Act
+        result = SoapService._handle_response(load_reply('prospect_ok.xml'))
+
+        # Assert
+        self.assertTrue(result.status)
+        self.assertEqual(result.data, {'Refno': 'ABCD01'})
+
+    def test_large_quote_ok(self):
+        # Act
+        result = SoapService._handle_response(load_reply('quote_large.xml'))
+
+        # Assert
+        self.assertTrue(result.status)
+        self.assertEqual(result.data, {'Refno': 'ABCD01'})
+
+    def test_error_records(self):
+        # Act
+        result = SoapService._handle_response(load_reply('error.xml'))
+
+        # Assert
+        self.assertFalse(result.status)
+        self.assertEqual(result.data, [
+            ReplyError('Mandatory field Pcode is missing', {'code': 'E101'}),
+            ReplyError('Field Tel exceeds maximum length of 20', {'code': 'E204'}),
+        ])
+
+
+class ReplyParserTests(TestCase):
+
+    def setUp(self):
+        self.parser = ReplyParser(settings.XSTREAM_REPLY_FIELDS)
+
+    def test_stops_once_fields_found(self):
+        # Arrange
+        # Malformed tail is past the first chunk so is never fed to the parser
+        padding = '<apmpolicy>{}</apmpolicy>'.format('<YTPQ>1</YTPQ>' * 2000)
+        reply = load_reply('prospect_ok.xml').replace('</xmlreply>', padding + '<unclosed></xmlreply>')
+
+        # Act
+        result = self.parser.parse(reply)
+
+        # Assert
+        self.assertEqual(result, {'result': 'OK', 'errors': [], 'refno': 'ABCD01'})
+
+    def test_missing_fields(self):
+        # Act
+        result = self.parser.parse(b'<xmlreply><messages><result></result></messages></xmlreply>')
+
+        # Assert
+        self.assertEqual(result, {'result': None, 'errors': [], 'refno': None})
+
+    def test_fields_split_across_chunks(self):
+        # Arrange
+        reply = '<xmlreply><messages>{}<result>OK</result></messages><apmdata><prospect><p.cm>' \
+                '<refno>ABCD01</refno></p.cm></prospect></apmdata></xmlreply>'.format('<info>x</info>' * 5000)
+
+        # Act
+        result = self.parser.parse(reply)
+
+        # Assert
+        self.assertEqual(result['refno'], 'ABCD01')
@@ -0,0 +1,93 @@
+from unittest import mock
+from lxml import etree
+from django.test import TestCase
+from api.metrics import counters
+from api.response_cache import MemoryBackend, ResponseCache
+from api.services import SoapService, XStreamParser
+
+
+def quote_xml(polref: str, pretty: bool = False) -> str:
+    parser = XStreamParser()
+    parser.add_ref('ABCD01')
+    parser.add_polref(polref)
+    parser.add_risk_data({'BGA': {'cover': '1000'}})
+    parser.add_function_type('update-cliv')
+    xml = parser.parse_to_xml()
+    return etree.tostring(etree.fromstring(xml), pretty_print=True).decode('utf-8') if pretty else xml
+
+
+class MemoryBackendTests(TestCase):
+
+    def test_least_recently_used_evicted(self):
+        # Arrange
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', 1, 60)
+        backend.set('b', 2, 60)
+        backend.get('a')
+
+        # Act
+        backend.set('c', 3, 60)
+
+        # Assert
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), 3)
+
+    def test_expired_entries_missed(self):
+        # Arrange
+        backend = MemoryBackend()
+        backend.set('a', 1, -1)
+
+        # Act / Assert
+        self.assertIsNone(backend.get('a'))
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+        self.cache = ResponseCache(MemoryBackend(), {
+            'update-cliv': {'ttl': 60},
+            'create-cliv-prospect': {'ttl': 60},
+        })
+
+    def test_create_operations_never_cached(self):
+        # Arrange
+        parser = XStreamParser()
+        parser.add_apm({'Name': 'Bob Test'})
+        parser.add_function_type('create-cliv-prospect')
+
+        # Act
+        result = self.cache.key_for(parser.parse_to_xml())
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertNotIn('create-cliv-prospect', self.cache.functions)
+
+    def test_key_ignores_formatting(self):
+        # Act / Assert
+        self.assertEqual(self.cache.key_for(quote_xml('ABCD01XYT01')),
+                         self.cache.key_for(quote_xml('ABCD01XYT01', pretty=True)))
+        self.assertNotEqual(self.cache.key_for(quote_xml('ABCD01XYT01')),
+                            self.cache.key_for(quote_xml('ABCD01XYT02')))
+
+    @mock.patch('api.services.SoapService._get_client_pool')
+    @mock.patch('api.services.SoapService._post_to_xstream')
+    @mock.patch('api.services.response_cache.get_cache')
+    def test_process_message_served_from_cache(self, mock_get_cache, mock_post, mock_pool):
+        # Arrange
+        mock_get_cache.return_value = self.cache
+        mock_post.return_value = '<xmlreply><messages><result>OK</result></messages>' \
+                                 '<apmdata><prospect><p.cm><refno>ABCD01</refno></p.cm></prospect></apmdata></xmlreply>'
+
+        # Act
+        first = SoapService.process_message(quote_xml('ABCD01XYT01'))
+        second = SoapService.process_message(quote_xml('ABCD01XYT01'))
+
+        # Assert
+        mock_post.assert_called_once()
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.data, {'Refno': 'ABCD01'})
+        self.assertEqual(counters.get('xstream_response_cache_hits:update-cliv'), 1)
+        self.assertEqual(counters.get('xstream_response_cache_misses:update-cliv'), 1)
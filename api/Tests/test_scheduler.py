@@ -0,0 +1,163 @@
+import threading
+import time
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from api import bulk, circuit_breaker, jobs, scheduler
+from api.scheduler import PriorityScheduler
+from api.services import SoapService, build_policy_xml, build_prospect_xml, Result
+
+CLASSES = {
+    'interactive': {'weight': 8, 'max_concurrent': None, 'queue': '1'},
+    'batch': {'weight': 1, 'max_concurrent': 2, 'queue': '2'},
+}
+
+POLICY = {'Ref': 'ABCD01X', 'Ptype': 'YT', 'Risk': {'CLT1': {'indem.yn': 'yes'}}}
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 2
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.001)
+
+
+class PrioritySchedulerTests(TestCase):
+
+    def queue_call(self, slots: PriorityScheduler, name: str, granted: list):
+        def call():
+            slots.acquire(name)
+            granted.append(name)
+            slots.release(name)
+        waiting = slots.snapshot()[name]['waiting']
+        thread = threading.Thread(target=call)
+        thread.start()
+        wait_for(lambda: slots.snapshot()[name]['waiting'] == waiting + 1)
+        return thread
+
+    def test_interactive_admitted_ahead_of_batch_backlog(self):
+        # Arrange
+        slots = PriorityScheduler(1, CLASSES)
+        slots.acquire('batch')
+        granted = []
+        threads = [self.queue_call(slots, 'batch', granted) for _ in range(3)]
+        threads += [self.queue_call(slots, 'interactive', granted) for _ in range(2)]
+
+        # Act
+        slots.release('batch')
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        self.assertEqual(granted, ['interactive', 'interactive', 'batch', 'batch', 'batch'])
+
+    def test_batch_not_starved(self):
+        # Arrange
+        slots = PriorityScheduler(1, CLASSES)
+        slots.acquire('interactive')
+        granted = []
+        threads = [self.queue_call(slots, 'batch', granted)]
+        threads += [self.queue_call(slots, 'interactive', granted) for _ in range(12)]
+
+        # Act
+        slots.release('interactive')
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        self.assertLess(granted.index('batch'), 12)
+
+    def test_class_concurrency_capped(self):
+        # Arrange
+        slots = PriorityScheduler(4, CLASSES, timeout=0.01)
+        slots.acquire('batch')
+        slots.acquire('batch')
+
+        # Act
+        with self.assertRaises(IOError):
+            slots.acquire('batch')
+        slots.acquire('interactive')
+
+        # Assert
+        self.assertEqual(slots.snapshot(), {
+            'interactive': {'running': 1, 'waiting': 0}, 'batch': {'running': 2, 'waiting': 0}
+        })
+
+
+class PriorityClassTests(TestCase):
+
+    def test_queue_set_per_class(self):
+        # Act
+        interactive = build_prospect_xml({'Name': 'bob'})
+        with scheduler.priority('batch'):
+            batch = build_prospect_xml({'Name': 'bob'})
+
+        # Assert
+        self.assertIn('<queue>1</queue>', interactive)
+        self.assertIn('<queue>2</queue>', batch)
+
+    def test_unknown_class(self):
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            with scheduler.priority('urgent'):
+                pass
+
+    @mock.patch('api.bulk.create_prospect')
+    def test_bulk_rows_run_as_batch(self, mock_create: mock.MagicMock):
+        # Arrange
+        classes = []
+
+        def create(prospect_json):
+            classes.append(scheduler.class_name())
+            result = Result(data={'Refno': 'ABCD01'})
+            result.status = True
+            return result
+        mock_create.side_effect = create
+        row = {'Name': 'bob', 'Addr1': '3 Test Rd', 'Pcode': 'TT1 TT2', 'Tel': '1234567890', 'Email': 'j@j.com'}
+
+        # Act
+        list(bulk.import_prospects([row, row], workers=2))
+
+        # Assert
+        self.assertEqual(classes, ['batch', 'batch'])
+        self.assertEqual(scheduler.class_name(), 'interactive')
+
+    def test_jobs_run_as_batch(self):
+        # Arrange
+        classes = []
+        job = jobs.Job.objects.create(kind='add_policy', payload='{}', queue='2')
+
+        def handler(payload, queue):
+            classes.append(scheduler.class_name())
+            return Result(data=[])
+
+        # Act
+        with mock.patch.dict(jobs.HANDLERS, {'add_policy': handler}):
+            jobs.run_job(job)
+
+        # Assert
+        self.assertEqual(classes, ['batch'])
+
+
+class SlotTimeoutTests(TestCase):
+
+    def setUp(self):
+        circuit_breaker.reset()
+        self.addCleanup(circuit_breaker.reset)
+
+    @mock.patch('api.services.SoapService._get_client_pool')
+    def test_slot_timeout_not_counted_by_breaker(self, mock_get_client_pool):
+        # Arrange
+        slots = PriorityScheduler(1, CLASSES, timeout=0.01)
+        slots.acquire('interactive')
+
+        # Act
+        with mock.patch('api.scheduler._scheduler', slots), \
+                override_settings(XSTREAM_CIRCUIT_BREAKER=dict(settings.XSTREAM_CIRCUIT_BREAKER, failure_threshold=1)):
+            with self.assertRaises(IOError):
+                SoapService.process_message(build_policy_xml(POLICY))
+
+        # Assert
+        mock_get_client_pool.assert_not_called()
+        self.assertEqual(circuit_breaker.states(), {'create-cliv-policy': circuit_breaker.CLOSED})
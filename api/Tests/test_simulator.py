@@ -0,0 +1,144 @@
+import json
+import random
+import tempfile
+from django.conf import settings
+from django.test import TestCase, override_settings
+from api import circuit_breaker, services
+from api.reply_parser import ReplyParser
+from api.parsers import policy_schema, transaction_schema
+from api.services import build_prospect_xml, build_policy_xml, split_polref, validate_json
+from api.simulator import XStreamSimulator, parse_latency
+
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {
+    'Ref': 'BOBT01X',
+    'Ptype': 'YT',
+    'Risk': {'CLT1': {'indem.yn': 'yes'}}
+}
+
+
+class ReplyTests(TestCase):
+
+    def setUp(self):
+        self.simulator = XStreamSimulator(seed=1)
+        self.parser = ReplyParser(dict(settings.XSTREAM_REPLY_FIELDS, polref={'path': 'apmpolicy/p.py/Polref'}))
+
+    def test_prospect_created(self):
+        # Act
+        first = self.parser.parse(self.simulator.reply_for(build_prospect_xml(PROSPECT)))
+        second = self.parser.parse(self.simulator.reply_for(build_prospect_xml(PROSPECT)))
+
+        # Assert
+        self.assertEqual((first['result'], first['refno']), ('OK', 'BOBT01A'))
+        self.assertEqual(second['refno'], 'BOBT02A')
+
+    def test_missing_mandatory_fields(self):
+        # Act
+        reply = self.parser.parse(self.simulator.reply_for(build_prospect_xml({'Name': 'Bob Test'})))
+
+        # Assert
+        self.assertEqual(reply['result'], 'Error')
+        self.assertEqual([error.message for error in reply['errors']][:2],
+                         ['Mandatory field Addr1 is missing', 'Mandatory field Pcode is missing'])
+        self.assertEqual(reply['errors'][0].attributes, {'code': 'E101'})
+
+    def test_policy_gets_polref(self):
+        # Act
+        reply = self.parser.parse(self.simulator.reply_for(build_policy_xml(POLICY)))
+
+        # Assert
+        self.assertEqual((reply['result'], reply['refno'], reply['polref']), ('OK', 'BOBT01X', 'BOBT01XYT01'))
+
+    def test_generated_refs_accepted_by_schemas(self):
+        # Act
+        refno = self.parser.parse(self.simulator.reply_for(build_prospect_xml(PROSPECT)))['refno']
+        polref = self.parser.parse(self.simulator.reply_for(build_policy_xml(dict(POLICY, Ref=refno))))['polref']
+
+        # Assert
+        self.assertTrue(validate_json(dict(POLICY, Ref=refno), policy_schema))
+        self.assertTrue(validate_json({'Polref': polref}, transaction_schema))
+        self.assertEqual(split_polref(polref), (refno, 'YT'))
+
+    def test_error_rate(self):
+        # Arrange
+        self.simulator.error_rate = 1
+
+        # Act
+        reply = self.parser.parse(self.simulator.reply_for(build_prospect_xml(PROSPECT)))
+
+        # Assert
+        self.assertEqual(reply['result'], 'Error')
+        self.assertEqual(len(reply['errors']), 1)
+
+
+class LatencyTests(TestCase):
+
+    def test_distributions(self):
+        # Arrange
+        rng = random.Random(1)
+
+        # Act
+        fixed = parse_latency('fixed:50')(rng)
+        uniform = [parse_latency('uniform:20,80')(rng) for _ in range(100)]
+        lognormal = sorted(parse_latency('lognormal:100,0.5')(rng) for _ in range(1001))
+
+        # Assert
+        self.assertEqual(fixed, 0.05)
+        self.assertTrue(all(0.02 <= latency <= 0.08 for latency in uniform))
+        self.assertAlmostEqual(lognormal[500], 0.1, delta=0.01)
+
+    def test_invalid_spec(self):
+        # Act / Assert
+        for spec in ('gaussian:10', 'uniform:10', 'fixed'):
+            with self.assertRaises(ValueError):
+                parse_latency(spec)
+
+
+class EndToEndTests(TestCase):
+    """
+    Loads the wsdl served by the simulator, then drives the views through zeep and HTTP
+    """
+    def setUp(self):
+        self.simulator = XStreamSimulator(seed=1)
+        address = self.simulator.start()
+        overrides = override_settings(
+            WSDL=address + '?wsdl',
+            WSDL_CACHE=dict(settings.WSDL_CACHE, dir=tempfile.mkdtemp()),
+            XSTREAM_ADDRESS=None,
+            XSTREAM_CREDENTIALS=('simulator', 'simulator'),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        services._client_pool = None
+        circuit_breaker.reset()
+
+    def tearDown(self):
+        self.simulator.stop()
+        services._client_pool = None
+
+    def test_prospect_created(self):
+        # Act
+        response = self.client.post('/api/prospect', data=json.dumps(PROSPECT), content_type='application/json')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'Refno': 'BOBT01A'})
+        self.assertEqual(self.simulator.requests, 1)
+
+    def test_prospect_rejected(self):
+        # Arrange
+        self.simulator.error_rate = 1
+
+        # Act
+        response = self.client.post('/api/prospect', data=json.dumps(PROSPECT), content_type='application/json')
+
+        # Assert
+        self.assertEqual(response.status_code, 500)
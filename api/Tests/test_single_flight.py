@@ -0,0 +1,194 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.core.cache import caches
+from django.test import TestCase
+from api import single_flight
+from api.metrics import counters
+from api.circuit_breaker import CircuitOpenError
+from api.services import SoapService, XStreamError, build_prospect_xml
+from api.single_flight import DjangoCacheLockBackend, SingleFlight
+
+
+OK_REPLY = '<xmlreply><messages><result>OK</result></messages>' \
+           '<apmdata><prospect><p.cm><refno>ABCD01</refno></p.cm></prospect></apmdata></xmlreply>'
+
+
+class BlockingCall:
+    """
+    Counts calls, and blocks each one until released
+    """
+    def __init__(self, result='result', error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run_concurrently(func, count: int) -> list:
+    executor = ThreadPoolExecutor(max_workers=count)
+    futures = [executor.submit(func) for _ in range(count)]
+    executor.shutdown(wait=False)
+    time.sleep(0.05)
+    return futures
+
+
+class SingleFlightTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+
+    def test_concurrent_calls_share_one_execution(self):
+        # Arrange
+        coalescer = SingleFlight()
+        call = BlockingCall()
+
+        # Act
+        futures = run_concurrently(lambda: coalescer.do('create-cliv-prospect:abc', call), 5)
+        call.release.set()
+        results = [future.result() for future in futures]
+
+        # Assert
+        self.assertEqual(call.calls, 1)
+        self.assertEqual(sorted(shared for result, shared in results), [False, True, True, True, True])
+        self.assertTrue(all(result == 'result' for result, shared in results))
+        self.assertEqual(counters.get('xstream_coalesced:create-cliv-prospect'), 4)
+        self.assertEqual(coalescer._calls, {})
+
+    def test_error_shared(self):
+        # Arrange
+        coalescer = SingleFlight()
+        call = BlockingCall(error=IOError('Failed to post to xstream, error: timed out'))
+
+        # Act
+        futures = run_concurrently(lambda: coalescer.do('k', call), 3)
+        call.release.set()
+
+        # Assert
+        for future in futures:
+            with self.assertRaises(IOError):
+                future.result()
+        self.assertEqual(call.calls, 1)
+
+    def test_completed_calls_not_shared_without_linger(self):
+        # Arrange
+        coalescer = SingleFlight()
+        call = BlockingCall()
+        call.release.set()
+
+        # Act
+        coalescer.do('k', call)
+        result, shared = coalescer.do('k', call)
+
+        # Assert
+        self.assertEqual(call.calls, 2)
+        self.assertFalse(shared)
+
+    def test_linger_shares_completed_result(self):
+        # Arrange
+        coalescer = SingleFlight(linger=60)
+        call = BlockingCall()
+        call.release.set()
+
+        # Act
+        coalescer.do('k', call)
+        result, shared = coalescer.do('k', call)
+
+        # Assert
+        self.assertEqual(call.calls, 1)
+        self.assertTrue(shared)
+
+    def test_shared_lock_backend_across_processes(self):
+        # Arrange, two coalescers stand in for two processes sharing a cache
+        caches['default'].clear()
+        backend = DjangoCacheLockBackend(poll_interval=0.01)
+        first, second = SingleFlight(backend), SingleFlight(backend)
+        call = BlockingCall()
+
+        # Act
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(first.do, 'k', call)
+            call.started.wait(5)
+            follower = executor.submit(second.do, 'k', call)
+            time.sleep(0.05)
+            call.release.set()
+
+        # Assert
+        self.assertEqual(leader.result(), ('result', False))
+        self.assertEqual(follower.result(), ('result', True))
+        self.assertEqual(call.calls, 1)
+        self.assertIsNone(caches['default'].get('single_flight:lock:k'))
+
+    def follower_error(self, error: IOError) -> IOError:
+        caches['default'].clear()
+        backend = DjangoCacheLockBackend(poll_interval=0.01)
+        first, second = SingleFlight(backend), SingleFlight(backend)
+        call = BlockingCall(error=error)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(first.do, 'k', call)
+            call.started.wait(5)
+            follower = executor.submit(second.do, 'k', call)
+            time.sleep(0.05)
+            call.release.set()
+        self.assertRaises(type(error), leader.result)
+        return follower.exception()
+
+    def test_follower_error_may_have_been_sent(self):
+        # Act
+        error = self.follower_error(XStreamError('Failed to post to xstream, error: Read timed out'))
+
+        # Assert
+        self.assertIsInstance(error, XStreamError)
+        self.assertEqual((str(error), error.sent), ('Failed to post to xstream, error: Read timed out', True))
+
+    def test_follower_error_never_sent(self):
+        # Act
+        error = self.follower_error(XStreamError('Failed to post to xstream, error: Refused', sent=False))
+
+        # Assert
+        self.assertFalse(error.sent)
+
+    def test_follower_circuit_open(self):
+        # Act
+        error = self.follower_error(CircuitOpenError('create-cliv-prospect', 30))
+
+        # Assert
+        self.assertIsInstance(error, CircuitOpenError)
+        self.assertEqual((error.function_type, error.retry_after), ('create-cliv-prospect', 30))
+
+
+class ProcessMessageTests(TestCase):
+
+    def setUp(self):
+        single_flight._single_flight = single_flight._UNSET
+
+    def tearDown(self):
+        single_flight._single_flight = single_flight._UNSET
+
+    @mock.patch('api.services.SoapService._post_with_retry')
+    def test_duplicate_submits_make_one_call(self, mock_post):
+        # Arrange
+        call = BlockingCall(result=OK_REPLY)
+        mock_post.side_effect = lambda xml: call()
+        xml = build_prospect_xml({'Name': 'Bob Test', 'Addr1': '3 Test Rd', 'Pcode': 'TT1 TT2', 'Tel': '1234567890',
+                                  'Email': 'j@j.com'})
+
+        # Act
+        futures = run_concurrently(lambda: SoapService.process_message(xml), 3)
+        call.release.set()
+        results = [future.result() for future in futures]
+
+        # Assert
+        mock_post.assert_called_once_with(xml)
+        self.assertTrue(all(result.data == {'Refno': 'ABCD01'} for result in results))
+        self.assertEqual(sorted(result.coalesced for result in results), [False, True, True])
@@ -0,0 +1,159 @@
+import json
+import threading
+from unittest import mock
+from django.test import TestCase
+from api import quotes, transact
+from api.circuit_breaker import CircuitOpenError
+from api.reply_parser import ReplyError
+from api.services import Result, function_type_of
+
+
+def ok() -> Result:
+    result = Result(data={'Refno': 'ABCD01X'})
+    result.status = True
+    return result
+
+
+def error(message: str) -> Result:
+    result = Result(data=[ReplyError(message, {})])
+    result.status = False
+    return result
+
+
+def read_events(response) -> list:
+    body = b''.join(response.streaming_content).decode('utf-8')
+    events = []
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+class BuildStepXmlTests(TestCase):
+
+    def test_transfer_and_buy_message(self):
+        # Act
+        xml = transact.build_step_xml(transact.STEPS[0], 'ABCD01XYT01')
+
+        # Assert
+        self.assertEqual(function_type_of(xml), 'convert-cliv')
+        self.assertIn('<Refno>ABCD01X</Refno>', xml)
+        self.assertIn('<Ptype>YT</Ptype><Polref>ABCD01XYT01</Polref>', xml)
+
+
+@mock.patch('api.transact.SoapService.process_message')
+class TransactTests(TestCase):
+
+    def post(self, data=None, **extra):
+        return self.client.post('/api/transact', data=json.dumps(data or {'Polref': 'ABCD01XYT01'}),
+                                content_type='application/json', **extra)
+
+    def test_transfer_and_buy(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = ok()
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'Polref': 'ABCD01XYT01', 'Refno': 'ABCD01X', 'status': 'OK'})
+        self.assertEqual([function_type_of(call[0][0]) for call in mock_process_message.call_args_list],
+                         ['convert-cliv'])
+
+    def test_progress_streamed(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = ok()
+
+        # Act
+        response = self.post(HTTP_ACCEPT='text/event-stream')
+        events = read_events(response)
+
+        # Assert
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        steps = [(data['step'], data['status']) for event, data in events if event == 'step']
+        self.assertEqual(steps, [('transfer_and_buy', 'started'), ('transfer_and_buy', 'done')])
+        self.assertEqual(events[-1], ('result', {'Polref': 'ABCD01XYT01', 'Refno': 'ABCD01X', 'status': 'OK'}))
+
+    def test_stream_closed_early_still_buys(self, mock_process_message):
+        # Arrange
+        bought = threading.Event()
+        release = threading.Event()
+        mock_process_message.side_effect = lambda xml: release.wait(5) and (bought.set() or ok())
+
+        # Act
+        events = transact.run_detached('ABCD01XYT01')
+        first = next(events)
+        events.close()
+        release.set()
+
+        # Assert
+        self.assertEqual(first[0], 'step')
+        self.assertTrue(bought.wait(5))
+
+    def test_failed_step_reported(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = error('Scheme not available for this risk')
+
+        # Act
+        events = read_events(self.post(HTTP_ACCEPT='text/event-stream'))
+
+        # Assert
+        self.assertIn(('step', {'step': 'transfer_and_buy', 'status': 'failed', 'message': 'Error',
+                                'errors': ['Scheme not available for this risk']}), events)
+        self.assertEqual(events[-1][1]['status'], 'Error')
+
+    def test_dependent_steps_skipped_after_failure(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = error('Client not found')
+        steps = (transact.Step('first', 'convert-cliv', ()), transact.Step('second', 'convert-cliv', ('first',)))
+
+        # Act
+        with mock.patch('api.transact.STEPS', steps), mock.patch('api.transact.build_step_xml',
+                                                                   lambda step, polref: step.name):
+            events = list(transact.transfer_and_buy('ABCD01XYT01'))
+
+        # Assert
+        self.assertIn(('step', {'step': 'second', 'status': 'skipped'}), events)
+        self.assertEqual(mock_process_message.call_count, 1)
+
+    def test_failed_step_returns_error(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = IOError('Failed to post to xstream')
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 500)
+
+    def test_circuit_open(self, mock_process_message):
+        # Arrange
+        mock_process_message.side_effect = CircuitOpenError('convert-cliv', 12.5)
+
+        # Act
+        response = self.post()
+
+        # Assert
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '13')
+
+    def test_malformed_request(self, mock_process_message):
+        # Act
+        response = self.post({'Ref': 'ABCD01X'})
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
+        mock_process_message.assert_not_called()
+
+    def test_bought_policy_quotes_invalidated(self, mock_process_message):
+        # Arrange
+        mock_process_message.return_value = ok()
+        memo = quotes.get_memo()
+        memo.set('ABCD01XYT01', 'digest', {'premium': '1.00'})
+
+        # Act
+        self.post()
+
+        # Assert
+        self.assertIsNone(memo.get('ABCD01XYT01', 'digest'))
@@ -0,0 +1,153 @@
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+import requests
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from django.conf import settings
+from django.test import TestCase
+from api import transport
+from api.metrics import counters
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = b'<ok/>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowHandler(KeepAliveHandler):
+
+    def do_POST(self):
+        time.sleep(0.5)
+        super().do_POST()
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TransportTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+        self.server = ThreadingServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_reused(self):
+        # Arrange
+        session = transport.build_session(pool_maxsize=2, pool_block=True)
+
+        # Act
+        for _ in range(5):
+            session.post(self.url, data=b'<xmlexecute/>', timeout=(1, 1))
+
+        # Assert
+        self.assertEqual(counters.get('xstream_requests'), 5)
+        self.assertEqual(counters.get('xstream_connections_opened'), 1)
+        self.assertAlmostEqual(transport.connection_reuse_ratio(), 0.8)
+
+    def test_transport_timeouts_split(self):
+        # Act
+        result = transport.get_transport()
+
+        # Assert
+        self.assertEqual(
+            result.operation_timeout,
+            (settings.XSTREAM_TRANSPORT['connect_timeout'], settings.XSTREAM_TRANSPORT['read_timeout'])
+        )
+        self.assertIs(result.session, transport.get_session())
+
+
+@unittest.skipUnless(shutil.which('openssl'), 'needs openssl to create a test certificate')
+class TlsSessionResumptionTests(TestCase):
+
+    def setUp(self):
+        counters.reset()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', self.cert, '-days', '1',
+             '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        self.server = ThreadingServer(('127.0.0.1', 0), KeepAliveHandler)
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(self.cert, key)
+        self.server.socket = server_context.wrap_socket(self.server.socket, server_side=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_session_resumed_on_reconnect(self):
+        # Arrange
+        context = transport.create_ssl_context()
+        context.load_verify_locations(self.cert)
+        session = transport.build_session(pool_maxsize=1, pool_block=True, ssl_context=context)
+        url = 'https://127.0.0.1:{}/'.format(self.server.server_port)
+
+        # Act
+        for _ in range(3):
+            session.post(url, data=b'<xmlexecute/>', timeout=(1, 1), verify=self.cert)
+            # Drops the pooled connection, as when XStream closes an idle one
+            session.adapters['https://'].poolmanager.clear()
+
+        # Assert
+        self.assertEqual(counters.get('xstream_connections_opened'), 3)
+        self.assertEqual(counters.get('xstream_tls_sessions_resumed'), 2)
+
+
+class NeverSentTests(TestCase):
+
+    def post(self, url: str) -> Exception:
+        try:
+            transport.build_session(pool_maxsize=1, pool_block=True).post(url, data=b'<xmlexecute/>', timeout=(1, 0.1))
+        except requests.RequestException as e:
+            return e
+        self.fail('post did not fail')
+
+    def test_refused_connection_never_sent(self):
+        # Arrange
+        server = ThreadingServer(('127.0.0.1', 0), KeepAliveHandler)
+        url = 'http://127.0.0.1:{}/'.format(server.server_port)
+        server.server_close()
+
+        # Act
+        error = self.post(url)
+
+        # Assert
+        self.assertTrue(transport.never_sent(error))
+
+    def test_read_timeout_may_have_been_sent(self):
+        # Arrange
+        server = ThreadingServer(('127.0.0.1', 0), SlowHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        # Act
+        error = self.post('http://127.0.0.1:{}/'.format(server.server_port))
+
+        # Assert
+        self.assertIsInstance(error, requests.exceptions.ReadTimeout)
+        self.assertFalse(transport.never_sent(error))
@@ -0,0 +1,83 @@
+from unittest import mock
+from django.test import TestCase
+from api.parsers import prospect_schema, policy_schema
+from api.services import validate_json
+from api.validators import registry, CompiledSchema
+
+
+class ValidatorRegistryTests(TestCase):
+
+    def setUp(self):
+        self.prospect = {
+            'Name': 'Bob Test',
+            'Addr1': '3 Test Rd',
+            'Pcode': 'TT1 TT2',
+            'Tel': '1234567890',
+            'Email': 'j@j.com',
+        }
+
+    def test_schemas_compiled_once(self):
+        # Act
+        first = registry.get(prospect_schema)
+        second = registry.get(prospect_schema)
+
+        # Assert
+        self.assertIs(first, second)
+
+    def test_valid_prospect(self):
+        # Act
+        result = validate_json(self.prospect, prospect_schema)
+
+        # Assert
+        self.assertTrue(result)
+
+    def test_collects_every_error(self):
+        # Arrange
+        del self.prospect['Email']
+        self.prospect['Pcode'] = 'Too many characters'
+
+        # Act
+        errors = registry.get(prospect_schema).errors(self.prospect)
+
+        # Assert
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(any('Email' in error for error in errors))
+        self.assertTrue(any(error.startswith('Pcode') for error in errors))
+
+    @mock.patch('api.services.logger.info')
+    def test_invalid_json_logged_not_printed(self, mock_logger: mock.MagicMock):
+        # Act
+        result = validate_json({'Ref': '123'}, policy_schema)
+
+        # Assert
+        self.assertFalse(result)
+        mock_logger.assert_called_once()
+
+    @mock.patch('api.services.logger.info')
+    def test_invalid_values_not_logged(self, mock_logger: mock.MagicMock):
+        # Arrange
+        self.prospect['Pcode'] = 'SECRET POSTCODE TOO LONG'
+
+        # Act
+        validate_json(self.prospect, prospect_schema)
+
+        # Assert
+        logged = mock_logger.call_args[0][0] % mock_logger.call_args[0][1:]
+        self.assertIn('Pcode: ', logged)
+        self.assertNotIn('SECRET', logged)
+
+    def test_codegen_and_jsonschema_agree(self):
+        # Arrange
+        generated = CompiledSchema(policy_schema, codegen=True)
+        plain = CompiledSchema(policy_schema)
+        documents = [
+            {'Ref': '1234567', 'Ptype': 'YT'},
+            {'Ref': '1234567', 'Ptype': 'YT', 'Risk': {'CLT1': {'indem.yn': 'yes'}}},
+            {'Ref': '1234567', 'Ptype': 'YT', 'Risk': {'CLT1': {'indem.yn': 'maybe'}}},
+            {'Ref': '123', 'Ptype': 'YTT'},
+            [],
+        ]
+
+        # Act / Assert
+        for document in documents:
+            self.assertEqual(generated.is_valid(document), plain.is_valid(document), msg=document)
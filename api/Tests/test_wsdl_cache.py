@@ -0,0 +1,65 @@
+import os
+import tempfile
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from api import wsdl_cache
+import zeep
+
+
+def fake_fetch(url):
+    with open(os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'UAT.xsd'), 'rb') as f:
+        return f.read()
+
+
+class WsdlCacheTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_settings = dict(settings.WSDL_CACHE, dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_no_cache_falls_back_to_wsdl(self):
+        with override_settings(WSDL_CACHE=self.cache_settings):
+            # Act
+            result = wsdl_cache.resolve_wsdl()
+
+        # Assert
+        self.assertEqual(result, settings.WSDL)
+
+    def test_build_cache_vendors_schema(self):
+        with override_settings(WSDL_CACHE=self.cache_settings):
+            # Act
+            wsdl_cache.build_cache(fetch=fake_fetch)
+            result = wsdl_cache.resolve_wsdl()
+
+        # Assert
+        self.assertNotEqual(result, settings.WSDL)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'schema_1.xsd')))
+        client = zeep.Client(wsdl=result)
+        self.assertTrue(client.service.processMessage)
+
+    def test_stale_when_source_changes(self):
+        with override_settings(WSDL_CACHE=self.cache_settings):
+            # Arrange
+            wsdl_cache.build_cache(fetch=fake_fetch)
+
+            # Act
+            with mock.patch('api.wsdl_cache._sha256', return_value='changed'):
+                result = wsdl_cache.cached_wsdl()
+
+        # Assert
+        self.assertIsNone(result)
+
+    def test_stale_when_too_old(self):
+        with override_settings(WSDL_CACHE=dict(self.cache_settings, max_age=-1)):
+            # Arrange
+            wsdl_cache.build_cache(fetch=fake_fetch)
+
+            # Act
+            result = wsdl_cache.cached_wsdl()
+
+        # Assert
+        self.assertIsNone(result)
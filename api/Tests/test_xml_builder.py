@@ -0,0 +1,84 @@
+import copy
+import xmltodict
+from django.test import TestCase
+from api import xml_builder
+from api.services import XStreamParser, XSTREAM_TEMPLATE
+
+
+def legacy_xml(function_type=None, apm=None, policy_type=None, polref=None, risk=None) -> str:
+    """
+    The deepcopy + xmltodict.unparse implementation XStreamParser replaced
+    """
+    template = copy.deepcopy(XSTREAM_TEMPLATE)
+    if apm is not None:
+        template['xmlexecute']['apmdata']['prospect']['p.cm'] = apm
+    if policy_type is not None:
+        template['xmlexecute']['apmpolicy']['p.py']['Ptype'] = policy_type
+    if risk is not None:
+        for k, v in risk.items():
+            template['xmlexecute']['apmpolicy'][k] = v
+    if polref is not None:
+        template['xmlexecute']['apmpolicy']['p.py']['Polref'] = polref
+    if function_type is not None:
+        template['xmlexecute']['parameters']['yzt']['char20.1'] = function_type
+    return xmltodict.unparse(template, full_document=False)
+
+
+def parser_xml(function_type=None, apm=None, policy_type=None, polref=None, risk=None) -> str:
+    parser = XStreamParser()
+    if apm is not None:
+        parser.add_apm(apm)
+    if policy_type is not None:
+        parser.add_policy_type(policy_type)
+    if risk is not None:
+        parser.add_risk_data(risk)
+    if polref is not None:
+        parser.add_polref(polref)
+    if function_type is not None:
+        parser.add_function_type(function_type)
+    return parser.parse_to_xml()
+
+
+class XStreamParserTests(TestCase):
+
+    CASES = [
+        {},
+        {'function_type': 'create-cliv-prospect', 'apm': {
+            'Name': 'Bob & "Sons" <Ltd>', 'Addr1': '3 Test Rd', 'Pcode': 'TT1 TT2', 'Tel': '1234567890',
+            'Email': 'j@j.com'
+        }},
+        {'function_type': 'create-cliv-policy', 'apm': {'Refno': 'ABCD01'}, 'policy_type': 'YT',
+         'risk': {'CLT1': {'indem.yn': 'yes'}, 'CLT2': {'dogs': 2, 'names': ['Rex', 'Fido'], 'vet': None}}},
+        {'function_type': 'update-cliv', 'apm': {'Refno': 'ABCD01'}, 'polref': 'ABCD01XYT01',
+         'risk': {'BGA': {'@id': '1 & "2"', '#text': 'a<b'}, 'GENI': {'flag': True, 'amount': 1.5}}},
+        {'apm': {'Name': '£$%', '@xmlns': {'': 'urn:a', 'x': 'urn:b'}}, 'risk': {'p.py': {'Polref': 'X'}}},
+    ]
+
+    def test_output_matches_xmltodict(self):
+        for case in self.CASES:
+            # Act / Assert
+            self.assertEqual(parser_xml(**case), legacy_xml(**case), msg=case)
+
+    def test_parsers_do_not_share_state(self):
+        # Arrange
+        first = XStreamParser()
+        first.add_policy_type('YT')
+
+        # Act
+        result = XStreamParser().parse_to_xml()
+
+        # Assert
+        self.assertIn('<Ptype></Ptype>', result)
+
+
+class CompileEnvelopeTests(TestCase):
+
+    def test_fragments_split_at_slots(self):
+        # Arrange
+        template = {'a': {'b': {'keep': '1', 'drop': '2'}, 'c': None}}
+
+        # Act
+        result = xml_builder.compile_envelope(template, [(('a', 'b'), ('keep',)), (('a', 'c'), ())])
+
+        # Assert
+        self.assertEqual(result, ['<a><b><keep>1</keep>', '</b><c>', '</c></a>'])
@@ -0,0 +1,243 @@
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.utils.module_loading import import_string
+from api import metrics
+from api.metrics import counters
+from api.models import RateLimitBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBuckets:
+    """
+    Token buckets held in this process, so each worker enforces its own limit
+    """
+    def __init__(self, **kwargs):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Takes a token from the bucket of key, created full on first use
+        :param key: client identity
+        :param rate: tokens added per second
+        :param burst: bucket size
+        :return: 0 if a token was taken, otherwise seconds until one is available
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            return 0
+
+    def compact(self, max_idle: float):
+        cutoff = time.monotonic() - max_idle
+        with self._lock:
+            for key in [key for key, (tokens, updated) in self._buckets.items() if updated < cutoff]:
+                del self._buckets[key]
+
+
+class DatabaseBuckets:
+    """
+    Token buckets in the RateLimitBucket table, shared by every worker and host using the database.
+
+    A take is a single conditional UPDATE that refills and spends in the database, so concurrent workers never
+    overspend and no row lock is held between statements.
+    """
+    def __init__(self, **kwargs):
+        pass
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        See MemoryBuckets.take
+        """
+        now = time.time()
+        refilled = Least(Value(float(burst)), F('tokens') + (Value(now) - F('updated')) * Value(float(rate)))
+        while True:
+            taken = RateLimitBucket.objects.filter(key=key).annotate(available=refilled) \
+                .filter(available__gte=1).update(tokens=refilled - 1, updated=now)
+            if taken:
+                return 0
+
+            bucket = RateLimitBucket.objects.filter(key=key).annotate(available=refilled) \
+                .values_list('available', flat=True).first()
+            if bucket is not None:
+                return (1 - bucket) / rate
+            try:
+                RateLimitBucket.objects.create(key=key, tokens=burst - 1, updated=now)
+                return 0
+            except IntegrityError:
+                # Created by another worker since, take from it
+                continue
+
+    def compact(self, max_idle: float):
+        """
+        Deletes buckets idle long enough to have refilled, they behave exactly as missing ones
+        """
+        deleted = RateLimitBucket.objects.filter(updated__lt=time.time() - max_idle).delete()[0]
+        if deleted:
+            logger.info('admission - compacted %d idle rate limit bucket(s)', deleted)
+
+
+def get_buckets():
+    """
+    Returns the configured token bucket backend
+    """
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                config = settings.ADMISSION['rate_limit']
+                _buckets = import_string(config['backend'])(**config.get('options', {}))
+    return _buckets
+
+
+def limits_for(client: str) -> tuple:
+    """
+    :param client: API key id or client address
+    :return: (rate, burst) for client, rate is None for no limit
+    """
+    config = settings.ADMISSION['rate_limit']
+    limits = config['clients'].get(client, config)
+    return limits['rate'], limits['burst']
+
+
+def compact_if_due():
+    """
+    Deletes idle buckets at most once per settings.ADMISSION['rate_limit']['compact_interval'] seconds per process.
+    Called by the throttle, so buckets are compacted wherever they are taken from
+    """
+    global _last_compacted
+    config = settings.ADMISSION['rate_limit']
+    with _buckets_lock:
+        if time.monotonic() - _last_compacted < config['compact_interval']:
+            return
+        _last_compacted = time.monotonic()
+    if not config['rate']:
+        return
+    try:
+        get_buckets().compact(config['burst'] / config['rate'])
+    except Exception as e:
+        # A failed compaction must not fail the request that ran it, it is retried after compact_interval
+        logger.error('admission - compaction error: {}'.format(e))
+
+
+class CoDel:
+    """
+    Controlled Delay load shedding on request queueing delay.
+
+    Nothing is shed while the delay stays under target. Once it has been over target for a whole interval, a request
+    is shed, then more at a rising rate (interval / sqrt(count) apart) until the delay drops under target again.
+    """
+    def __init__(self, target: float, interval: float, clock=time.monotonic):
+        self.target = target
+        self.interval = interval
+        self.clock = clock
+        self._first_above = None
+        self._dropping = False
+        self._drop_next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def should_shed(self, delay: float) -> bool:
+        now = self.clock()
+        with self._lock:
+            if delay < self.target:
+                self._first_above = None
+                self._dropping = False
+                return False
+            if self._first_above is None:
+                self._first_above = now + self.interval
+                return False
+            if now < self._first_above:
+                return False
+
+            if not self._dropping:
+                self._dropping = True
+                # Resume near the previous drop rate if the last dropping state ended recently
+                self._count = self._count - 2 if self._count > 2 and now - self._drop_next < 8 * self.interval else 1
+                self._drop_next = now + self.interval / math.sqrt(self._count)
+                return True
+            if now >= self._drop_next:
+                self._count += 1
+                self._drop_next = now + self.interval / math.sqrt(self._count)
+                return True
+            return False
+
+
+def queue_delay(header: str, now: float = None):
+    """
+    Seconds a request waited before reaching Django, from the X-Request-Start header a proxy sets
+    :param header: t=<time> or <time> since the epoch, in seconds (nginx ${msec}), milliseconds or microseconds
+    :param now: time.time()
+    :return: float, or None if header is missing or invalid
+    """
+    if not header:
+        return None
+    value = header.strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        start = float(value)
+    except ValueError:
+        return None
+    while start > 1e11:
+        start /= 1000
+    return max(0.0, (time.time() if now is None else now) - start)
+
+
+def get_codel() -> CoDel:
+    global _codel
+    if _codel is None:
+        with _codel_lock:
+            if _codel is None:
+                config = settings.ADMISSION['shedding']
+                _codel = CoDel(config['target'], config['interval'])
+    return _codel
+
+
+def shed(delay: float) -> bool:
+    """
+    :param delay: queueing delay of the request, from queue_delay
+    :return: True if the request should be refused
+    """
+    if get_codel().should_shed(delay):
+        counters.increment('admission_shed')
+        return True
+    return False
+
+
+def shed_request(path: str, request_start: str) -> bool:
+    """
+    Records the queueing delay of a request under settings.ADMISSION['shedding']['path_prefix'] and decides whether to
+    refuse it, for AdmissionMiddleware and the async views alike
+    :param path: request path
+    :param request_start: X-Request-Start header, None if missing
+    :return: True if the request should be refused with 503
+    """
+    config = settings.ADMISSION['shedding']
+    if not config['enabled'] or not path.startswith(config['path_prefix']):
+        return False
+    delay = queue_delay(request_start)
+    if delay is None:
+        return False
+    metrics.histograms.observe('api_queue_delay_seconds', (), delay)
+    return shed(delay)
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+_last_compacted = float('-inf')
+_codel = None  # type: CoDel
+_codel_lock = threading.Lock()
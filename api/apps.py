@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from api import log
+
+        if settings.ASYNC_LOGGING['enabled']:
+            log.start_queue_listeners(settings.ASYNC_LOGGING['loggers'], settings.ASYNC_LOGGING['queue_size'])
@@ -0,0 +1,253 @@
+import asyncio
+import io
+import logging
+import math
+import sys
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from api import admission, fast_json, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _send_response(send, status_code: int, body: bytes, headers: list):
+    await send({'type': 'http.response.start', 'status': status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, status_code: int, data, headers: dict = None):
+    body = fast_json.dumps(data)
+    await _send_response(send, status_code, body, [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode('latin1')),
+    ] + [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in (headers or {}).items()])
+
+
+def _header(scope: dict, name: bytes):
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin1')
+    return None
+
+
+async def run_sync(func, *args):
+    """
+    Runs blocking code, such as database queries, on the default executor. The thread's database connection is closed
+    afterwards, as it would be at the end of a request
+    """
+    def call():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return await asyncio.get_event_loop().run_in_executor(None, call)
+
+
+class RequestBody(io.RawIOBase):
+    """
+    wsgi.input that receives the ASGI request body as the WSGI application reads it, from a thread pool thread
+    """
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more_body = True
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and self._more_body:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            self._buffer = message.get('body', b'')
+            self._more_body = message['type'] == 'http.request' and message.get('more_body', False)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _wsgi_environ(scope: dict, body) -> dict:
+    """
+    :param body: bytes, or a stream such as RequestBody
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body) if isinstance(body, bytes) else body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = '{},{}'.format(environ[name], value) if name in environ else value
+    return environ
+
+
+class ApiApplication:
+    """
+    ASGI application serving the routes in async_views natively on the event loop. Every other request is handed to
+    the Django WSGI application on a thread pool, so the whole url conf stays reachable.
+
+    Routed requests get what the sync views get from the middleware and DRF: they are shed as AdmissionMiddleware
+    would, then check_request (authentication, permissions and throttling, see async_views.check_request) runs on the
+    thread pool. Requests with a header in SYNC_HEADERS are handed to the sync views, which implement them.
+    """
+    # Idempotency-Key (api.idempotency) and Prefer: respond-async (views.Policy)
+    SYNC_HEADERS = (b'idempotency-key', b'prefer')
+
+    def __init__(self, routes: dict, wsgi_application, on_shutdown=None, check_request=None):
+        self.routes = routes
+        self.wsgi_application = wsgi_application
+        self.on_shutdown = on_shutdown
+        self.check_request = check_request
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        handler = self.routes.get(scope['path'])
+
+        if handler is None or any(_header(scope, name) is not None for name in self.SYNC_HEADERS):
+            await self._call_wsgi(scope, receive, send)
+        elif admission.shed_request(scope['path'], _header(scope, b'x-request-start')):
+            await _send_json(send, 503, {'message': 'Service unavailable'}, {
+                'Retry-After': str(math.ceil(settings.ADMISSION['shedding']['interval']))
+            })
+        elif scope['method'] != 'POST':
+            await _send_json(send, 405, {'detail': 'Method "{}" not allowed.'.format(scope['method'])})
+        else:
+            await self._call_handler(handler, scope, await _read_body(receive), send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown is not None:
+                    await self.on_shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _call_handler(self, handler, scope: dict, body: bytes, send):
+        path = scope['path']
+        start = time.perf_counter()
+        token = metrics.endpoint.set(path)
+        try:
+            refused = None
+            if self.check_request is not None:
+                refused = await run_sync(self.check_request, _wsgi_environ(scope, body))
+            if refused is not None:
+                status_code, response_data, headers = refused
+            else:
+                try:
+                    data = fast_json.loads(body)
+                except ValueError as e:
+                    await _send_json(send, 400, {'detail': 'JSON parse error - {}'.format(e)})
+                    return
+                # (status code, response data) with optional response headers
+                status_code, response_data, *headers = await handler(data)
+                headers = headers[0] if headers else {}
+        except Exception as e:
+            logger.error('ApiApplication - unhandled error: {}'.format(e))
+            status_code, response_data, headers = 500, {'message': 'Error'}, {}
+        finally:
+            metrics.endpoint.reset(token)
+
+        await _send_json(send, status_code, response_data, headers)
+        metrics.histograms.observe('api_request_duration_seconds', (
+            ('endpoint', path), ('status', str(status_code))
+        ), time.perf_counter() - start)
+
+    async def _call_wsgi(self, scope: dict, receive, send):
+        """
+        Runs the WSGI application on the thread pool. The request body is read as the application asks for it, and
+        each chunk of the response is sent as it is produced, so streamed responses (NDJSON, Server-Sent Events) stay
+        streamed
+        """
+        loop = asyncio.get_event_loop()
+        environ = _wsgi_environ(scope, io.BufferedReader(RequestBody(receive, loop)))
+        messages = asyncio.Queue()
+        done = loop.run_in_executor(
+            None, self._run_wsgi, environ, lambda message: loop.call_soon_threadsafe(messages.put_nowait, message)
+        )
+
+        started = False
+        while True:
+            message = await messages.get()
+            if message is None:
+                break
+            await send(message)
+            started = True
+
+        try:
+            await done
+        except Exception as e:
+            logger.error('ApiApplication - unhandled WSGI error: {}'.format(e))
+            if not started:
+                await _send_json(send, 500, {'message': 'Error'})
+                return
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    def _run_wsgi(self, environ: dict, put):
+        """
+        Puts the ASGI messages of the response as the application produces them, then None
+        """
+        response = {}
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+        def start():
+            # The status and headers go out with the first non-empty chunk, or at the end
+            if not started:
+                put({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                started.append(True)
+
+        try:
+            iterable = self.wsgi_application(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        start()
+                        put({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                start()
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            put(None)
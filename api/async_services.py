@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import threading
+import time
+from django.conf import settings
+from requests import Response
+from zeep.wsdl.utils import etree_to_string
+from api import audit, circuit_breaker
+from api.log import Payload, payload_logger
+from api.metrics import timed
+from api.services import SoapService, Result, XStreamError, function_type_of
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSoapService:
+    """
+    asyncio counterpart of SoapService.process_message.
+
+    Envelope building and reply decoding reuse a zeep client built the same way as SoapService, only the HTTP round
+    trip is async (aiohttp), so one event loop can keep many XStream calls in flight. One instance per event loop.
+    """
+    def __init__(self):
+        self._session = None
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = SoapService._establish_client()
+        return self._client
+
+    def _get_session(self):
+        if self._session is None:
+            import aiohttp
+
+            config = settings.XSTREAM_TRANSPORT
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.XSTREAM_ASYNC['max_connections']),
+                timeout=aiohttp.ClientTimeout(sock_connect=config['connect_timeout'], sock_read=config['read_timeout'])
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _post_to_xstream(self, xml: str) -> str:
+        """
+        Posts xml to xstream without blocking the event loop, recording the exchange in the audit trail
+        :param xml:
+        :return: str xmlreply
+        """
+        payload_logger.debug('AsyncSoapService - _post_to_xstream() xml: %s', Payload(xml))
+        client = self._get_client()
+        service = client.service
+        start = time.perf_counter()
+        try:
+            with timed('post_to_xstream', function_type_of(xml)):
+                envelope, headers = service._binding._create(
+                    'processMessage', (*settings.XSTREAM_CREDENTIALS, xml, 0), {}, client=client,
+                    options=service._binding_options
+                )
+                async with self._get_session().post(
+                        service._binding_options['address'], data=etree_to_string(envelope), headers=headers) as reply:
+                    response = Response()
+                    response._content = await reply.read()
+                    response.status_code = reply.status
+                    response.headers = reply.headers
+                    response.encoding = reply.charset
+                response = service._binding.process_reply(client, service._binding.get('processMessage'), response)
+        except Exception as e:
+            message = 'Failed to post to xstream, error: {}'.format(e)
+            logger.error(message)
+            audit.record(xml, error=message, duration=time.perf_counter() - start)
+            raise XStreamError(message, sent=not _never_sent(e))
+
+        audit.record(xml, response, duration=time.perf_counter() - start)
+        return response
+
+    async def _post_with_retry(self, xml: str) -> str:
+        """
+        Async equivalent of SoapService._post_with_retry, sharing its breakers and retry budget
+        """
+        function_type = function_type_of(xml)
+        breaker = circuit_breaker.get_breaker(function_type)
+        retry_policy = circuit_breaker.get_retry_policy()
+        retry_policy.budget.record_request()
+
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                response = await self._post_to_xstream(xml)
+            except XStreamError:
+                breaker.record_failure()
+                if not retry_policy.should_retry(function_type, attempt):
+                    raise
+                await asyncio.sleep(retry_policy.delay(attempt))
+                attempt += 1
+                continue
+
+            breaker.record_success()
+            return response
+
+    async def process_message(self, xml: str) -> Result:
+        response = await self._post_with_retry(xml)
+        with timed('handle_response', function_type_of(xml)):
+            return SoapService._handle_response(response)
+
+
+def _never_sent(error: Exception) -> bool:
+    """
+    aiohttp counterpart of api.transport.never_sent
+    """
+    import aiohttp
+    return isinstance(error, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError))
@@ -0,0 +1,130 @@
+import logging
+import math
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from api import jobs, outbox, views
+from api.asgi import run_sync
+from api.async_services import AsyncSoapService
+from api.circuit_breaker import CircuitOpenError
+from api.services import validate_json, build_prospect_xml, build_policy_xml, function_type_of, \
+    may_have_reached_xstream
+from api.parsers import prospect_schema, policy_schema
+
+
+logger = logging.getLogger(__name__)
+
+soap_service = AsyncSoapService()
+
+# Response headers of a refused check that are passed on to the client
+CHECK_HEADERS = ('WWW-Authenticate', 'Retry-After')
+
+
+def check_request(environ: dict):
+    """
+    Runs the authentication, permission and throttle checks of the sync view for the request's path. Blocking (the
+    throttle may query the database), run it with api.asgi.run_sync
+    :param environ: WSGI environ of the request
+    :return: None if allowed, otherwise (status code, response data, headers)
+    """
+    view = sync_views[environ['PATH_INFO']]()
+    view.args, view.kwargs = (), {}
+    request = view.initialize_request(WSGIRequest(environ))
+    view.request = request
+    view.headers = view.default_response_headers
+    try:
+        view.initial(request)
+    except APIException as e:
+        response = view.handle_exception(e)
+        return response.status_code, response.data, {k: v for k, v in response.items() if k in CHECK_HEADERS}
+    return None
+
+
+async def defer(xml: str, key: str, error: IOError):
+    """
+    Async equivalent of views.defer
+    :return: (status code, response data, headers)
+    """
+    if not settings.OUTBOX['enabled']:
+        if isinstance(error, CircuitOpenError):
+            return unavailable(error.retry_after)
+        raise error
+    if may_have_reached_xstream(error):
+        logger.error('{} - not stored in the outbox, XStream may have processed it, error: {}'.format(
+            function_type_of(xml), error))
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {'message': 'Error'}, {}
+    return stored(await run_sync(outbox.store, xml, key, str(error)))
+
+
+def unavailable(retry_after: float):
+    return status.HTTP_503_SERVICE_UNAVAILABLE, {'message': 'Service unavailable'}, {
+        'Retry-After': str(math.ceil(retry_after))
+    }
+
+
+def stored(message):
+    return status.HTTP_202_ACCEPTED, {'outbox': message.id}, {'Location': reverse('outbox', args=[message.id])}
+
+
+async def prospect(prospect_data: dict):
+    """
+    Async equivalent of views.Prospect.post
+    :return: (status code, response data) or (status code, response data, headers)
+    """
+    is_validated = validate_json(prospect_data, prospect_schema)
+
+    if not is_validated:
+        return status.HTTP_400_BAD_REQUEST, {'message': 'Malformed request'}
+
+    xml = build_prospect_xml(prospect_data)
+    try:
+        prospect_created = await soap_service.process_message(xml)
+    except IOError as e:
+        return await defer(xml, '', e)
+
+    if not prospect_created.status:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {'message': 'Error'}
+
+    return status.HTTP_200_OK, prospect_created.data
+
+
+async def policy(policy_data: dict):
+    """
+    Async equivalent of views.Policy.post, requests with a Prefer header are served by it (see api.asgi)
+    :return: (status code, response data) or (status code, response data, headers)
+    """
+    is_validated = validate_json(policy_data, policy_schema)
+
+    if not is_validated:
+        return status.HTTP_400_BAD_REQUEST, {'message': 'Malformed request'}
+
+    if settings.JOB_QUEUE['policy_async']:
+        job = await run_sync(jobs.enqueue, 'add_policy', policy_data)
+        return status.HTTP_202_ACCEPTED, {'job': str(job.id)}, {'Location': reverse('job', args=[job.id])}
+
+    xml = build_policy_xml(policy_data)
+    ref = policy_data.get('Ref', '')
+    if settings.OUTBOX['enabled'] and ref and await run_sync(outbox.has_pending, ref):
+        # Earlier messages for the client are still waiting, this one must follow them
+        return stored(await run_sync(outbox.store, xml, ref, 'Queued behind earlier messages'))
+
+    try:
+        await soap_service.process_message(xml)
+    except IOError as e:
+        return await defer(xml, ref, e)
+
+    return status.HTTP_200_OK, policy_data
+
+
+routes = {
+    '/api/prospect': prospect,
+    '/api/risk': policy,
+}
+
+# Sync view whose checks each route applies, see check_request
+sync_views = {
+    '/api/prospect': views.Prospect,
+    '/api/risk': views.Policy,
+}
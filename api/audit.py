@@ -0,0 +1,451 @@
+"""
+Audit trail of XStream traffic: every processMessage request, its xmlreply or error, and how long it took.
+
+Callers only queue the record, a background thread per process writes them to append-only segment files in
+settings.XSTREAM_AUDIT['dir'] as zlib compressed blocks of json lines. Each process appends to its own active segment,
+named <created ms>-<pid>-<n>.seg. Once a segment reaches segment_bytes (or the process exits) it is sealed: a sorted,
+fixed width index of its keys (refno:<Refno>, polref:<Polref> and function_type:<char20.1>) to block offsets is
+written beside it as .idx, so a lookup binary searches each sealed segment rather than reading it.
+
+The writer also deletes sealed segments older than retention_days, seals segments left behind by processes that have
+gone, and merges runs of small sealed segments, e.g. those sealed at each restart.
+"""
+import atexit
+import logging
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from django.conf import settings
+from api import fast_json
+from api.metrics import counters
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+BLOCK_HEADER = struct.Struct('>I')  # compressed length of the block that follows
+INDEX_ENTRY = struct.Struct('>60sQ')  # key, utf-8 and null padded, and the offset of a block holding it
+
+_KEY_ELEMENTS = re.compile(r'<(refno|polref)>([^<]+)</\1>', re.IGNORECASE)
+_FUNCTION_TYPE = re.compile(r'<char20\.1>([^<]*)</char20\.1>')
+
+
+def record_keys(request: str, response: str = None) -> list:
+    """
+    :return: index keys of a call, from the Refno and Polref elements of its request and reply
+    """
+    function_type = _FUNCTION_TYPE.search(request)
+    keys = {'function_type:{}'.format(function_type.group(1) if function_type else '')}
+    for xml in (request, response or ''):
+        for element, value in _KEY_ELEMENTS.findall(xml):
+            if value.strip():
+                keys.add('{}:{}'.format(element.lower(), value.strip()))
+    return sorted(keys)
+
+
+def _pack_key(key: str) -> bytes:
+    return key.encode('utf-8')[:60].ljust(60, b'\0')
+
+
+def read_blocks(path: str):
+    """
+    Yields (offset, records) for each complete block of a segment, stopping at a torn one left by a crash
+    """
+    with open(path, 'rb') as f:
+        offset = 0
+        while True:
+            header = f.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                return
+            length = BLOCK_HEADER.unpack(header)[0]
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield offset, _decode(data)
+            offset += BLOCK_HEADER.size + length
+
+
+def _complete_length(path: str) -> int:
+    """
+    :return: size of a segment up to the end of its last complete block
+    """
+    length = 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                return length
+            size = BLOCK_HEADER.unpack(header)[0]
+            f.seek(size, os.SEEK_CUR)
+            if f.tell() > os.fstat(f.fileno()).st_size:
+                return length
+            length += BLOCK_HEADER.size + size
+
+
+def _read_block(f, offset: int) -> list:
+    f.seek(offset)
+    length = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))[0]
+    return _decode(f.read(length))
+
+
+def _encode(records: list) -> bytes:
+    data = zlib.compress(b''.join(fast_json.dumps(record) + b'\n' for record in records))
+    return BLOCK_HEADER.pack(len(data)) + data
+
+
+def _decode(data: bytes) -> list:
+    return [fast_json.loads(line) for line in zlib.decompress(data).splitlines()]
+
+
+def write_index(path: str, entries):
+    """
+    :param path: .idx path
+    :param entries: iterable of (key, block offset)
+    """
+    with open(path + '.tmp', 'wb') as f:
+        f.write(b''.join(sorted({INDEX_ENTRY.pack(_pack_key(key), offset) for key, offset in entries})))
+    os.replace(path + '.tmp', path)
+
+
+def search_index(path: str, key: str) -> list:
+    """
+    Binary searches a sealed segment's index
+    :return: offsets of the blocks holding key
+    """
+    target = _pack_key(key)
+    offsets = []
+    with open(path, 'rb') as f:
+        count = os.fstat(f.fileno()).st_size // INDEX_ENTRY.size
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            f.seek(middle * INDEX_ENTRY.size)
+            if INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        f.seek(low * INDEX_ENTRY.size)
+        for _ in range(low, count):
+            entry_key, offset = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+            if entry_key != target:
+                break
+            offsets.append(offset)
+    return offsets
+
+
+def _index_path(segment: str) -> str:
+    return segment[:-len('.seg')] + '.idx'
+
+
+def _is_alive(pid: int) -> bool:
+    if os.name != 'posix':
+        # No safe liveness check, leave other processes' segments to them
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AuditStore:
+    """
+    Segment files of one audit directory, appended to by this process and readable by any.
+    """
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, block_records: int = 256,
+                 retention_days: float = 90):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.block_records = block_records
+        self.retention_days = retention_days
+        self._lock = threading.RLock()
+        self._pid = None
+        self._sequence = 0
+        self._active = None
+        self._file = None
+        self._index = {}
+
+    def _new_segment(self, created: int = None, label: str = '') -> str:
+        self._sequence += 1
+        return os.path.join(self.directory, '{:013d}-{}-{}{}.seg'.format(
+            int(time.time() * 1000) if created is None else created, os.getpid(), label, self._sequence))
+
+    def append(self, records: list):
+        """
+        Appends records to the active segment as one block, sealing it once it reaches segment_bytes
+        :param records: dicts with a 'keys' list
+        """
+        block = _encode(records)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked, the parent's segment stays the parent's
+                self._pid, self._file, self._index = os.getpid(), None, {}
+            if self._file is None:
+                os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                self._active = self._new_segment()
+                self._file = open(self._active, 'ab')
+            offset = self._file.tell()
+            self._file.write(block)
+            self._file.flush()
+            for record in records:
+                for key in record['keys']:
+                    self._index.setdefault(key, set()).add(offset)
+            if offset + len(block) >= self.segment_bytes:
+                self.seal()
+
+    def seal(self):
+        """
+        Closes and indexes the active segment, the next append starts a new one
+        """
+        with self._lock:
+            if self._file is None or self._pid != os.getpid():
+                return
+            self._file.close()
+            write_index(_index_path(self._active), (
+                (key, offset) for key, offsets in self._index.items() for offset in offsets
+            ))
+            self._file, self._active, self._index = None, None, {}
+
+    def segments(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(names) if name.endswith('.seg')]
+
+    def find(self, refno: str = None, polref: str = None, function_type: str = None, limit: int = 100) -> list:
+        """
+        Looks records up through the index of the most selective key given
+        :return: up to limit records, newest first
+        """
+        if refno:
+            key = 'refno:{}'.format(refno)
+        elif polref:
+            key = 'polref:{}'.format(polref)
+        elif function_type:
+            key = 'function_type:{}'.format(function_type)
+        else:
+            raise ValueError('find needs a refno, polref or function_type')
+        wanted = {'refno:{}'.format(refno) if refno else None, 'polref:{}'.format(polref) if polref else None,
+                  'function_type:{}'.format(function_type) if function_type else None} - {None}
+
+        with self._lock:
+            active = self._active if self._pid == os.getpid() else None
+            active_offsets = sorted(self._index.get(key, ()))
+
+        found = []
+        for segment in reversed(self.segments()):
+            try:
+                if segment == active:
+                    blocks = self._blocks_at(segment, active_offsets)
+                elif os.path.exists(_index_path(segment)):
+                    blocks = self._blocks_at(segment, search_index(_index_path(segment), key))
+                else:
+                    # Still being written by another process, not indexed yet
+                    blocks = [records for offset, records in read_blocks(segment)]
+            except FileNotFoundError:
+                # Merged or expired meanwhile
+                continue
+            found.extend(
+                record for records in blocks for record in records if wanted.issubset(record['keys'])
+            )
+            if len(found) >= limit:
+                break
+        found.sort(key=lambda record: record['time'], reverse=True)
+        return found[:limit]
+
+    @staticmethod
+    def _blocks_at(segment: str, offsets: list) -> list:
+        if not offsets:
+            return []
+        with open(segment, 'rb') as f:
+            return [_read_block(f, offset) for offset in offsets]
+
+    def compact(self):
+        """
+        Deletes expired segments, seals orphaned ones and merges small ones. Skipped while another process is at it
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        with open(os.path.join(self.directory, '.compact.lock'), 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return
+            with self._lock:
+                active = self._active if self._pid == os.getpid() else None
+            expired = time.time() - self.retention_days * 24 * 60 * 60
+            run = []
+            for segment in self.segments():
+                if segment == active or not os.path.exists(_index_path(segment)) and \
+                        _is_alive(int(os.path.basename(segment).split('-')[1])):
+                    # Still being written, merged segments must not span it
+                    self._merge(run)
+                    run = []
+                    continue
+                if not os.path.exists(_index_path(segment)):
+                    self._seal_orphan(segment)
+                if os.path.getmtime(segment) < expired:
+                    self._delete(segment)
+                    counters.increment('audit_segments_expired')
+                    continue
+                if run and sum(os.path.getsize(path) for path in run) + os.path.getsize(segment) > self.segment_bytes:
+                    self._merge(run)
+                    run = []
+                run.append(segment)
+            self._merge(run)
+
+    def _seal_orphan(self, segment: str):
+        length = _complete_length(segment)
+        if os.path.getsize(segment) > length:
+            # Drops the torn last block of a process that died mid-write
+            with open(segment, 'r+b') as f:
+                f.truncate(length)
+        write_index(_index_path(segment), (
+            (key, offset) for offset, records in read_blocks(segment) for record in records for key in record['keys']
+        ))
+        logger.info('audit - sealed orphaned segment %s', segment)
+
+    def _merge(self, run: list):
+        if len(run) < 2:
+            return
+        with self._lock:
+            merged = self._new_segment(int(os.path.basename(run[0]).split('-')[0]), 'm')
+        # Keeps the age of the newest record, which retention goes by
+        modified = max(os.path.getmtime(segment) for segment in run)
+        records = [record for segment in run for offset, block in read_blocks(segment) for record in block]
+        entries = []
+        with open(merged + '.tmp', 'wb') as f:
+            for start in range(0, len(records), self.block_records):
+                block = records[start:start + self.block_records]
+                entries.extend((key, f.tell()) for record in block for key in record['keys'])
+                f.write(_encode(block))
+        os.utime(merged + '.tmp', (modified, modified))
+        write_index(_index_path(merged), entries)
+        os.replace(merged + '.tmp', merged)
+        for segment in run:
+            self._delete(segment)
+        counters.increment('audit_segments_merged', len(run))
+
+    @staticmethod
+    def _delete(segment: str):
+        for path in (_index_path(segment), segment):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def record(request: str, response: str = None, error: str = None, duration: float = 0):
+    """
+    Queues the audit record of a processMessage call, dropped (and counted in audit_records_dropped) if the writer
+    is behind by settings.XSTREAM_AUDIT['queue_size'] records
+    :param request: xmlexecute message
+    :param response: xmlreply, None if the call failed
+    :param error: why the call failed
+    :param duration: seconds
+    """
+    if not settings.XSTREAM_AUDIT['enabled']:
+        return
+    try:
+        _get_queue().put_nowait((time.time(), request, None if response is None else str(response), error, duration))
+    except queue.Full:
+        counters.increment('audit_records_dropped')
+
+
+def _write(records: queue.Queue, store: AuditStore, compact_interval: float):
+    last_compacted = time.monotonic()
+    while True:
+        try:
+            item = records.get(timeout=1)
+        except queue.Empty:
+            if time.monotonic() - last_compacted >= compact_interval:
+                last_compacted = time.monotonic()
+                try:
+                    store.compact()
+                except Exception as e:
+                    logger.error('audit - compaction error: {}'.format(e))
+            continue
+
+        batch = [item]
+        while item is not None and len(batch) < store.block_records:
+            try:
+                item = records.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        stop = batch[-1] is None
+        batch = [entry for entry in batch if entry is not None]
+        try:
+            if batch:
+                store.append([{
+                    'time': timestamp, 'keys': record_keys(request, response), 'duration': duration,
+                    'request': request, 'response': response, 'error': error
+                } for timestamp, request, response, error, duration in batch])
+            if stop:
+                store.seal()
+                return
+        except Exception as e:
+            counters.increment('audit_records_dropped', len(batch))
+            logger.error('audit - write error: {}'.format(e))
+
+
+def _get_queue() -> queue.Queue:
+    global _queue, _queue_pid, _writer
+    if _queue_pid != os.getpid():
+        with _queue_lock:
+            if _queue_pid != os.getpid():
+                config = settings.XSTREAM_AUDIT
+                records = queue.Queue(config['queue_size'])
+                _writer = threading.Thread(
+                    target=_write, args=(records, get_store(), config['compact_interval']), daemon=True,
+                    name='audit-writer'
+                )
+                _writer.start()
+                _queue, _queue_pid = records, os.getpid()
+    return _queue
+
+
+@atexit.register
+def stop_writer():
+    """
+    Writes the records still queued and seals the active segment
+    """
+    global _queue_pid
+    with _queue_lock:
+        if _queue_pid != os.getpid():
+            return
+        _queue_pid = None
+    try:
+        _queue.put(None, timeout=5)
+    except queue.Full:
+        return
+    _writer.join(5)
+
+
+def get_store() -> AuditStore:
+    global _store
+    if _store is None:
+        with _queue_lock:
+            if _store is None:
+                config = settings.XSTREAM_AUDIT
+                _store = AuditStore(config['dir'], config['segment_bytes'], config['block_records'],
+                                    config['retention_days'])
+    return _store
+
+
+_store = None  # type: AuditStore
+_queue = None  # type: queue.Queue
+_queue_pid = None
+_writer = None  # type: threading.Thread
+_queue_lock = threading.RLock()
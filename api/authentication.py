@@ -0,0 +1,51 @@
+import hashlib
+import hmac
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
+
+
+HEADER = 'HTTP_X_API_KEY'
+
+
+class ApiClient:
+    """
+    request.user of a request authenticated by ApiKeyAuthentication, so no user model (django.contrib.auth) is needed
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, key_id: str):
+        self.key_id = key_id
+
+    def __str__(self):
+        return self.key_id
+
+
+class ApiKeyAuthentication(BaseAuthentication):
+    """
+    Authenticates an `X-Api-Key: <key>` header against settings.API_KEYS, request.auth is the key id (a hash prefix
+    that is safe to log)
+    """
+    def authenticate(self, request):
+        key = request.META.get(HEADER)
+        if not key:
+            return None
+        encoded = key.encode('utf-8')
+        for api_key in settings.API_KEYS:
+            if hmac.compare_digest(encoded, api_key.encode('utf-8')):
+                key_id = hashlib.sha256(encoded).hexdigest()[:12]
+                return ApiClient(key_id), key_id
+        raise AuthenticationFailed('Invalid API key')
+
+    def authenticate_header(self, request):
+        return 'Api-Key'
+
+
+class HasApiKey(BasePermission):
+    """
+    Requires an API key once settings.API_KEYS has any, otherwise every request is allowed
+    """
+    def has_permission(self, request, view):
+        return not settings.API_KEYS or isinstance(request.user, ApiClient)
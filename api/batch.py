@@ -0,0 +1,99 @@
+import logging
+from collections import namedtuple
+from django.conf import settings
+from api.services import SoapService, XStreamParser
+
+
+logger = logging.getLogger(__name__)
+
+# refno_from is the index of an earlier operation whose Refno this one is for, or None
+Operation = namedtuple('Operation', ['parser', 'refno_from'])
+
+
+class Batch:
+    """
+    Runs several XStream operations in as few xmlexecute envelopes as settings.XSTREAM_BATCH['merge'] allows.
+
+    Consecutive operations whose function types match a merge rule are sent as one envelope of the rule's function
+    type, with the client (p.cm) of the first and the policy (apmpolicy) of the last. The remaining envelopes are sent
+    in order over the worker's keep-alive connection to XStream, an operation that needs the Refno of a failed one is
+    not sent.
+    """
+    def __init__(self, merge_rules=None):
+        self.merge_rules = [
+            (tuple(rule['operations']), rule['function_type'])
+            for rule in (settings.XSTREAM_BATCH['merge'] if merge_rules is None else merge_rules)
+        ]
+        self.operations = []
+
+    def add(self, parser: XStreamParser, refno_from: int = None) -> int:
+        """
+        :param parser: the operation's message
+        :param refno_from: index of an earlier operation, whose Refno is added to parser before it is sent
+        :return: index of the operation
+        """
+        if refno_from is not None and not 0 <= refno_from < len(self.operations):
+            raise ValueError('refno_from must be the index of an earlier operation')
+        self.operations.append(Operation(parser, refno_from))
+        return len(self.operations) - 1
+
+    def plan(self) -> list:
+        """
+        :return: list of (function type of the envelope, list of operation indexes it carries)
+        """
+        envelopes = []
+        index = 0
+        while index < len(self.operations):
+            for function_types, merged_type in self.merge_rules:
+                end = index + len(function_types)
+                if tuple(op.parser.function_type for op in self.operations[index:end]) == function_types and \
+                        all(op.refno_from is None or op.refno_from >= index for op in self.operations[index:end]):
+                    envelopes.append((merged_type, list(range(index, end))))
+                    index = end
+                    break
+            else:
+                envelopes.append((self.operations[index].parser.function_type, [index]))
+                index += 1
+        return envelopes
+
+    def _merge(self, function_type: str, indexes: list) -> XStreamParser:
+        first, last = self.operations[indexes[0]].parser, self.operations[indexes[-1]].parser
+        parser = XStreamParser()
+        parser.add_queue(first.queue)
+        parser.add_apm(first.apm)
+        for k, v in last.apmpolicy.items():
+            parser.apmpolicy[k] = v
+        parser.add_function_type(function_type)
+        return parser
+
+    def run(self) -> list:
+        """
+        Sends the batch, stopping at the first envelope that fails.
+
+        An IOError sending the first envelope is raised, as nothing was done yet. One sending a later envelope is
+        returned for that envelope's operations instead, so the caller still learns what the earlier ones created.
+        :return: list of Result (or IOError) per operation, None for operations that were not sent
+        """
+        results = [None] * len(self.operations)
+        for envelope, (function_type, indexes) in enumerate(self.plan()):
+            if len(indexes) > 1:
+                parser = self._merge(function_type, indexes)
+            else:
+                operation = self.operations[indexes[0]]
+                parser = operation.parser
+                if operation.refno_from is not None:
+                    parser.add_ref(results[operation.refno_from].data['Refno'])
+
+            try:
+                result = SoapService.process_message(parser.parse_to_xml())
+            except IOError as e:
+                if envelope == 0:
+                    raise
+                result = e
+            for index in indexes:
+                results[index] = result
+            if isinstance(result, IOError) or result.status is not True:
+                logger.info('Batch - {} failed, {} operation(s) not sent'.format(
+                    function_type, len(self.operations) - indexes[-1] - 1))
+                break
+        return results
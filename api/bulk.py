@@ -0,0 +1,119 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from api import admission, fast_json, scheduler, validators
+from api.parsers import prospect_schema
+from api.services import create_prospect
+
+
+logger = logging.getLogger(__name__)
+
+
+# Admission bucket (api.admission) every import takes from before each create call, so concurrent imports share one
+# rate towards XStream rather than each getting their own. With the default MemoryBuckets that is per process, imports
+# from the endpoint and the command (or different workers) only share it with DatabaseBuckets
+RATE_LIMIT_BUCKET = 'xstream:bulk_import'
+
+
+def acquire(rate: float = None, burst: int = 1):
+    """
+    Blocks until the shared bulk import bucket allows a call
+    :param rate: calls per second, None for no limit
+    :param burst: bucket size
+    """
+    if not rate:
+        return
+    buckets = admission.get_buckets()
+    while True:
+        wait = buckets.take(RATE_LIMIT_BUCKET, rate, burst)
+        if not wait:
+            return
+        time.sleep(wait)
+
+
+def _create_row(row_number: int, prospect_json: dict) -> dict:
+    try:
+        with scheduler.priority(settings.XSTREAM_SCHEDULER['background_class']):
+            result = create_prospect(prospect_json)
+    except Exception as e:
+        logger.error('bulk - row {} failed, error: {}'.format(row_number, e))
+        return {'row': row_number, 'status': 'error', 'message': str(e)}
+
+    if result.status is True:
+        return {'row': row_number, 'status': 'created', 'Refno': result.data['Refno']}
+    errors = [error.message for error in result.data] if isinstance(result.data, list) else []
+    return {'row': row_number, 'status': 'error', 'message': 'Error', 'errors': errors}
+
+
+def import_prospects(rows, workers: int, rate_limit: float = None):
+    """
+    Validates each row against prospect_schema and creates the valid ones on a bounded worker pool.
+
+    Results are yielded in input order, and at most 2 * workers rows are held at once, so memory stays flat
+    whatever the size of rows.
+    :param rows: iterable of prospect dicts, or Exception instances for rows that could not be read
+    :param workers: max concurrent create_prospect calls
+    :param rate_limit: max create_prospect calls per second across every import, None for no limit
+    :return: generator of per row result dicts
+    """
+    compiled = validators.registry.get(prospect_schema)
+    window = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for row_number, row in enumerate(rows, start=1):
+            if isinstance(row, Exception):
+                window.append({'row': row_number, 'status': 'invalid', 'errors': [str(row)]})
+            else:
+                errors = compiled.errors(row)
+                if errors:
+                    window.append({'row': row_number, 'status': 'invalid', 'errors': errors})
+                else:
+                    # Taken before submitting so the worker threads never touch the bucket backend
+                    acquire(rate_limit, burst=workers)
+                    window.append(executor.submit(_create_row, row_number, row))
+
+            while window and (len(window) >= 2 * workers or _is_done(window[0])):
+                yield _resolve(window.popleft())
+
+        while window:
+            yield _resolve(window.popleft())
+
+
+def _is_done(item) -> bool:
+    return not isinstance(item, Future) or item.done()
+
+
+def _resolve(item) -> dict:
+    return item.result() if isinstance(item, Future) else item
+
+
+def read_jsonl(lines):
+    """
+    Yields a dict per non blank line, or the ValueError for lines that are not valid json
+    :param lines: iterable of str or bytes
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield fast_json.loads(line)
+        except ValueError as e:
+            yield ValueError('JSON parse error - {}'.format(e))
+
+
+def read_csv(rows):
+    """
+    Yields a dict per csv.DictReader row, dropping empty cells so optional fields are omitted rather than blank
+    :param rows: csv.DictReader
+    """
+    for row in rows:
+        yield {k: v for k, v in row.items() if k is not None and v not in (None, '')}
+
+
+def to_ndjson(results):
+    for result in results:
+        yield fast_json.dumps(result) + b'\n'
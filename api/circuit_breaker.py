@@ -0,0 +1,195 @@
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from api.metrics import counters, gauges
+from api.response_cache import UNCACHEABLE_PREFIXES
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Gauge values for xstream_circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(IOError):
+    """
+    Raised instead of calling XStream while a circuit is open
+    """
+    def __init__(self, function_type: str, retry_after: float):
+        super().__init__('Circuit open for {}, retry after {:.0f}s'.format(function_type, retry_after))
+        self.function_type = function_type
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one XStream function type.
+
+    failure_threshold consecutive failures open the circuit, calls then fail fast for reset_timeout seconds. After
+    that one probe call is let through per reset_timeout (half-open), its success closes the circuit and its failure
+    re-opens it. A probe that never reports back only holds the circuit half-open until the next probe is due.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._next_probe = 0
+        self._lock = threading.Lock()
+        gauges.set('xstream_circuit_state:{}'.format(name), STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning('CircuitBreaker - {} {} -> {}'.format(self.name, self.state, state))
+            self.state = state
+            gauges.set('xstream_circuit_state:{}'.format(self.name), STATE_VALUES[state])
+            if state == OPEN:
+                counters.increment('xstream_circuit_opened:{}'.format(self.name))
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call must not be made
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = self.clock()
+            if now >= self._next_probe:
+                self._set_state(HALF_OPEN)
+                self._next_probe = now + self.reset_timeout
+                return
+            retry_after = self._next_probe - now
+
+        counters.increment('xstream_circuit_rejected:{}'.format(self.name))
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._set_state(OPEN)
+                self._next_probe = self.clock() + self.reset_timeout
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of requests, so retrying cannot multiply load on an already struggling XStream.
+
+    Each request deposits ratio tokens and each retry spends one. min_tokens are always available, so a quiet process
+    can still retry, and at most max_tokens are saved up.
+    """
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.max_tokens = max(max_tokens, min_tokens)
+        self._tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed XStream call is retried, and how long to wait first
+    """
+    def __init__(self, budget: RetryBudget, max_retries: int = 2, backoff_base: float = 0.1, backoff_cap: float = 2):
+        self.budget = budget
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    @staticmethod
+    def is_safe(function_type: str) -> bool:
+        """
+        create-* and convert-* change state in OpenGi, a retry after a lost reply could apply them twice
+        """
+        return not function_type.startswith(UNCACHEABLE_PREFIXES)
+
+    def should_retry(self, function_type: str, attempt: int) -> bool:
+        """
+        :param function_type:
+        :param attempt: 0 based number of the attempt that just failed
+        :return: bool
+        """
+        if attempt >= self.max_retries or not self.is_safe(function_type):
+            return False
+        if not self.budget.try_spend():
+            counters.increment('xstream_retry_budget_exhausted')
+            return False
+        counters.increment('xstream_retries:{}'.format(function_type))
+        return True
+
+    def delay(self, attempt: int) -> float:
+        """
+        Full jitter exponential backoff, spreads retries from many workers instead of synchronising them
+        """
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+
+def get_breaker(function_type: str) -> CircuitBreaker:
+    breaker = _breakers.get(function_type)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(function_type)
+            if breaker is None:
+                config = settings.XSTREAM_CIRCUIT_BREAKER
+                breaker = _breakers[function_type] = CircuitBreaker(
+                    function_type, failure_threshold=config['failure_threshold'],
+                    reset_timeout=config['reset_timeout']
+                )
+    return breaker
+
+
+def get_retry_policy() -> RetryPolicy:
+    global _retry_policy
+    if _retry_policy is None:
+        with _lock:
+            if _retry_policy is None:
+                config = settings.XSTREAM_CIRCUIT_BREAKER
+                _retry_policy = RetryPolicy(
+                    RetryBudget(config['retry_budget'], config['retry_budget_min']),
+                    max_retries=config['max_retries'],
+                    backoff_base=config['backoff_base'],
+                    backoff_cap=config['backoff_cap']
+                )
+    return _retry_policy
+
+
+def states() -> dict:
+    """
+    :return: dict of function type to breaker state
+    """
+    return {name: breaker.state for name, breaker in list(_breakers.items())}
+
+
+def reset():
+    global _retry_policy
+    with _lock:
+        _breakers.clear()
+        _retry_policy = None
+
+
+_breakers = {}
+_retry_policy = None  # type: RetryPolicy
+_lock = threading.Lock()
@@ -0,0 +1,147 @@
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from api.metrics import counters
+
+
+logger = logging.getLogger(__name__)
+
+
+class PooledClient:
+    def __init__(self, client):
+        self.client = client
+        self.uses = 0
+
+
+class ClientPool:
+    """
+    Per process, thread-safe pool of soap clients.
+
+    Clients are built lazily by factory on first demand, up to size. A client is recycled after max_uses borrows,
+    when health_check fails, or when it is returned after a transport error (IOError).
+    """
+    def __init__(self, factory, size: int = 4, max_uses: int = 1000, acquire_timeout: float = 10,
+                 health_check=None):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self.health_check = health_check
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _check_process(self):
+        # Clients (and their sockets) must never be shared with a forked worker
+        if self._pid != os.getpid():
+            logger.debug('ClientPool - fork detected, discarding inherited clients')
+            self._reset()
+
+    def _build(self) -> PooledClient:
+        try:
+            client = self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        counters.increment('soap_client_pool_builds')
+        return PooledClient(client)
+
+    def _is_healthy(self, pooled: PooledClient) -> bool:
+        if pooled.uses >= self.max_uses:
+            return False
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check(pooled.client))
+        except Exception as e:
+            logger.warning('ClientPool - health check raised, error: {}'.format(e))
+            return False
+
+    def _discard(self, pooled: PooledClient):
+        with self._lock:
+            self._created -= 1
+        counters.increment('soap_client_pool_recycled')
+
+    def acquire(self) -> PooledClient:
+        """
+        Borrows a client, building one if the pool has capacity, otherwise waiting for one to be released
+        :return: PooledClient
+        """
+        self._check_process()
+
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+                counters.increment('soap_client_pool_hits')
+            except queue.Empty:
+                pooled = None
+
+            if pooled is None:
+                with self._lock:
+                    can_build = self._created < self.size
+                    if can_build:
+                        self._created += 1
+                if can_build:
+                    counters.increment('soap_client_pool_misses')
+                    pooled = self._build()
+                    pooled.uses += 1
+                    return pooled
+
+                counters.increment('soap_client_pool_waits')
+                try:
+                    pooled = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    message = 'Timed out waiting for a soap client after {}s'.format(self.acquire_timeout)
+                    logger.error(message)
+                    raise IOError(message)
+
+            if self._is_healthy(pooled):
+                pooled.uses += 1
+                return pooled
+
+            self._discard(pooled)
+
+    def release(self, pooled: PooledClient, broken: bool = False):
+        """
+        Returns a borrowed client to the pool, or drops it if broken
+        :param pooled:
+        :param broken: True if the client failed at the transport level
+        """
+        if self._pid != os.getpid():
+            return
+        if broken:
+            self._discard(pooled)
+            return
+        self._idle.put(pooled)
+
+    @contextmanager
+    def client(self):
+        pooled = self.acquire()
+        try:
+            yield pooled.client
+        except IOError:
+            self.release(pooled, broken=True)
+            raise
+        except Exception:
+            self.release(pooled)
+            raise
+        else:
+            self.release(pooled)
+
+    def warm_up(self, count: int = None):
+        """
+        Builds up to count clients ahead of the first request
+        :param count: defaults to pool size
+        """
+        count = self.size if count is None else min(count, self.size)
+        borrowed = [self.acquire() for _ in range(count)]
+        for pooled in borrowed:
+            pooled.uses -= 1
+            self.release(pooled)
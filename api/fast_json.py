@@ -0,0 +1,98 @@
+"""
+orjson backed JSON for the api, falling back to the stdlib json module if orjson is not installed.
+
+Output and error messages match DRF's JSONParser / JSONRenderer with the default (compact, unicode, strict) settings,
+anything orjson cannot handle the same way is passed to the stdlib. The differences left are that integers beyond
+64 bits are read as floats, and NaN / Infinity floats are written as null instead of failing the response.
+"""
+import logging
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders, json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+logger = logging.getLogger(__name__)
+
+_encoder = encoders.JSONEncoder()
+
+
+def _default(obj):
+    # namedtuples (e.g. ReplyError) are arrays to the stdlib, orjson only knows plain tuples
+    if isinstance(obj, tuple):
+        return list(obj)
+    return _encoder.default(obj)
+
+
+def loads(data):
+    """
+    :param data: str or bytes
+    :return: decoded json
+    :raises ValueError: with the stdlib json message
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Malformed, the stdlib gives the error message DRF would
+            pass
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """
+    Compact utf-8 json, as DRF's JSONRenderer writes it
+    :param obj:
+    :return: bytes
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            pass
+        else:
+            # Keeps the output a strict javascript subset, as DRF does
+            if b'\xe2\x80\xa8' in data or b'\xe2\x80\xa9' in data:
+                data = data.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return data
+    text = json.dumps(obj, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode('utf-8')
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser reading the whole body with orjson
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not self.strict:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            data = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return loads(data)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer writing with orjson, pretty printed (indent) and non default settings go through DRF's renderer
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact or not self.strict or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -0,0 +1,153 @@
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from api.metrics import counters
+from api.models import IdempotencyRecord
+from api.throttling import client_identity
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+MAX_KEY_LENGTH = 255
+
+# Responses that are the final outcome of a request, anything else (validation errors, 503s) is not replayed
+STORED_STATUSES = (status.HTTP_200_OK, status.HTTP_202_ACCEPTED, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def record_key(client: str, path: str, idempotency_key: str) -> str:
+    """
+    :param client: see api.throttling.client_identity, so clients sending the same key do not share a record
+    """
+    return _sha256('{} {} {}'.format(client, path, idempotency_key))
+
+
+def fingerprint(data) -> str:
+    return _sha256(json.dumps(data, sort_keys=True, separators=(',', ':')))
+
+
+def _claim(key: str, request_fingerprint: str):
+    """
+    Creates the in progress record for key, or returns the live record already stored for it
+    :return: (IdempotencyRecord, True if created)
+    """
+    now = timezone.now()
+    config = settings.IDEMPOTENCY
+    while True:
+        record = IdempotencyRecord.objects.filter(key=key).first()
+        if record is not None:
+            abandoned = record.status_code is None and \
+                record.created < now - timedelta(seconds=config['in_progress_timeout'])
+            if record.expires > now and not abandoned:
+                return record, False
+            # Expired or abandoned, only one of the racing requests gets to replace it
+            if not IdempotencyRecord.objects.filter(key=key, created=record.created).delete()[0]:
+                continue
+        try:
+            return IdempotencyRecord.objects.create(
+                key=key, fingerprint=request_fingerprint, created=now, expires=now + timedelta(seconds=config['ttl'])
+            ), True
+        except IntegrityError:
+            continue
+
+
+def _replay(record: IdempotencyRecord, request_fingerprint: str) -> Response:
+    if record.fingerprint != request_fingerprint:
+        counters.increment('idempotency_conflicts')
+        return Response({'message': 'Idempotency-Key already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if record.status_code is None:
+        counters.increment('idempotency_conflicts')
+        return Response({'message': 'A request with this Idempotency-Key is in progress'},
+                        status=status.HTTP_409_CONFLICT)
+
+    counters.increment('idempotency_replays')
+    stored = json.loads(record.response)
+    response = Response(stored['data'], status=record.status_code)
+    if 'location' in stored:
+        response['Location'] = stored['location']
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(post):
+    """
+    Decorates an APIView.post so requests sent with an Idempotency-Key header run once. Retries of the same request
+    from the same client (API key, otherwise address) get the stored response back without calling XStream, until
+    settings.IDEMPOTENCY['ttl'] expires.
+    """
+    @functools.wraps(post)
+    def wrapper(view, request, *args, **kwargs):
+        idempotency_key = request.META.get(HEADER)
+        if not idempotency_key:
+            return post(view, request, *args, **kwargs)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return Response({'message': 'Idempotency-Key longer than {} characters'.format(MAX_KEY_LENGTH)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        key = record_key(client_identity(request), request.path_info, idempotency_key)
+        request_fingerprint = fingerprint(request.data)
+        record, created = _claim(key, request_fingerprint)
+        if not created:
+            return _replay(record, request_fingerprint)
+
+        try:
+            response = post(view, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code not in STORED_STATUSES:
+            record.delete()
+            return response
+
+        stored = {'data': response.data}
+        if response.has_header('Location'):
+            stored['location'] = response['Location']
+        record.status_code = response.status_code
+        record.response = json.dumps(stored, separators=(',', ':'))
+        record.save(update_fields=['status_code', 'response'])
+        return response
+
+    return wrapper
+
+
+def compact() -> int:
+    """
+    Deletes expired records
+    :return: number of records deleted
+    """
+    deleted = IdempotencyRecord.objects.filter(expires__lte=timezone.now()).delete()[0]
+    if deleted:
+        logger.info('idempotency - compacted %d expired record(s)', deleted)
+    return deleted
+
+
+def compact_if_due():
+    """
+    Runs compact at most once per settings.IDEMPOTENCY['compact_interval'] seconds per process
+    """
+    global _last_compacted
+    with _compact_lock:
+        if time.monotonic() - _last_compacted < settings.IDEMPOTENCY['compact_interval']:
+            return
+        _last_compacted = time.monotonic()
+    compact()
+
+
+_last_compacted = float('-inf')
+_compact_lock = threading.Lock()
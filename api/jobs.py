@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from api import idempotency, scheduler
+from api.models import Job
+from api.services import add_policy, Result
+
+
+logger = logging.getLogger(__name__)
+
+# Job kind to callable(payload, queue) -> Result
+HANDLERS = {
+    'add_policy': add_policy,
+}
+
+
+def serialize_result(result: Result) -> dict:
+    data = result.data
+    if isinstance(data, list):
+        data = [item._asdict() if hasattr(item, '_asdict') else item for item in data]
+    return {'status': result.status is True, 'data': data}
+
+
+def enqueue(kind: str, payload: dict, queue: str = None) -> Job:
+    """
+    Stores a job for the workers and makes sure this process has workers running if configured
+    :param kind: key of HANDLERS
+    :param payload: json serialisable handler argument
+    :param queue: XStream <job><queue> value, defaults to the background priority class's
+    :return: Job
+    """
+    job = Job.objects.create(
+        kind=kind,
+        payload=json.dumps(payload),
+        queue=queue or scheduler.queue_for(settings.XSTREAM_SCHEDULER['background_class'])
+    )
+    if settings.JOB_QUEUE['in_process']:
+        start_workers(settings.JOB_QUEUE['workers'])
+    _wake.set()
+    return job
+
+
+def claim_next():
+    """
+    Atomically moves the oldest queued job to running, safe across threads and processes sharing the database.
+    Jobs left running longer than settings.JOB_QUEUE['running_timeout'], by a worker that died, are queued again first
+    :return: Job or None
+    """
+    now = timezone.now()
+    requeued = Job.objects.filter(
+        status=Job.RUNNING, updated__lt=now - timedelta(seconds=settings.JOB_QUEUE['running_timeout'])
+    ).update(status=Job.QUEUED, updated=now)
+    if requeued:
+        logger.warning('jobs - requeued %d job(s) left running by a worker that died', requeued)
+
+    for job_id in Job.objects.filter(status=Job.QUEUED).values_list('id', flat=True)[:10]:
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(status=Job.RUNNING, updated=now):
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def run_job(job: Job):
+    try:
+        with scheduler.priority(settings.XSTREAM_SCHEDULER['background_class']):
+            result = HANDLERS[job.kind](json.loads(job.payload), job.queue)
+        job.result = json.dumps(serialize_result(result))
+        job.status = Job.SUCCEEDED if result.status is True else Job.FAILED
+    except Exception as e:
+        logger.error('jobs - {} {} failed, error: {}'.format(job.kind, job.id, e))
+        job.error = str(e)
+        job.status = Job.FAILED
+    job.save(update_fields=['result', 'error', 'status', 'updated'])
+
+
+def run_once() -> bool:
+    """
+    Runs the next queued job, if any
+    :return: True if a job was run
+    """
+    job = claim_next()
+    if job is None:
+        return False
+    run_job(job)
+    return True
+
+
+def work(stop: threading.Event, poll_interval: float):
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            ran = run_once()
+        except Exception as e:
+            logger.error('jobs - worker error: {}'.format(e))
+            ran = False
+        if not ran:
+            try:
+                idempotency.compact_if_due()
+            except Exception as e:
+                logger.error('jobs - compaction error: {}'.format(e))
+            _wake.wait(poll_interval)
+            _wake.clear()
+    close_old_connections()
+
+
+def start_in_process():
+    """
+    Starts this web process's workers if settings.JOB_QUEUE['in_process'], so jobs queued before a restart run without
+    waiting for the next enqueue. Called once the WSGI / ASGI application is loaded
+    """
+    if settings.JOB_QUEUE['in_process']:
+        start_workers(settings.JOB_QUEUE['workers'])
+
+
+def start_workers(count: int):
+    """
+    Starts count daemon worker threads in this process, once
+    """
+    global _workers
+    if _workers:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        _workers = [
+            threading.Thread(target=work, args=(_stop, settings.JOB_QUEUE['poll_interval']), daemon=True,
+                             name='job-worker-{}'.format(n))
+            for n in range(count)
+        ]
+        for worker in _workers:
+            worker.start()
+
+
+_workers = []
+_workers_lock = threading.Lock()
+_stop = threading.Event()
+_wake = threading.Event()
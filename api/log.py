@@ -0,0 +1,86 @@
+import atexit
+import logging
+import queue
+import re
+from logging.handlers import QueueHandler, QueueListener
+from django.conf import settings
+from api.metrics import counters
+
+
+# XStream messages and replies, logged at DEBUG. Kept apart from 'api' so payloads can be switched off on their own
+payload_logger = logging.getLogger('api.payloads')
+
+
+class Payload:
+    """
+    Lazy log argument for an xml payload, only redacted and truncated if the record is actually emitted.
+
+    The text of elements named in settings.XSTREAM_PAYLOAD_LOG['redact'] (the p.cm personal details) is replaced
+    with ***, and the result is capped at settings.XSTREAM_PAYLOAD_LOG['max_length'] characters.
+    """
+    __slots__ = ('xml',)
+
+    def __init__(self, xml):
+        self.xml = xml
+
+    def __str__(self):
+        xml = self.xml if isinstance(self.xml, str) else str(self.xml)
+        xml = _redaction_pattern().sub(r'<\1>***</\1>', xml)
+        max_length = settings.XSTREAM_PAYLOAD_LOG['max_length']
+        if len(xml) > max_length:
+            xml = '{}... [{} more characters]'.format(xml[:max_length], len(xml) - max_length)
+        return xml
+
+
+def _redaction_pattern():
+    global _pattern, _pattern_fields
+    fields = tuple(settings.XSTREAM_PAYLOAD_LOG['redact'])
+    if fields != _pattern_fields:
+        _pattern = re.compile(r'<({})>[^<]*</\1>'.format('|'.join(re.escape(field) for field in fields)))
+        _pattern_fields = fields
+    return _pattern
+
+
+_pattern = None
+_pattern_fields = None
+
+
+def start_queue_listeners(logger_names, queue_size: int = 10000) -> list:
+    """
+    Moves the handlers of each named logger onto a QueueListener thread, leaving a QueueHandler in their place, so
+    slow handlers (files, admin email) run off the request threads. Records are dropped rather than blocking once
+    queue_size records are waiting.
+    :param logger_names: iterable of logger names, as configured in settings.LOGGING
+    :param queue_size:
+    :return: list of started QueueListener
+    """
+    listeners = []
+    for name in logger_names:
+        target = logging.getLogger(name)
+        handlers = [handler for handler in target.handlers if not isinstance(handler, QueueHandler)]
+        if not handlers:
+            continue
+
+        records = queue.Queue(queue_size)
+        listener = QueueListener(records, *handlers, respect_handler_level=True)
+        target.handlers = [_DroppingQueueHandler(records)]
+        listener.start()
+        atexit.register(_stop, listener)
+        listeners.append(listener)
+    return listeners
+
+
+def _stop(listener: QueueListener):
+    # Flushes waiting records at exit, unless the listener was already stopped
+    if listener._thread is not None:
+        listener.stop()
+
+
+class _DroppingQueueHandler(QueueHandler):
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Logging must never block a request, losing a record under overload is the lesser evil
+            counters.increment('log_records_dropped')
@@ -0,0 +1,36 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from api import audit
+
+
+class Command(BaseCommand):
+    help = 'Looks up audited XStream requests and replies by Refno, Polref or function type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refno')
+        parser.add_argument('--polref')
+        parser.add_argument('--function-type')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--xml', action='store_true', help='Print each request and reply')
+        parser.add_argument('--compact', action='store_true',
+                            help='Delete expired segments and merge small ones, then exit')
+
+    def handle(self, *args, **options):
+        store = audit.get_store()
+        if options['compact']:
+            store.compact()
+            self.stdout.write('Compacted {}, {} segment(s)'.format(store.directory, len(store.segments())))
+            return
+        if not (options['refno'] or options['polref'] or options['function_type']):
+            raise CommandError('Give --refno, --polref or --function-type')
+
+        for record in store.find(options['refno'], options['polref'], options['function_type'], options['limit']):
+            function_type = next((key.partition(':')[2] for key in record['keys'] if key.startswith('function_type:')),
+                                 '')
+            self.stdout.write('{:%Y-%m-%d %H:%M:%S.%f} {:<22} {:>8.1f} ms {}'.format(
+                datetime.fromtimestamp(record['time']), function_type, record['duration'] * 1000,
+                record['error'] or ''
+            ))
+            if options['xml']:
+                self.stdout.write(record['request'])
+                self.stdout.write(record['response'] or '')
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired Idempotency-Key records'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Deleted {} expired record(s)'.format(idempotency.compact()))
@@ -0,0 +1,28 @@
+import csv
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api import bulk
+
+
+class Command(BaseCommand):
+    help = 'Creates prospects from a CSV (header row of prospect fields) or JSONL file, writing NDJSON results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.csv or .jsonl file, - for JSONL on stdin')
+        parser.add_argument('--workers', type=int, default=settings.BULK_IMPORT['workers'])
+        parser.add_argument('--rate-limit', type=float, default=settings.BULK_IMPORT['rate_limit'],
+                            help='Max create calls per second, 0 for no limit')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError('Unable to open {}, error: {}'.format(path, e))
+
+        with f:
+            rows = bulk.read_csv(csv.DictReader(f)) if path.lower().endswith('.csv') else bulk.read_jsonl(f)
+            results = bulk.import_prospects(rows, workers=options['workers'], rate_limit=options['rate_limit'])
+            for line in bulk.to_ndjson(results):
+                self.stdout.write(line.decode('utf-8'), ending='')
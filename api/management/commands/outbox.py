@@ -0,0 +1,71 @@
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api import outbox
+from api.models import OutboxMessage
+
+
+class Command(BaseCommand):
+    help = 'Inspects, requeues and replays XStream messages waiting in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['stats', 'list', 'show', 'requeue', 'replay'], help=(
+            'stats: messages per status, list: most recent messages, show: a message and its xml, '
+            'requeue: make pending or dead messages due now, replay: run the replayer until interrupted'
+        ))
+        parser.add_argument('ids', nargs='*', type=int, help='Message ids for show and requeue')
+        parser.add_argument('--status', choices=[status for status, label in OutboxMessage.STATUSES],
+                            help='Only list messages with this status')
+        parser.add_argument('--key', help='Only list messages for this client Refno')
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--dead', action='store_true', help='Requeue every dead message')
+        parser.add_argument('--once', action='store_true', help='Replay one batch and exit')
+
+    def handle(self, *args, **options):
+        getattr(self, 'handle_{}'.format(options['action']))(options)
+
+    def handle_stats(self, options):
+        for status, count in outbox.stats().items():
+            self.stdout.write('{:<8} {}'.format(status, count))
+
+    def handle_list(self, options):
+        messages = OutboxMessage.objects.order_by('-id')
+        if options['status']:
+            messages = messages.filter(status=options['status'])
+        if options['key'] is not None:
+            messages = messages.filter(key=options['key'])
+        for message in messages[:options['limit']]:
+            self.stdout.write('{:>8} {:<8} {:<22} {:<8} {:>3} {:%Y-%m-%d %H:%M:%S} {}'.format(
+                message.id, message.status, message.function_type, message.key or '-', message.attempts,
+                message.next_attempt, message.error or ''
+            ))
+
+    def handle_show(self, options):
+        if not options['ids']:
+            raise CommandError('show needs a message id')
+        for message in OutboxMessage.objects.filter(id__in=options['ids']):
+            for field in ('id', 'status', 'function_type', 'key', 'attempts', 'next_attempt', 'created', 'updated',
+                          'error', 'result', 'xml'):
+                self.stdout.write('{}: {}'.format(field, getattr(message, field)))
+
+    def handle_requeue(self, options):
+        if not options['ids'] and not options['dead']:
+            raise CommandError('requeue needs message ids or --dead')
+        self.stdout.write('Requeued {} message(s)'.format(outbox.requeue(options['ids'], options['dead'])))
+
+    def handle_replay(self, options):
+        if options['once']:
+            self.stdout.write('Replayed {} message(s)'.format(outbox.replay_once()))
+            return
+
+        stop = threading.Event()
+        thread = threading.Thread(target=outbox.work, args=(stop, settings.OUTBOX['poll_interval']), daemon=True)
+        thread.start()
+        self.stdout.write('Running the outbox replayer, ctrl-c to stop')
+
+        try:
+            while thread.is_alive():
+                stop.wait(1)
+        except KeyboardInterrupt:
+            stop.set()
+            thread.join()
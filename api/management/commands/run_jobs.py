@@ -0,0 +1,29 @@
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued XStream jobs until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_QUEUE['workers'])
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=jobs.work, args=(stop, settings.JOB_QUEUE['poll_interval']), daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write('Running {} job workers, ctrl-c to stop'.format(len(threads)))
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                stop.wait(1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from api import wsdl_cache
+
+
+class Command(BaseCommand):
+    help = 'Fetches the remote XSDs imported by the XStream wsdl and writes an offline copy to the wsdl cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', dest='cache_dir', default=None,
+                            help='Cache directory, defaults to settings.WSDL_CACHE["dir"]')
+
+    def handle(self, *args, **options):
+        try:
+            wsdl_file = wsdl_cache.build_cache(options['cache_dir'])
+        except Exception as e:
+            raise CommandError('Unable to vendor wsdl, error: {}'.format(e))
+
+        self.stdout.write(self.style.SUCCESS('Vendored wsdl written to {}'.format(wsdl_file)))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.simulator import XStreamSimulator, parse_latency
+
+
+class Command(BaseCommand):
+    help = 'Runs a local XStream stand-in answering processMessage, for load and latency testing'
+
+    def add_arguments(self, parser):
+        config = settings.XSTREAM_SIMULATOR
+        parser.add_argument('--host', default=config['host'])
+        parser.add_argument('--port', type=int, default=config['port'])
+        parser.add_argument('--latency', default=config['latency'],
+                            help='fixed:MS, uniform:LOW_MS,HIGH_MS, lognormal:MEDIAN_MS,SIGMA or exponential:MEAN_MS')
+        parser.add_argument('--error-rate', type=float, default=config['error_rate'],
+                            help='Fraction of calls answered with a business Error xmlreply')
+        parser.add_argument('--fault-rate', type=float, default=config['fault_rate'],
+                            help='Fraction of calls answered with a 500 soap fault')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for repeatable latency and errors')
+
+    def handle(self, *args, **options):
+        try:
+            latency = parse_latency(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        simulator = XStreamSimulator(
+            host=options['host'], port=options['port'], latency=latency, error_rate=options['error_rate'],
+            fault_rate=options['fault_rate'], seed=options['seed']
+        )
+        try:
+            simulator.serve_forever(started=lambda address: self.stdout.write(
+                'Serving XStream simulator, set XSTREAM_ADDRESS = {!r} (wsdl at {}?wsdl), ctrl-c to stop'.format(
+                    address, address)))
+        except KeyboardInterrupt:
+            pass
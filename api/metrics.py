@@ -0,0 +1,182 @@
+import bisect
+import contextvars
+import threading
+import time
+
+
+class Counters:
+    """
+    Thread-safe, process local named counters
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauges:
+    """
+    Thread-safe, process local named values that are set rather than incremented
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def set(self, name: str, value: float):
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+# Upper bounds in seconds, from sub-millisecond in-process stages up to slow XStream round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histograms:
+    """
+    Thread-safe, process local bucketed timings, keyed by name and a tuple of (label, value) pairs
+    """
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, name: str, labels: tuple, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._values.get((name, labels))
+            if entry is None:
+                entry = self._values[(name, labels)] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def get(self, name: str, labels: tuple) -> dict:
+        """
+        :return: dict with per bucket (non cumulative) 'counts', 'sum' and 'count', or None if never observed
+        """
+        with self._lock:
+            entry = self._values.get((name, labels))
+            return None if entry is None else {'counts': list(entry[0]), 'sum': entry[1], 'count': entry[2]}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+# Endpoint label for stage timings, set per request by api.middleware.EndpointMiddleware and the ASGI routes
+endpoint = contextvars.ContextVar('endpoint', default='')
+
+
+class timed:
+    """
+    Context manager observing the duration of a hot path stage into api_stage_duration_seconds
+    """
+    __slots__ = ('stage', 'function_type', 'start')
+
+    def __init__(self, stage: str, function_type: str = ''):
+        self.stage = stage
+        self.function_type = function_type
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        histograms.observe('api_stage_duration_seconds', (
+            ('stage', self.stage), ('endpoint', endpoint.get()), ('function_type', self.function_type)
+        ), time.perf_counter() - self.start)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels) -> str:
+    return '{{{}}}'.format(','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels)) if labels else ''
+
+
+def _split_name(name: str):
+    # Counters and gauges named 'metric:function-type' become metric{function_type="function-type"}
+    metric, _, function_type = name.partition(':')
+    return metric, ((('function_type', function_type),) if function_type else ())
+
+
+def _group(values: dict) -> dict:
+    families = {}
+    for name, value in values.items():
+        metric, labels = _split_name(name)
+        families.setdefault(metric, []).append((labels, value))
+    for metric, series in families.items():
+        # The unlabelled total of a labelled family would be double counted by sum()
+        if any(labels for labels, value in series):
+            families[metric] = [(labels, value) for labels, value in series if labels]
+    return families
+
+
+def render_prometheus() -> str:
+    """
+    Renders every counter, gauge and histogram of this process in the Prometheus text exposition format (0.0.4)
+    :return: str
+    """
+    lines = []
+    for metric, series in sorted(_group(counters.snapshot()).items()):
+        lines.append('# TYPE {}_total counter'.format(metric))
+        for labels, value in sorted(series):
+            lines.append('{}_total{} {}'.format(metric, _format_labels(labels), value))
+
+    for metric, series in sorted(_group(gauges.snapshot()).items()):
+        lines.append('# TYPE {} gauge'.format(metric))
+        for labels, value in sorted(series):
+            lines.append('{}{} {}'.format(metric, _format_labels(labels), value))
+
+    families = {}
+    for (name, labels), value in histograms.snapshot().items():
+        families.setdefault(name, []).append((labels, value))
+    bounds = ['{:g}'.format(bound) for bound in histograms.buckets] + ['+Inf']
+    for name, series in sorted(families.items()):
+        lines.append('# TYPE {} histogram'.format(name))
+        for labels, (counts, total, count) in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels + (('le', bound),)), cumulative))
+            lines.append('{}_sum{} {!r}'.format(name, _format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+
+    return '\n'.join(lines) + '\n'
+
+
+counters = Counters()
+gauges = Gauges()
+histograms = Histograms()
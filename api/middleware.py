@@ -0,0 +1,52 @@
+import math
+import time
+from django.conf import settings
+from django.http import JsonResponse
+from api import admission, metrics
+
+
+class EndpointMiddleware:
+    """
+    Labels stage timings with the endpoint being served, and times each request into api_request_duration_seconds
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_metrics_token', None)
+            if token is not None:
+                metrics.endpoint.reset(token)
+
+        label = getattr(request, '_metrics_endpoint', None)
+        if label is not None:
+            metrics.histograms.observe('api_request_duration_seconds', (
+                ('endpoint', label), ('status', str(response.status_code))
+            ), time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Paths with arguments (e.g. job ids) are labelled by view, to keep the number of series bounded
+        label = request.resolver_match.view_name if view_kwargs or view_args else request.path_info
+        request._metrics_endpoint = label
+        request._metrics_token = metrics.endpoint.set(label)
+
+
+class AdmissionMiddleware:
+    """
+    Refuses api requests with 503 early, rather than serving them late, while their queueing delay before reaching
+    Django stays over target (CoDel, see api.admission). The delay comes from the proxy's X-Request-Start header,
+    without it nothing is shed.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if admission.shed_request(request.path_info, request.META.get('HTTP_X_REQUEST_START')):
+            response = JsonResponse({'message': 'Service unavailable'}, status=503)
+            response['Retry-After'] = str(math.ceil(settings.ADMISSION['shedding']['interval']))
+            return response
+        return self.get_response(request)
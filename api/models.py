@@ -0,0 +1,87 @@
+import uuid
+from django.db import models
+
+
+class Job(models.Model):
+    """
+    Deferred XStream work, queued by the api and executed by api.jobs workers
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30)
+    payload = models.TextField()  # json
+    queue = models.CharField(max_length=10)  # XStream <job><queue> value
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED, db_index=True)
+    result = models.TextField(null=True, blank=True)  # json serialised Result
+    error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('created',)
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The response to a request sent with an Idempotency-Key, replayed for retries of the same request until expires
+    """
+    key = models.CharField(max_length=64, primary_key=True)  # sha256 of client identity, request path and Idempotency-Key
+    fingerprint = models.CharField(max_length=64)  # sha256 of the canonical request json
+    status_code = models.PositiveSmallIntegerField(null=True)  # None while the first request is in progress
+    response = models.TextField(null=True)  # compact json response data
+    created = models.DateTimeField()
+    expires = models.DateTimeField(db_index=True)
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket of one client, shared by every worker through the database (api.admission.DatabaseBuckets)
+    """
+    key = models.CharField(max_length=64, primary_key=True)  # API key id or client address
+    tokens = models.FloatField()
+    updated = models.FloatField(db_index=True)  # time.time() of the last take
+
+
+class OutboxMessage(models.Model):
+    """
+    An xmlexecute message XStream could not take yet, appended by the api and replayed by api.outbox
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    xml = models.TextField()
+    function_type = models.CharField(max_length=30)  # char20.1 of xml
+    key = models.CharField(max_length=20, blank=True)  # client Refno messages are replayed in order for, '' for none
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField()
+    result = models.TextField(null=True, blank=True)  # json serialised Result
+    error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['status', 'next_attempt']),
+            models.Index(fields=['key', 'status']),
+        ]
@@ -0,0 +1,251 @@
+"""
+Durable outbox for XStream messages.
+
+Messages XStream never received, because it could not be connected to or its circuit is open, are appended to the
+OutboxMessage table as their xmlexecute xml instead of being lost, and a background replayer sends them once it is back.
+A replay that may have reached XStream (e.g. a read timeout) is dead lettered rather than retried, as sending it again
+could duplicate it, for a person to check in XStream before requeueing it. Messages with the
+same key (the client Refno) are sent one at a time in the order they were stored, messages without one in any order.
+Delivery is at-least-once: a message whose replayer died mid-send is sent again after sending_timeout.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from api import scheduler
+from api.circuit_breaker import CircuitOpenError
+from api.jobs import serialize_result
+from api.metrics import counters
+from api.models import OutboxMessage
+from api.services import SoapService, function_type_of, may_have_reached_xstream
+
+
+logger = logging.getLogger(__name__)
+
+UNSENT = (OutboxMessage.PENDING, OutboxMessage.SENDING)
+
+# Counter incremented per replay outcome, by the status it leaves the message in
+OUTCOME_COUNTERS = {
+    OutboxMessage.SENT: 'outbox_sent',
+    OutboxMessage.PENDING: 'outbox_retries',
+    OutboxMessage.DEAD: 'outbox_dead_lettered',
+}
+
+
+def store(xml: str, key: str = '', error: str = None) -> OutboxMessage:
+    """
+    Appends a message for the replayer and makes sure this process has a replayer running if configured
+    :param xml: xmlexecute message
+    :param key: client Refno the message must be replayed in order for, '' for none
+    :param error: why it was not sent now
+    :return: OutboxMessage
+    """
+    message = OutboxMessage.objects.create(
+        xml=xml, function_type=function_type_of(xml), key=key, error=error, next_attempt=timezone.now()
+    )
+    counters.increment('outbox_stored:{}'.format(message.function_type))
+    logger.info('outbox - stored %s %d for %r: %s', message.function_type, message.id, key, error)
+    if settings.OUTBOX['in_process']:
+        start_replayer()
+    _wake.set()
+    return message
+
+
+def has_pending(key: str) -> bool:
+    """
+    :return: True if messages for key are waiting, so a new one must be stored behind them rather than sent
+    """
+    return OutboxMessage.objects.filter(key=key, status__in=UNSENT).exists()
+
+
+def claim(limit: int) -> list:
+    """
+    Atomically moves up to limit due messages to sending, only the oldest unsent message of each key
+    :return: list of OutboxMessage, oldest first
+    """
+    now = timezone.now()
+    OutboxMessage.objects.filter(
+        status=OutboxMessage.SENDING, updated__lt=now - timedelta(seconds=settings.OUTBOX['sending_timeout'])
+    ).update(status=OutboxMessage.PENDING, updated=now)
+
+    heads = OutboxMessage.objects.filter(status__in=UNSENT).exclude(key='') \
+        .order_by().values('key').annotate(head=Min('id')).values('head')
+    due = OutboxMessage.objects.filter(status=OutboxMessage.PENDING, next_attempt__lte=now) \
+        .filter(Q(key='') | Q(id__in=heads)).values_list('id', flat=True)[:limit]
+    claimed = [
+        message_id for message_id in due
+        if OutboxMessage.objects.filter(id=message_id, status=OutboxMessage.PENDING)
+        .update(status=OutboxMessage.SENDING, updated=now)
+    ]
+    return list(OutboxMessage.objects.filter(id__in=claimed))
+
+
+def _send(xml: str):
+    with scheduler.priority(settings.XSTREAM_SCHEDULER['background_class']):
+        try:
+            return SoapService.process_message(xml), None
+        except IOError as e:
+            return None, e
+
+
+def _record(message: OutboxMessage, result, error: IOError):
+    config = settings.OUTBOX
+    now = timezone.now()
+    if error is None:
+        message.result = json.dumps(serialize_result(result))
+        if result.status is True:
+            message.status = OutboxMessage.SENT
+            message.error = None
+        else:
+            # XStream refused the message, sending it again would not change that
+            message.status = OutboxMessage.DEAD
+            message.error = 'XStream returned an error'
+    elif isinstance(error, CircuitOpenError):
+        # Not attempted, wait for the circuit to let calls through again
+        message.status = OutboxMessage.PENDING
+        message.next_attempt = now + timedelta(seconds=error.retry_after)
+        message.error = str(error)
+    elif may_have_reached_xstream(error):
+        # XStream may have processed it, only a person can tell whether sending it again would duplicate it
+        message.attempts += 1
+        message.status = OutboxMessage.DEAD
+        message.error = 'May have reached XStream, check before requeueing: {}'.format(error)
+    else:
+        message.attempts += 1
+        message.error = str(error)
+        if message.attempts >= config['max_attempts']:
+            message.status = OutboxMessage.DEAD
+        else:
+            message.status = OutboxMessage.PENDING
+            message.next_attempt = now + timedelta(
+                seconds=min(config['max_backoff'], config['backoff'] * 2 ** (message.attempts - 1))
+            )
+
+    message.save(update_fields=['status', 'attempts', 'next_attempt', 'result', 'error', 'updated'])
+    counters.increment('{}:{}'.format(OUTCOME_COUNTERS[message.status], message.function_type))
+    if message.status == OutboxMessage.DEAD:
+        logger.error('outbox - %s %d dead lettered after %d attempt(s): %s',
+                     message.function_type, message.id, message.attempts, message.error)
+
+
+def replay_once(batch_size: int = None, workers: int = None) -> int:
+    """
+    Sends a batch of due messages, up to workers of them concurrently
+    :param batch_size: max messages, defaults to settings.OUTBOX['batch_size']
+    :param workers: max concurrent XStream calls, defaults to settings.OUTBOX['workers']
+    :return: number of messages sent, dead lettered or rescheduled
+    """
+    messages = claim(batch_size or settings.OUTBOX['batch_size'])
+    if not messages:
+        return 0
+
+    workers = min(workers or settings.OUTBOX['workers'], len(messages))
+    if workers > 1:
+        # Only the XStream calls run on the pool, the outcomes are recorded on this thread's connection
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(_send, [message.xml for message in messages]))
+    else:
+        outcomes = [_send(message.xml) for message in messages]
+
+    for message, (result, error) in zip(messages, outcomes):
+        _record(message, result, error)
+    return len(messages)
+
+
+def requeue(ids=None, dead: bool = False) -> int:
+    """
+    Makes pending or dead messages due now, with their attempts reset
+    :param ids: message ids
+    :param dead: requeue every dead message
+    :return: number of messages requeued
+    """
+    messages = OutboxMessage.objects.none()
+    if ids:
+        messages = OutboxMessage.objects.filter(id__in=ids, status__in=(OutboxMessage.PENDING, OutboxMessage.DEAD))
+    if dead:
+        messages = messages | OutboxMessage.objects.filter(status=OutboxMessage.DEAD)
+    now = timezone.now()
+    requeued = messages.update(status=OutboxMessage.PENDING, attempts=0, next_attempt=now, updated=now)
+    if requeued:
+        _wake.set()
+    return requeued
+
+
+def stats() -> dict:
+    """
+    :return: status to message count
+    """
+    counts = dict.fromkeys((status for status, label in OutboxMessage.STATUSES), 0)
+    counts.update(OutboxMessage.objects.order_by().values_list('status').annotate(Count('id')))
+    return counts
+
+
+def compact() -> int:
+    """
+    Deletes sent messages older than settings.OUTBOX['retention'] seconds
+    :return: number of messages deleted
+    """
+    deleted = OutboxMessage.objects.filter(
+        status=OutboxMessage.SENT, updated__lt=timezone.now() - timedelta(seconds=settings.OUTBOX['retention'])
+    ).delete()[0]
+    if deleted:
+        logger.info('outbox - compacted %d sent message(s)', deleted)
+    return deleted
+
+
+def compact_if_due():
+    """
+    Runs compact() at most once per settings.OUTBOX['compact_interval'] seconds per process
+    """
+    global _last_compacted
+    with _replayer_lock:
+        if time.monotonic() - _last_compacted < settings.OUTBOX['compact_interval']:
+            return
+        _last_compacted = time.monotonic()
+    compact()
+
+
+def work(stop: threading.Event, poll_interval: float):
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            replayed = replay_once()
+        except Exception as e:
+            logger.error('outbox - replayer error: {}'.format(e))
+            replayed = 0
+        if not replayed:
+            try:
+                compact_if_due()
+            except Exception as e:
+                logger.error('outbox - compaction error: {}'.format(e))
+            _wake.wait(poll_interval)
+            _wake.clear()
+    close_old_connections()
+
+
+def start_replayer():
+    """
+    Starts the replayer daemon thread in this process, once
+    """
+    global _replayer
+    if _replayer is not None:
+        return
+    with _replayer_lock:
+        if _replayer is not None:
+            return
+        _replayer = threading.Thread(target=work, args=(_stop, settings.OUTBOX['poll_interval']), daemon=True,
+                                     name='outbox-replayer')
+        _replayer.start()
+
+
+_replayer = None  # type: threading.Thread
+_replayer_lock = threading.Lock()
+_last_compacted = float('-inf')
+_stop = threading.Event()
+_wake = threading.Event()
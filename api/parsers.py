@@ -100,5 +100,57 @@ transaction_schema = {
             'minLength': 11,
             'maxLength': 11
         }
-    }
-}
\ No newline at end of file
+    },
+    'required': [
+        'Polref'
+    ]
+}
+
+quote_schema = {
+    'type': 'object',
+    'properties': {
+        'Polref': {
+            'type': 'string',
+            'minLength': 11,
+            'maxLength': 11
+        },
+        'Risk': {
+            'type': 'object',
+            'properties': {
+                'BGA': {'type': 'object'},
+                'GENI': {'type': 'object'},
+                'YTID': {'type': 'object'},
+                'YTPQ': {'type': 'object'},
+                'CLI1': {'type': 'object'},
+                'CLI2': {'type': 'object'},
+                'TR01': {'type': 'object'},
+                'BGB': {'type': 'object'},
+            }
+        }
+    },
+    'required': [
+        'Polref', 'Risk'
+    ]
+}
+
+prospect_and_risk_schema = {
+    'type': 'object',
+    'properties': {
+        'Prospect': prospect_schema,
+        'Policy': {
+            'type': 'object',
+            'properties': {
+                'Ptype': policy_schema['properties']['Ptype'],
+                'Risk': policy_schema['properties']['Risk']
+            },
+            'required': [
+                'Ptype', 'Risk'
+            ],
+            'additionalProperties': False
+        }
+    },
+    'required': [
+        'Prospect', 'Policy'
+    ],
+    'additionalProperties': False
+}
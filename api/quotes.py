@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from api import single_flight
+from api.metrics import counters, gauges, timed
+from api.reply_parser import ReplyParser
+from api.services import Result, SoapService, XStreamParser, split_polref
+
+
+logger = logging.getLogger(__name__)
+
+FUNCTION_TYPE = 'update-cliv'
+
+# Rating sections of templates/calculate_quote.xml, only these are sent to XStream and key the memo
+QUOTE_SECTIONS = ('BGA', 'GENI', 'YTID', 'YTPQ', 'CLI1', 'CLI2', 'TR01', 'BGB')
+
+# Paths are relative to <xmlreply>, each rated line is an apmpolicy/YTPQ element
+QUOTE_REPLY_FIELDS = {
+    'result': {'path': 'messages/result'},
+    'errors': {'path': 'messages/error', 'many': True},
+    'polref': {'path': 'apmpolicy/p.py/Polref'},
+    'premiums': {'path': 'apmpolicy/YTPQ/premium', 'many': True, 'closed_by': 'apmpolicy'},
+    'ipt': {'path': 'apmpolicy/YTPQ/ipt', 'many': True, 'closed_by': 'apmpolicy'},
+}
+
+
+def normalise_risk(risk: dict) -> dict:
+    """
+    Keeps only the rating sections of risk, with surrounding whitespace stripped and blank fields dropped, so risks
+    that rate the same compare equal
+    :param risk: Risk of a quote request
+    :return: dict
+    """
+    sections = {}
+    for section in QUOTE_SECTIONS:
+        fields = risk.get(section)
+        if not fields:
+            continue
+        sections[section] = {
+            k: v.strip() if isinstance(v, str) else v
+            for k, v in fields.items() if v is not None and (not isinstance(v, str) or v.strip())
+        }
+    return sections
+
+
+def risk_digest(sections: dict) -> str:
+    return hashlib.sha256(json.dumps(sections, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class QuoteMemo:
+    """
+    Thread-safe, per process LRU of quote results keyed on (Polref, risk digest), with per entry expiry.
+
+    Each client Ref has one current Polref, set by the first lookup. Looking up a quote under a different Polref for
+    the same Ref drops every entry of the previous one, as does invalidate().
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = 900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_polref = {}
+        self._polrefs = {}
+        self._lock = threading.Lock()
+
+    def get(self, polref: str, digest: str):
+        with self._lock:
+            self._track(polref)
+            entry = self._entries.get((polref, digest))
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove((polref, digest))
+                entry = None
+            if entry is None:
+                counters.increment('quote_memo_misses')
+            else:
+                self._entries.move_to_end((polref, digest))
+                counters.increment('quote_memo_hits')
+            hits, misses = counters.get('quote_memo_hits'), counters.get('quote_memo_misses')
+            gauges.set('quote_memo_hit_ratio', hits / (hits + misses))
+        return None if entry is None else entry[1]
+
+    def set(self, polref: str, digest: str, data: dict):
+        with self._lock:
+            refno = split_polref(polref)[0]
+            if self._polrefs.setdefault(refno, polref) != polref:
+                # Rated before the Ref moved to another Polref, already stale
+                return
+            self._entries[(polref, digest)] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end((polref, digest))
+            self._by_polref.setdefault(polref, set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, polref: str):
+        with self._lock:
+            self._invalidate(polref)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_polref.clear()
+            self._polrefs.clear()
+
+    def _track(self, polref: str):
+        refno = split_polref(polref)[0]
+        previous = self._polrefs.get(refno)
+        if previous is not None and previous != polref:
+            self._invalidate(previous)
+        self._polrefs[refno] = polref
+
+    def _invalidate(self, polref: str):
+        digests = self._by_polref.pop(polref, ())
+        for digest in digests:
+            del self._entries[(polref, digest)]
+        if digests:
+            counters.increment('quote_memo_invalidations')
+
+    def _remove(self, key: tuple):
+        del self._entries[key]
+        digests = self._by_polref[key[0]]
+        digests.discard(key[1])
+        if not digests:
+            del self._by_polref[key[0]]
+
+
+def build_quote_xml(polref: str, sections: dict) -> str:
+    refno, policy_type = split_polref(polref)
+    parser = XStreamParser()
+    parser.add_ref(refno)
+    parser.add_policy_type(policy_type)
+    parser.add_polref(polref)
+    parser.add_risk_data(sections)
+    parser.add_function_type(FUNCTION_TYPE)
+    return parser.parse_to_xml()
+
+
+def _total(values: list) -> str:
+    try:
+        return str(sum((Decimal(value) for value in values if value), Decimal('0.00')))
+    except InvalidOperation:
+        raise IOError('Invalid premium in quote reply: {}'.format(values))
+
+
+def _handle_quote_response(response: str, polref: str) -> Result:
+    result = Result()
+    parsed_response = _get_reply_parser().parse(response)
+
+    if parsed_response['result'] == 'OK':
+        result.data = {
+            'Polref': parsed_response['polref'] or polref,
+            'lines': len(parsed_response['premiums']),
+            'premium': _total(parsed_response['premiums']),
+            'ipt': _total(parsed_response['ipt'])
+        }
+        result.status = True
+    elif parsed_response['result'] == 'Error':
+        result.data = parsed_response['errors']
+        result.status = False
+
+    return result
+
+
+def _rate(xml: str, polref: str) -> Result:
+    response = SoapService._post_with_retry(xml)
+    with timed('handle_response', FUNCTION_TYPE):
+        return _handle_quote_response(response, polref)
+
+
+def calculate_quote(quote_json: dict) -> Result:
+    """
+    Rates the risk of quote_json, served from the memo if its rating sections are unchanged since the last quote
+    of the same Polref
+    :param quote_json: validated against quote_schema
+    :return: Result, data is {'Polref', 'lines', 'premium', 'ipt'} if OK
+    """
+    polref = quote_json['Polref']
+    sections = normalise_risk(quote_json['Risk'])
+    digest = risk_digest(sections)
+    memo = get_memo()
+
+    data = memo.get(polref, digest)
+    if data is not None:
+        result = Result(data=data)
+        result.status = True
+        result.cached = True
+        return result
+
+    xml = build_quote_xml(polref, sections)
+    coalescer = single_flight.get_single_flight()
+    if coalescer is None:
+        result = _rate(xml, polref)
+    else:
+        result, shared = coalescer.do(coalescer.key_for(xml, FUNCTION_TYPE), lambda: _rate(xml, polref))
+
+    if result.status is True:
+        memo.set(polref, digest, result.data)
+    return result
+
+
+def get_memo() -> QuoteMemo:
+    global _memo
+    if _memo is None:
+        with _memo_lock:
+            if _memo is None:
+                _memo = QuoteMemo(**settings.QUOTE_MEMO)
+    return _memo
+
+
+def _get_reply_parser() -> ReplyParser:
+    global _reply_parser
+    if _reply_parser is None:
+        _reply_parser = ReplyParser(QUOTE_REPLY_FIELDS)
+    return _reply_parser
+
+
+_memo = None  # type: QuoteMemo
+_memo_lock = threading.Lock()
+_reply_parser = None  # type: ReplyParser
@@ -0,0 +1,76 @@
+from collections import namedtuple
+from lxml import etree
+
+
+ReplyError = namedtuple('ReplyError', ['message', 'attributes'])
+
+CHUNK_SIZE = 16 * 1024
+
+
+class ReplyParser:
+    """
+    Incrementally parses an xmlreply, collecting only the configured fields and stopping as soon as they are known.
+
+    fields maps a name to {'path': 'a/b/c', 'many': bool, 'closed_by': 'a'}, paths are relative to the root element.
+    A single field is complete once found, a many field once its closed_by element closes, by default its parent.
+    Matched elements become ReplyError records for fields named in error_fields, otherwise their text.
+    """
+    def __init__(self, fields: dict, error_fields=('errors',)):
+        self.fields = {name: (tuple(field['path'].split('/')), field.get('many', False))
+                       for name, field in fields.items()}
+        self.error_fields = error_fields
+        self.by_path = {path: name for name, (path, many) in self.fields.items()}
+        self.closed_by = {}
+        for name, (path, many) in self.fields.items():
+            if many:
+                closed_by = fields[name].get('closed_by')
+                self.closed_by.setdefault(tuple(closed_by.split('/')) if closed_by else path[:-1], []).append(name)
+
+    def parse(self, reply) -> dict:
+        """
+        :param reply: str or bytes xmlreply
+        :return: dict of field name to text (None if missing), or list of values for many fields
+        """
+        values = {name: [] if many else None for name, (path, many) in self.fields.items()}
+        pending = set(self.fields)
+        parser = etree.XMLPullParser(events=('start', 'end'), resolve_entities=False)
+        stack = []
+
+        for start in range(0, len(reply), CHUNK_SIZE):
+            parser.feed(reply[start:start + CHUNK_SIZE])
+            for event, element in parser.read_events():
+                if event == 'start':
+                    stack.append(element.tag)
+                    continue
+
+                path = tuple(stack[1:])
+                name = self.by_path.get(path)
+                if name is not None:
+                    value = self._value(name, element)
+                    if self.fields[name][1]:
+                        values[name].append(value)
+                    else:
+                        values[name] = value
+                        pending.discard(name)
+
+                for many_name in self.closed_by.get(path, ()):
+                    pending.discard(many_name)
+
+                stack.pop()
+                if stack:
+                    # Keep memory flat on large replies, nothing already seen is needed again
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+
+                if not pending:
+                    return values
+
+        parser.close()
+        return values
+
+    def _value(self, name: str, element):
+        text = element.text.strip() or None if element.text else None
+        if name in self.error_fields:
+            return ReplyError(text, dict(element.attrib))
+        return text
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from lxml import etree
+from api.metrics import counters
+
+
+logger = logging.getLogger(__name__)
+
+FUNCTION_TYPE_PATH = 'parameters/yzt/char20.1'
+
+# Function types that change state in OpenGi, their results must never be replayed
+UNCACHEABLE_PREFIXES = ('create-', 'convert-')
+
+_local = threading.local()
+
+
+def _canonical_parser() -> etree.XMLParser:
+    # Formatting whitespace and comments do not change the message, so are dropped before hashing.
+    # lxml parsers must not be shared between threads
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(remove_blank_text=True, remove_comments=True, resolve_entities=False)
+    return parser
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per entry expiry
+    """
+    def __init__(self, max_entries: int = 1000, **kwargs):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Stores entries in a configured django cache (e.g. Redis, memcached), shared by every worker. Eviction is left to
+    the cache itself.
+    """
+    def __init__(self, alias: str = 'default', **kwargs):
+        self.alias = alias
+
+    def get(self, key: str):
+        return caches[self.alias].get(key)
+
+    def set(self, key: str, value, ttl: float):
+        caches[self.alias].set(key, value, ttl)
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+class ResponseCache:
+    """
+    Opt-in cache of XStream results for idempotent function types, keyed on a hash of the canonicalised xml
+    """
+    def __init__(self, backend, functions: dict):
+        self.backend = backend
+        self.functions = {}
+        for function_type, options in functions.items():
+            if function_type.startswith(UNCACHEABLE_PREFIXES):
+                logger.warning('ResponseCache - {} changes state and will not be cached'.format(function_type))
+                continue
+            self.functions[function_type] = options
+
+    def key_for(self, xml: str):
+        """
+        Returns (cache key, function type), or None if xml is not for a cached function type
+        :param xml:
+        :return: tuple or None
+        """
+        if not self.functions:
+            return None
+        root = etree.fromstring(xml.encode('utf-8'), _canonical_parser())
+        function_type = root.findtext(FUNCTION_TYPE_PATH)
+        if function_type not in self.functions:
+            return None
+        digest = hashlib.sha256(etree.tostring(root, method='c14n')).hexdigest()
+        return 'xstream:{}:{}'.format(function_type, digest), function_type
+
+    def get(self, key: tuple):
+        cache_key, function_type = key
+        result = self.backend.get(cache_key)
+        if result is None:
+            counters.increment('xstream_response_cache_misses')
+            counters.increment('xstream_response_cache_misses:{}'.format(function_type))
+            return None
+        counters.increment('xstream_response_cache_hits')
+        counters.increment('xstream_response_cache_hits:{}'.format(function_type))
+        return result
+
+    def set(self, key: tuple, result):
+        cache_key, function_type = key
+        self.backend.set(cache_key, result, self.functions[function_type]['ttl'])
+
+
+def get_cache():
+    """
+    Returns the configured ResponseCache, or None if settings.XSTREAM_RESPONSE_CACHE has no function types
+    :return: ResponseCache or None
+    """
+    global _cache
+    if _cache is _UNSET:
+        with _cache_lock:
+            if _cache is _UNSET:
+                config = settings.XSTREAM_RESPONSE_CACHE
+                if config['functions']:
+                    backend = import_string(config['backend'])(**config.get('options', {}))
+                    _cache = ResponseCache(backend, config['functions'])
+                else:
+                    _cache = None
+    return _cache
+
+
+_UNSET = object()
+_cache = _UNSET
+_cache_lock = threading.Lock()
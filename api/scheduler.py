@@ -0,0 +1,179 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from django.conf import settings
+from api.metrics import counters, histograms
+
+
+logger = logging.getLogger(__name__)
+
+# Priority class of the XStream calls made by the current request or task, None for settings' default_class
+current_class = contextvars.ContextVar('xstream_priority_class', default=None)
+
+
+class _Waiter:
+    __slots__ = ('tag', 'granted')
+
+    def __init__(self, tag: float):
+        self.tag = tag
+        self.granted = threading.Event()
+
+
+class _Class:
+    __slots__ = ('weight', 'max_concurrent', 'waiting', 'running', 'next_tag')
+
+    def __init__(self, weight: float, max_concurrent: int = None):
+        self.weight = weight
+        self.max_concurrent = max_concurrent
+        self.waiting = deque()
+        self.running = 0
+        self.next_tag = 0.0
+
+
+class PriorityScheduler:
+    """
+    Thread-safe admission of outbound XStream calls by priority class, at most capacity at once.
+
+    A call waits in its class's FIFO while capacity is used up or its class is at max_concurrent. A freed slot goes to
+    the waiting call with the lowest start tag (start-time fair queuing), so backlogged classes share the slots in
+    proportion to their weights: a call of a heavy class is admitted ahead of a long queue of light ones, instead of
+    after it.
+    """
+    def __init__(self, capacity: int, classes: dict, timeout: float = 10):
+        """
+        :param capacity: max concurrent calls across classes
+        :param classes: name to {'weight', 'max_concurrent' (None for capacity)}
+        :param timeout: seconds a call waits for a slot before IOError
+        """
+        self.capacity = capacity
+        self.timeout = timeout
+        self._classes = {
+            name: _Class(config['weight'], config.get('max_concurrent')) for name, config in classes.items()
+        }
+        self._running = 0
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, name: str):
+        """
+        Waits for a slot for a call of class name
+        :raises IOError: no slot within timeout
+        """
+        klass = self._classes[name]
+        start = time.perf_counter()
+        with self._lock:
+            waiter = _Waiter(max(self._virtual_time, klass.next_tag))
+            klass.next_tag = waiter.tag + 1 / klass.weight
+            klass.waiting.append(waiter)
+            self._dispatch()
+
+        if not waiter.granted.wait(self.timeout):
+            with self._lock:
+                if not waiter.granted.is_set():
+                    klass.waiting.remove(waiter)
+                    counters.increment('xstream_scheduler_timeouts')
+                    message = 'Timed out waiting for an XStream slot for {} work after {}s'.format(name, self.timeout)
+                    logger.error(message)
+                    raise IOError(message)
+        histograms.observe('xstream_scheduler_wait_seconds', (('class', name),), time.perf_counter() - start)
+
+    def release(self, name: str):
+        with self._lock:
+            self._classes[name].running -= 1
+            self._running -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        while self._running < self.capacity:
+            eligible = [
+                klass for klass in self._classes.values()
+                if klass.waiting and (klass.max_concurrent is None or klass.running < klass.max_concurrent)
+            ]
+            if not eligible:
+                return
+            klass = min(eligible, key=lambda klass: klass.waiting[0].tag)
+            waiter = klass.waiting.popleft()
+            self._virtual_time = waiter.tag
+            klass.running += 1
+            self._running += 1
+            waiter.granted.set()
+
+    def snapshot(self) -> dict:
+        """
+        :return: class name to {'running', 'waiting'}
+        """
+        with self._lock:
+            return {
+                name: {'running': klass.running, 'waiting': len(klass.waiting)}
+                for name, klass in self._classes.items()
+            }
+
+
+@contextmanager
+def priority(name: str):
+    """
+    Runs the XStream calls made inside the block, in this thread or task, as class name
+    """
+    if name not in settings.XSTREAM_SCHEDULER['classes']:
+        raise ValueError('Unknown XStream priority class: {}'.format(name))
+    token = current_class.set(name)
+    try:
+        yield
+    finally:
+        current_class.reset(token)
+
+
+def class_name() -> str:
+    return current_class.get() or settings.XSTREAM_SCHEDULER['default_class']
+
+
+def queue_for(name: str = None) -> str:
+    """
+    :param name: priority class, defaults to the current one
+    :return: the XStream <job><queue> value of the class
+    """
+    return settings.XSTREAM_SCHEDULER['classes'][name or class_name()]['queue']
+
+
+@contextmanager
+def slot():
+    """
+    Holds a scheduler slot for the current priority class while the block calls XStream
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        yield
+        return
+    name = class_name()
+    scheduler.acquire(name)
+    try:
+        yield
+    finally:
+        scheduler.release(name)
+
+
+def get_scheduler():
+    """
+    Returns the process wide PriorityScheduler, or None if settings.XSTREAM_SCHEDULER is disabled
+    :return: PriorityScheduler or None
+    """
+    global _scheduler
+    if _scheduler is _UNSET:
+        with _scheduler_lock:
+            if _scheduler is _UNSET:
+                config = settings.XSTREAM_SCHEDULER
+                if config['enabled']:
+                    _scheduler = PriorityScheduler(
+                        config['capacity'] or settings.SOAP_CLIENT_POOL['size'], config['classes'], config['timeout']
+                    )
+                else:
+                    _scheduler = None
+    return _scheduler
+
+
+_UNSET = object()
+_scheduler = _UNSET
+_scheduler_lock = threading.Lock()
@@ -1,10 +1,15 @@
-import xmltodict
 from django.conf import settings
 import logging
-from jsonschema import validate
-import copy
+import threading
+import time
 import zeep
 from enum import Enum
+from api.client_pool import ClientPool
+from api.log import Payload, payload_logger
+from api.metrics import timed
+from api.reply_parser import ReplyParser
+from api import wsdl_cache, transport, validators, xml_builder, response_cache, circuit_breaker, single_flight, \
+    scheduler, audit
 
 
 logger = logging.getLogger(__name__)
@@ -20,65 +25,154 @@ class Result:
         self.data = data
         self.status = status.name  # type: ResultStatus.name
         self.message = status.value  # type: ResultStatus.value
+        self.cached = False  # True if served from the response cache
+        self.coalesced = False  # True if shared from an identical in-flight call
+
+
+class XStreamError(IOError):
+    """
+    Raised when a processMessage call to XStream fails. Only these count as failures of XStream towards its circuit
+    breaker and retries, not local ones such as waiting too long for a soap client or a scheduler slot.
+    sent is False only when the request provably never reached XStream, see api.transport.never_sent
+    """
+    def __init__(self, message: str, sent: bool = True):
+        super().__init__(message)
+        self.sent = sent
+
+
+def may_have_reached_xstream(error: IOError) -> bool:
+    """
+    False if the message provably was not processed: a local failure before posting, an open circuit or a connection
+    that could not be opened. Such a message can be sent again without risk of a duplicate
+    :param error: raised by SoapService.process_message
+    :return: bool
+    """
+    return isinstance(error, XStreamError) and error.sent
 
 
 class XStreamParser:
     """
-    Entry point for parsing json(dict) data into a valid XStream schema
+    Entry point for parsing json(dict) data into a valid XStream schema.
+
+    Only the dynamic sections are held per message, the static parts of XSTREAM_TEMPLATE are rendered once at import
+    into XSTREAM_FRAGMENTS. The job queue defaults to that of the current priority class, see api.scheduler.
     """
     def __init__(self):
-        self.template = copy.deepcopy(XSTREAM_TEMPLATE)
+        self.queue = scheduler.queue_for()
+        self.function_type = _UNSET
+        self.apm = None
+        self.apmpolicy = {'p.py': {'Ptype': None}}
 
     def add_apm(self, json: dict):
-        self.template['xmlexecute']['apmdata']['prospect']['p.cm'] = json
+        self.apm = json
 
     def add_policy_type(self, policy_type: str):
-        self.template['xmlexecute']['apmpolicy']['p.py']['Ptype'] = policy_type
+        self.apmpolicy['p.py']['Ptype'] = policy_type
 
     def add_risk_data(self, risk_data: dict):
         for k, v in risk_data.items():
-            self.template['xmlexecute']['apmpolicy'][k] = v
+            self.apmpolicy[k] = v
 
     def add_polref(self, polref: str):
-        self.template['xmlexecute']['apmpolicy']['p.py']['Polref'] = polref
+        self.apmpolicy['p.py']['Polref'] = polref
 
     def add_ref(self, ref: str):
         self.add_apm({'Refno': ref})
 
     def add_function_type(self, function_type: str):
-        self.template['xmlexecute']['parameters']['yzt']['char20.1'] = function_type
+        self.function_type = function_type
+
+    def add_queue(self, queue: str):
+        self.queue = queue
 
     def parse_to_xml(self):
-        parsed_dict = xmltodict.unparse(self.template, full_document=False)
-        return parsed_dict
+        with timed('build_xml', '' if self.function_type is _UNSET else self.function_type):
+            return self._render()
+
+    def _render(self) -> str:
+        out = [XSTREAM_FRAGMENTS[0]]
+        xml_builder.emit('queue', self.queue, out)
+        out.append(XSTREAM_FRAGMENTS[1])
+        if self.function_type is not _UNSET:
+            xml_builder.emit('char20.1', self.function_type, out)
+        out.append(XSTREAM_FRAGMENTS[2])
+        xml_builder.emit('p.cm', self.apm, out)
+        out.append(XSTREAM_FRAGMENTS[3])
+        for k, v in self.apmpolicy.items():
+            xml_builder.emit(k, v, out)
+        out.append(XSTREAM_FRAGMENTS[4])
+        return ''.join(out)
+
+
+def function_type_of(xml: str) -> str:
+    """
+    Returns the char20.1 function type of an XStream message, without parsing it
+    :param xml: message built by XStreamParser
+    :return: str, empty if not set
+    """
+    start = xml.find('<char20.1>')
+    if start == -1:
+        return ''
+    start += len('<char20.1>')
+    return xml[start:xml.find('</char20.1>', start)]
+
+
+def split_polref(polref: str):
+    """
+    :param polref: client Ref (7), policy type (2) and policy number (2), e.g. ABCD01XYT01
+    :return: (Refno, Ptype)
+    """
+    return polref[:7], polref[7:9]
 
 
 def validate_json(json: dict, schema: dict):
-    is_validated = False
-    try:
-        validate(json, schema)
-        is_validated = True
-    except Exception as e:
-        print(e)
-    return is_validated
+    with timed('validate_json'):
+        errors = validators.registry.get(schema).failed_checks(json)
+    if errors:
+        logger.info('validate_json - %d error(s): %s', len(errors), '; '.join(errors))
+    return not errors
+
+
+def prospect_parser(prospect_json: dict) -> XStreamParser:
+    parser = XStreamParser()
+    parser.add_apm(prospect_json)
+    parser.add_function_type('create-cliv-prospect')
+    return parser
+
+
+def policy_parser(policy_json: dict, queue: str = None) -> XStreamParser:
+    """
+    :param policy_json: Ref may be left out when it is only known once the prospect exists, see api.batch
+    :param queue:
+    :return: XStreamParser
+    """
+    parser = XStreamParser()
+    if queue is not None:
+        parser.add_queue(queue)
+    if 'Ref' in policy_json:
+        parser.add_ref(policy_json['Ref'])
+    parser.add_policy_type(policy_json['Ptype'])
+    parser.add_risk_data(policy_json['Risk'])
+    parser.add_function_type('create-cliv-policy')
+    return parser
+
+
+def build_prospect_xml(prospect_json: dict) -> str:
+    return prospect_parser(prospect_json).parse_to_xml()
+
+
+def build_policy_xml(policy_json: dict, queue: str = None) -> str:
+    return policy_parser(policy_json, queue).parse_to_xml()
 
 
 def create_prospect(prospect_json: dict) -> Result:
-    prospect_parser = XStreamParser()
-    prospect_parser.add_apm(prospect_json)
-    prospect_parser.add_function_type('create-cliv-prospect')
-    prospect_xml = prospect_parser.parse_to_xml()
+    prospect_xml = build_prospect_xml(prospect_json)
     result = SoapService.process_message(prospect_xml)
     return  result
 
 
-def add_policy(policy_json: dict):
-    policy_parser = XStreamParser()
-    policy_parser.add_ref(policy_json['Ref'])
-    policy_parser.add_policy_type(policy_json['Ptype'])
-    policy_parser.add_risk_data(policy_json['Risk'])
-    policy_parser.add_function_type('create-cliv-policy')
-    policy_xml = policy_parser.parse_to_xml()
+def add_policy(policy_json: dict, queue: str = None):
+    policy_xml = build_policy_xml(policy_json, queue)
     result = SoapService.process_message(policy_xml)
     return result
 
@@ -90,12 +184,15 @@ class SoapService:
     @staticmethod
     def _establish_client():
         """
-        Creates a soap client using local wsdl file
+        Creates a soap client using the vendored wsdl cache if fresh, otherwise the local wsdl file
         :return: Result
         """
         logger.debug('SoapService - _establish_client()')
         try:
-            client = zeep.Client(wsdl=settings.WSDL)
+            with timed('establish_client'):
+                client = zeep.Client(wsdl=wsdl_cache.resolve_wsdl(), transport=transport.get_transport())
+                if settings.XSTREAM_ADDRESS:
+                    client._default_service = client.create_service(XSTREAM_BINDING, settings.XSTREAM_ADDRESS)
         except Exception as e:
             message = 'Unable to create soap client from wsdl file, error: {}'.format(e)
             logger.error(message)
@@ -103,24 +200,90 @@ class SoapService:
 
         return client
 
+    @staticmethod
+    def _client_is_healthy(client: zeep.Client) -> bool:
+        """
+        Cheap liveness check run on a pooled client before it is handed out
+        :param client:
+        :return: bool
+        """
+        try:
+            client.service.processMessage
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _get_client_pool() -> ClientPool:
+        """
+        Returns the process wide client pool, creating it on first use
+        :return: ClientPool
+        """
+        global _client_pool
+        if _client_pool is None:
+            with _client_pool_lock:
+                if _client_pool is None:
+                    _client_pool = ClientPool(
+                        factory=SoapService._establish_client,
+                        health_check=SoapService._client_is_healthy,
+                        **settings.SOAP_CLIENT_POOL
+                    )
+        return _client_pool
+
     @staticmethod
     def _post_to_xstream(client: zeep.Client, xml: str):
         """
-        Posts xml to client
+        Posts xml to client, recording the exchange in the audit trail
         :param client:
         :param xml:
         :return: Result
         """
-        logger.debug('SoapService - _post_to_xstream() xml: {}'.format(xml))
+        payload_logger.debug('SoapService - _post_to_xstream() xml: %s', Payload(xml))
+        start = time.perf_counter()
         try:
-            response = client.service.processMessage(*settings.XSTREAM_CREDENTIALS, xml, 0)
+            with timed('post_to_xstream', function_type_of(xml)):
+                response = client.service.processMessage(*settings.XSTREAM_CREDENTIALS, xml, 0)
         except Exception as e:
             message = 'Failed to post to xstream, error: {}'.format(e)
             logger.error(message)
-            raise IOError(message)
+            audit.record(xml, error=message, duration=time.perf_counter() - start)
+            raise XStreamError(message, sent=not transport.never_sent(e))
 
+        audit.record(xml, response, duration=time.perf_counter() - start)
         return response
 
+    @staticmethod
+    def _post_with_retry(xml: str):
+        """
+        Posts xml through the function type's circuit breaker, retrying XStream failures of safe function types.
+        Each attempt waits for a slot of the current priority class first, see api.scheduler. Local failures to get a
+        slot or a soap client are raised as they are, they say nothing about XStream
+        :param xml:
+        :return: xstream response
+        """
+        function_type = function_type_of(xml)
+        breaker = circuit_breaker.get_breaker(function_type)
+        retry_policy = circuit_breaker.get_retry_policy()
+        retry_policy.budget.record_request()
+
+        attempt = 0
+        while True:
+            breaker.before_call()
+            with scheduler.slot():
+                try:
+                    with SoapService._get_client_pool().client() as client:
+                        response = SoapService._post_to_xstream(client, xml)
+                except XStreamError:
+                    breaker.record_failure()
+                    if not retry_policy.should_retry(function_type, attempt):
+                        raise
+                else:
+                    breaker.record_success()
+                    return response
+            # Backs off without holding the slot
+            time.sleep(retry_policy.delay(attempt))
+            attempt += 1
+
     @staticmethod
     def _handle_response(response: str) -> Result:
         """
@@ -128,28 +291,70 @@ class SoapService:
         :param response:
         :return: Result
         """
-        logger.debug('SoapService - _handle_response(response: {})'.format(response))
+        payload_logger.debug('SoapService - _handle_response(response: %s)', Payload(response))
         result = Result()
-        parsed_response = xmltodict.parse(response)['xmlreply']
-        response_result = parsed_response['messages']['result']
+        parsed_response = _get_reply_parser().parse(response)
+        response_result = parsed_response['result']
 
         if response_result == 'OK':
-            refno = parsed_response['apmdata']['prospect']['p.cm']['refno']
-            result.data = {'Refno': refno}
+            result.data = {'Refno': parsed_response['refno']}
             result.status = True
         elif response_result == 'Error':
-            errors = parsed_response['messages']['error'] if 'error' in parsed_response['messages'] else None  # type: list
+            result.data = parsed_response['errors']  # type: list
             result.status = False
 
         return result
 
     @staticmethod
     def process_message(xml: str) -> Result:
-        client = SoapService._establish_client()
-        response = SoapService._post_to_xstream(client, xml)
-        result = SoapService._handle_response(response)
+        cache = response_cache.get_cache()
+        cache_key = cache.key_for(xml) if cache is not None else None
+        if cache_key is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                result = Result(data=cached.data)
+                result.status = cached.status
+                result.cached = True
+                return result
+
+        coalescer = single_flight.get_single_flight()
+        if coalescer is None:
+            return SoapService._call_xstream(xml, cache, cache_key)
+
+        shared_result, shared = coalescer.do(
+            coalescer.key_for(xml, function_type_of(xml)), lambda: SoapService._call_xstream(xml, cache, cache_key)
+        )
+        if not shared:
+            return shared_result
+        result = Result(data=shared_result.data)
+        result.status = shared_result.status
+        result.coalesced = True
         return result
 
+    @staticmethod
+    def _call_xstream(xml: str, cache, cache_key) -> Result:
+        response = SoapService._post_with_retry(xml)
+        with timed('handle_response', function_type_of(xml)):
+            result = SoapService._handle_response(response)
+
+        if cache_key is not None and result.status is True:
+            cache.set(cache_key, result)
+        return result
+
+
+def _get_reply_parser() -> ReplyParser:
+    global _reply_parser
+    if _reply_parser is None:
+        _reply_parser = ReplyParser(settings.XSTREAM_REPLY_FIELDS)
+    return _reply_parser
+
+
+_reply_parser = None  # type: ReplyParser
+_client_pool = None  # type: ClientPool
+_client_pool_lock = threading.Lock()
+
+
+XSTREAM_BINDING = '{www.opengi.co.uk}OpenInterchangePortBinding'
 
 XSTREAM_TEMPLATE = {
     'xmlexecute': {
@@ -173,3 +378,13 @@ XSTREAM_TEMPLATE = {
         }
     }
 }
+
+# Static xml around the dynamic job/queue, yzt/char20.1, prospect/p.cm and apmpolicy sections of XSTREAM_TEMPLATE
+XSTREAM_FRAGMENTS = xml_builder.compile_envelope(XSTREAM_TEMPLATE, [
+    (('xmlexecute', 'job'), ()),
+    (('xmlexecute', 'parameters', 'yzt'), ('Char20.1',)),
+    (('xmlexecute', 'apmdata', 'prospect'), ()),
+    (('xmlexecute', 'apmpolicy'), ()),
+])
+
+_UNSET = object()
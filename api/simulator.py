@@ -0,0 +1,304 @@
+"""
+Local stand-in for the OpenGi XStream endpoint, for load tests, benchmarks and chaos tests.
+
+Serves templates/UAT.wsdl (with the test schema) and answers processMessage with realistic xmlreply documents, after
+a configurable latency and with configurable business error and fault rates.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import re
+import string
+import threading
+from xml.sax.saxutils import escape
+from django.conf import settings
+from lxml import etree
+
+
+logger = logging.getLogger(__name__)
+
+PATH = '/OpenInterchange/OpenInterchange'
+
+UPSTREAM_URL = 'https://openinterchange.openecommerce.co.uk:443' + PATH
+
+MANDATORY_PROSPECT_FIELDS = ('Name', 'Addr1', 'Pcode', 'Tel', 'Email')
+
+# Business errors returned at error_rate, as OpenGi words them
+SIMULATED_ERRORS = (
+    ('E301', 'Record is locked by another user'),
+    ('E402', 'Scheme not available for this risk'),
+    ('E510', 'Rating engine timed out'),
+)
+
+ENVELOPE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/"><S:Body>'
+    '<ns2:processMessageResponse xmlns:ns2="www.opengi.co.uk"><return>{}</return></ns2:processMessageResponse>'
+    '</S:Body></S:Envelope>'
+)
+
+FAULT = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/"><S:Body><S:Fault>'
+    '<faultcode>S:Server</faultcode><faultstring>Service unavailable</faultstring>'
+    '</S:Fault></S:Body></S:Envelope>'
+).encode('utf-8')
+
+_parser = etree.XMLParser(resolve_entities=False, no_network=True)
+
+
+def parse_latency(spec: str):
+    """
+    Returns a function returning a latency in seconds per call
+    :param spec: fixed:MS, uniform:LOW_MS,HIGH_MS, lognormal:MEDIAN_MS,SIGMA or exponential:MEAN_MS
+    :return: callable(random.Random) -> float
+    """
+    kind, _, params = spec.partition(':')
+    try:
+        values = [float(p) for p in params.split(',')] if params else []
+        if kind == 'fixed':
+            seconds = values[0] / 1000
+            return lambda rng: seconds
+        if kind == 'uniform':
+            low, high = values[0] / 1000, values[1] / 1000
+            return lambda rng: rng.uniform(low, high)
+        if kind == 'lognormal':
+            mu, sigma = math.log(values[0] / 1000), values[1]
+            return lambda rng: rng.lognormvariate(mu, sigma)
+        if kind == 'exponential':
+            rate = 1000 / values[0]
+            return lambda rng: rng.expovariate(rate)
+    except (IndexError, ValueError, ZeroDivisionError):
+        pass
+    raise ValueError('Invalid latency spec {!r}, expected e.g. fixed:50, uniform:20,80, lognormal:100,0.5 '
+                     'or exponential:100'.format(spec))
+
+
+def xmlreply(result: str, errors=(), refno: str = None, apmpolicy: str = '') -> str:
+    out = ['<xmlreply><messages><result>{}</result>'.format(result)]
+    for code, message in errors:
+        out.append('<error code="{}">{}</error>'.format(code, escape(message)))
+    out.append('</messages>')
+    if refno is not None:
+        out.append('<apmdata><prospect><p.cm><refno>{}</refno></p.cm></prospect></apmdata>'.format(refno))
+    out.append(apmpolicy)
+    out.append('</xmlreply>')
+    return ''.join(out)
+
+
+class XStreamSimulator:
+    """
+    asyncio HTTP/1.1 keep-alive server on its own thread (start/stop) or the current one (serve_forever).
+
+    fault can be set while running to force every following call to fail: 'error' answers with a 500 soap fault,
+    'drop' closes the connection without answering. Otherwise faults happen at fault_rate and business Error replies
+    at error_rate.
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency='fixed:0', error_rate: float = 0,
+                 fault_rate: float = 0, seed: int = None):
+        self.host = host
+        self.port = port
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.fault_rate = fault_rate
+        self.fault = None
+        self.requests = 0
+        self.random = random.Random(seed)
+        self.loop = None
+        self.server = None
+        self._thread = None
+        self._sequence = {}
+        self._connections = {}
+
+    @property
+    def address(self) -> str:
+        return 'http://{}:{}{}'.format(self.host, self.port, PATH)
+
+    def wsdl(self) -> bytes:
+        with open(os.path.join(settings.BASE_DIR, 'templates', 'UAT.wsdl'), 'rb') as f:
+            return f.read().replace(UPSTREAM_URL.encode('utf-8'), self.address.encode('utf-8'))
+
+    @staticmethod
+    def xsd() -> bytes:
+        with open(os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'UAT.xsd'), 'rb') as f:
+            return f.read()
+
+    def _next_number(self, prefix: str) -> int:
+        number = self._sequence[prefix] = self._sequence.get(prefix, 0) + 1
+        return number
+
+    def _next_refno(self, prefix: str) -> str:
+        """
+        :param prefix: 4 letters from the client's name
+        :return: 7 character client Refno as policy_schema's Ref expects, e.g. BOBT01A, the letter rolling over every
+                 99 clients
+        """
+        number = self._next_number(prefix) - 1
+        return '{}{:02d}{}'.format(prefix, number % 99 + 1, string.ascii_uppercase[number // 99 % 26])
+
+    def _next_polref(self, refno: str, policy_type: str) -> str:
+        """
+        :return: client Refno, policy type and 2 digit policy number, 11 characters for a 7 character Refno as
+                 split_polref and transaction_schema expect, e.g. BOBT01AYT01
+        """
+        prefix = '{}{}'.format(refno, policy_type)
+        return '{}{:02d}'.format(prefix, (self._next_number(prefix) - 1) % 99 + 1)
+
+    def reply_for(self, xml: str) -> str:
+        """
+        Builds the xmlreply OpenGi would send for an xmlexecute message
+        :param xml:
+        :return: str
+        """
+        try:
+            root = etree.fromstring(xml.encode('utf-8'), _parser)
+        except (etree.XMLSyntaxError, ValueError) as e:
+            return xmlreply('Error', [('E001', 'Unable to parse xmlexecute: {}'.format(e))])
+
+        function_type = root.findtext('parameters/yzt/char20.1') or ''
+        if self.error_rate and self.random.random() < self.error_rate:
+            return xmlreply('Error', [self.random.choice(SIMULATED_ERRORS)])
+
+        p_cm = root.find('apmdata/prospect/p.cm')
+        # create-cliv creates the prospect and its policy in one call
+        if function_type in ('create-cliv-prospect', 'create-cliv'):
+            missing = [field for field in MANDATORY_PROSPECT_FIELDS if p_cm is None or not p_cm.findtext(field)]
+            if missing:
+                return xmlreply('Error', [('E101', 'Mandatory field {} is missing'.format(f)) for f in missing])
+            prefix = (re.sub('[^A-Z]', '', p_cm.findtext('Name').upper()) + 'XXXX')[:4]
+            refno = self._next_refno(prefix)
+            if function_type == 'create-cliv-prospect':
+                return xmlreply('OK', refno=refno)
+        else:
+            refno = p_cm.findtext('Refno') if p_cm is not None else None
+        if not refno:
+            return xmlreply('Error', [('E102', 'Client record not found')])
+
+        apmpolicy = root.find('apmpolicy')
+        if apmpolicy is None:
+            return xmlreply('OK', refno=refno)
+        p_py = apmpolicy.find('p.py')
+        if p_py is not None and p_py.find('Polref') is None:
+            polref = etree.SubElement(p_py, 'Polref')
+            polref.text = self._next_polref(refno, p_py.findtext('Ptype') or 'XX')
+        if function_type == 'update-cliv':
+            apmpolicy = self._rate(apmpolicy)
+        return xmlreply('OK', refno=refno, apmpolicy=etree.tostring(apmpolicy, encoding='unicode'))
+
+    @staticmethod
+    def _rate(apmpolicy):
+        # A YTPQ premium line per rating section, priced on the number of fields it sets
+        rated = etree.Element('apmpolicy')
+        p_py = apmpolicy.find('p.py')
+        if p_py is not None:
+            rated.append(p_py)
+        for line, section in enumerate((e for e in apmpolicy if e.tag != 'p.py'), start=1):
+            premium = round(25 + 7.5 * len(section), 2)
+            ytpq = etree.SubElement(rated, 'YTPQ')
+            for tag, text in (('line', line), ('section', section.tag), ('premium', '{:.2f}'.format(premium)),
+                              ('ipt', '{:.2f}'.format(premium * 0.12))):
+                etree.SubElement(ytpq, tag).text = str(text)
+        return rated
+
+    def _respond(self, method: str, target: str, body: bytes):
+        if method == 'GET':
+            query = target.partition('?')[2].lower()
+            if query == 'wsdl':
+                return b'200 OK', self.wsdl()
+            if query.startswith('xsd'):
+                return b'200 OK', self.xsd()
+            return b'404 Not Found', b''
+
+        if self.fault == 'error' or (self.fault_rate and self.random.random() < self.fault_rate):
+            return b'500 Internal Server Error', FAULT
+        try:
+            envelope = etree.fromstring(body, _parser)
+            xml = next(envelope.iter('{*}arg2')).text
+        except (etree.XMLSyntaxError, StopIteration):
+            return b'500 Internal Server Error', FAULT
+        return b'200 OK', ENVELOPE.format(escape(self.reply_for(xml or ''))).encode('utf-8')
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                method, target = lines[0].split(' ')[:2]
+                headers = dict(line.lower().split(':', 1) for line in lines[1:] if ':' in line)
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if method == 'POST':
+                    self.requests += 1
+                    await asyncio.sleep(self.latency(self.random))
+                    if self.fault == 'drop':
+                        break
+                status, payload = self._respond(method, target, body)
+                writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/xml; charset=utf-8\r\n'
+                             b'Content-Length: ' + str(len(payload)).encode() + b'\r\n\r\n' + payload)
+                await writer.drain()
+                if headers.get('connection', '').strip() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _start_server(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def start(self) -> str:
+        """
+        Serves on a daemon thread
+        :return: str processMessage address
+        """
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self._start_server())
+            started.set()
+            self.loop.run_forever()
+            self.loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.address
+
+    async def _shutdown(self):
+        self.server.close()
+        # Closing the transport ends each handler at its next read, which is quieter than cancelling it
+        for writer in list(self._connections.values()):
+            writer.transport.abort()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self.server.wait_closed()
+        self.loop.stop()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        self._thread.join(5)
+
+    def serve_forever(self, started=None):
+        """
+        Serves on the current thread until interrupted
+        :param started: optional callable, passed the processMessage address once listening
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._start_server())
+        logger.info('XStreamSimulator - serving {}'.format(self.address))
+        if started is not None:
+            started(self.address)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
@@ -0,0 +1,208 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from api.circuit_breaker import CircuitOpenError
+from api.metrics import counters
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'expires')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.expires = None
+
+
+class DjangoCacheLockBackend:
+    """
+    Extends coalescing across processes through a shared django cache (e.g. Redis, memcached).
+
+    The first process to add the lock key makes the call and publishes its outcome for result_ttl seconds, the others
+    poll for that outcome for up to wait_timeout seconds, then make the call themselves.
+    """
+    def __init__(self, alias: str = 'default', lock_timeout: float = 60, wait_timeout: float = 60,
+                 result_ttl: float = 5, poll_interval: float = 0.05, **kwargs):
+        self.alias = alias
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+
+    def acquire(self, key: str):
+        """
+        :return: lock token if this process should make the call, otherwise None
+        """
+        token = uuid.uuid4().hex
+        if caches[self.alias].add('single_flight:lock:' + key, token, self.lock_timeout):
+            return token
+        return None
+
+    def publish(self, key: str, token: str, outcome: tuple):
+        cache = caches[self.alias]
+        cache.set('single_flight:result:' + key, outcome, self.result_ttl)
+        if cache.get('single_flight:lock:' + key) == token:
+            cache.delete('single_flight:lock:' + key)
+
+    def wait(self, key: str):
+        """
+        :return: (result, error) published by the lock holder, see describe_error, or None if it never published
+        """
+        cache = caches[self.alias]
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            outcome = cache.get('single_flight:result:' + key)
+            if outcome is not None:
+                return outcome
+            if cache.get('single_flight:lock:' + key) is None:
+                return cache.get('single_flight:result:' + key)
+            time.sleep(self.poll_interval)
+        return None
+
+
+class SingleFlight:
+    """
+    Shares one execution, and its result or IOError, between concurrent callers with the same key.
+
+    Within a process followers wait on the leader's event. With a backend, the leader of each process also takes a
+    shared lock, so only one process makes the call. linger keeps a successful result for that many seconds after the
+    call completes, to also absorb double submits that arrive just after it.
+    """
+    def __init__(self, backend=None, linger: float = 0):
+        self.backend = backend
+        self.linger = linger
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(xml: str, function_type: str) -> str:
+        return '{}:{}'.format(function_type, hashlib.sha256(xml.encode('utf-8')).hexdigest())
+
+    def do(self, key: str, func):
+        """
+        :param key: from key_for
+        :param func: no argument callable, called at most once per in-flight key
+        :return: (func result, True if it was shared from another caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.expires is not None and call.expires < time.monotonic():
+                call = None
+            leader = call is None
+            if leader:
+                if self.linger:
+                    self._prune()
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            counters.increment('xstream_coalesced:{}'.format(key.split(':', 1)[0]))
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._lead(key, func)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self.linger and call.error is None:
+                    call.expires = time.monotonic() + self.linger
+                else:
+                    del self._calls[key]
+            call.done.set()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, call in self._calls.items() if call.expires is not None and call.expires < now]:
+            del self._calls[key]
+
+    def _lead(self, key: str, func):
+        if self.backend is None:
+            return func(), False
+
+        token = self.backend.acquire(key)
+        if token is None:
+            outcome = self.backend.wait(key)
+            if outcome is not None:
+                counters.increment('xstream_coalesced:{}'.format(key.split(':', 1)[0]))
+                result, error = outcome
+                if error is not None:
+                    raise rebuild_error(error)
+                return result, True
+            logger.warning('SingleFlight - no result published for %s, calling XStream', key)
+            return func(), False
+
+        try:
+            result = func()
+        except Exception as e:
+            self.backend.publish(key, token, (None, describe_error(e)))
+            raise
+        self.backend.publish(key, token, (result, None))
+        return result, False
+
+
+def describe_error(error: Exception) -> dict:
+    """
+    The parts of a leader's error its followers in other processes need to tell, as api.services.may_have_reached_xstream
+    and the views do, whether XStream may have processed the call or its circuit is open
+    :return: dict, picklable by any cache backend
+    """
+    from api.services import XStreamError
+    if isinstance(error, CircuitOpenError):
+        return {'type': 'circuit_open', 'function_type': error.function_type, 'retry_after': error.retry_after}
+    if isinstance(error, XStreamError):
+        return {'type': 'xstream', 'message': str(error), 'sent': error.sent}
+    if isinstance(error, IOError):
+        return {'type': 'local', 'message': str(error)}
+    # Failed after XStream replied, e.g. decoding the reply
+    return {'type': 'xstream', 'message': 'Failed to post to xstream', 'sent': True}
+
+
+def rebuild_error(error: dict) -> IOError:
+    """
+    :param error: from describe_error
+    :return: the error for a follower to raise
+    """
+    from api.services import XStreamError
+    if error['type'] == 'circuit_open':
+        return CircuitOpenError(error['function_type'], error['retry_after'])
+    if error['type'] == 'xstream':
+        return XStreamError(error['message'], sent=error['sent'])
+    return IOError(error['message'])
+
+
+def get_single_flight():
+    """
+    Returns the configured SingleFlight, or None if settings.XSTREAM_SINGLE_FLIGHT is disabled
+    :return: SingleFlight or None
+    """
+    global _single_flight
+    if _single_flight is _UNSET:
+        with _single_flight_lock:
+            if _single_flight is _UNSET:
+                config = settings.XSTREAM_SINGLE_FLIGHT
+                if config['enabled']:
+                    backend = import_string(config['backend'])(**config.get('options', {})) \
+                        if config['backend'] else None
+                    _single_flight = SingleFlight(backend, linger=config['linger'])
+                else:
+                    _single_flight = None
+    return _single_flight
+
+
+_UNSET = object()
+_single_flight = _UNSET
+_single_flight_lock = threading.Lock()
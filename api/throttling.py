@@ -0,0 +1,37 @@
+from rest_framework.throttling import BaseThrottle
+from api import admission
+from api.authentication import ApiClient
+from api.metrics import counters
+
+
+def client_identity(request) -> str:
+    """
+    :return: API key id of an authenticated request, otherwise its client address (X-Forwarded-For aware, see
+             REST_FRAMEWORK['NUM_PROXIES'])
+    """
+    if isinstance(request.user, ApiClient):
+        return request.user.key_id
+    return BaseThrottle().get_ident(request)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Limits each API key, or each client address for requests without one, with a token bucket shared by every worker
+    (settings.ADMISSION['rate_limit']). Refused requests get 429 with Retry-After.
+    """
+    def allow_request(self, request, view):
+        client = client_identity(request)
+        rate, burst = admission.limits_for(client)
+        if not rate:
+            return True
+
+        admission.compact_if_due()
+
+        self.retry_after = admission.get_buckets().take(client, rate, burst)
+        if self.retry_after:
+            counters.increment('admission_rate_limited')
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
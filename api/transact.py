@@ -0,0 +1,148 @@
+import contextvars
+import logging
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.db import close_old_connections
+from rest_framework import renderers
+from api.circuit_breaker import CircuitOpenError
+from api import fast_json, quotes
+from api.services import SoapService, XStreamParser, split_polref
+
+
+logger = logging.getLogger(__name__)
+
+# A step of the transfer and buy, started as soon as every step named in after has succeeded
+Step = namedtuple('Step', ['name', 'function_type', 'after'])
+
+# The transfer and buy is the one convert-cliv message of templates/transfer_and_buy.xml, converting the prospect and
+# buying its policy together, so a failure never leaves the client converted without the policy. Only add steps that
+# XStream applies on their own, nothing undoes the steps that succeeded before a failure.
+STEPS = (
+    Step('transfer_and_buy', 'convert-cliv', ()),
+)
+
+
+def build_step_xml(step: Step, polref: str) -> str:
+    refno, policy_type = split_polref(polref)
+    parser = XStreamParser()
+    parser.add_ref(refno)
+    parser.add_policy_type(policy_type)
+    parser.add_polref(polref)
+    parser.add_function_type(step.function_type)
+    return parser.parse_to_xml()
+
+
+def _run_step(step: Step, polref: str):
+    return SoapService.process_message(build_step_xml(step, polref))
+
+
+def transfer_and_buy(polref: str, workers: int = 2):
+    """
+    Runs STEPS for polref through SoapService, independent steps concurrently, stopping at the first failure.
+
+    Progress is yielded as (event, data) pairs as it happens: ('step', {'step', 'status'}) with status started, done,
+    failed or skipped, then a final ('result', {'Polref', 'Refno', 'status'}) with status OK, Error or Unavailable.
+    :param polref: policy to convert
+    :param workers: max concurrent XStream calls
+    :return: generator of (event name, data dict)
+    """
+    refno = split_polref(polref)[0]
+    outcome = {'Polref': polref, 'Refno': refno, 'status': 'OK'}
+    pending = list(STEPS)
+    succeeded = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            if outcome['status'] == 'OK':
+                for step in [step for step in pending if succeeded.issuperset(step.after)]:
+                    pending.remove(step)
+                    running[executor.submit(_run_step, step, polref)] = step
+                    yield 'step', {'step': step.name, 'status': 'started'}
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    result = future.result()
+                except CircuitOpenError as e:
+                    outcome.update(status='Unavailable', retry_after=e.retry_after)
+                    yield 'step', {'step': step.name, 'status': 'failed', 'message': 'Service unavailable'}
+                    continue
+                except IOError as e:
+                    logger.error('transact - {} step of {} failed, error: {}'.format(step.name, polref, e))
+                    if outcome['status'] == 'OK':
+                        outcome['status'] = 'Error'
+                    yield 'step', {'step': step.name, 'status': 'failed', 'message': 'Error'}
+                    continue
+
+                if result.status is True:
+                    succeeded.add(step.name)
+                    if step.name == 'transfer_and_buy':
+                        # Bought, the memoised quotes for it no longer apply
+                        quotes.get_memo().invalidate(polref)
+                    yield 'step', {'step': step.name, 'status': 'done'}
+                else:
+                    errors = [error.message for error in result.data] if isinstance(result.data, list) else []
+                    if outcome['status'] == 'OK':
+                        outcome['status'] = 'Error'
+                    yield 'step', {'step': step.name, 'status': 'failed', 'message': 'Error', 'errors': errors}
+
+    for step in pending:
+        yield 'step', {'step': step.name, 'status': 'skipped'}
+    yield 'result', outcome
+
+
+def run_detached(polref: str, workers: int = 2):
+    """
+    Runs transfer_and_buy for polref on its own thread, so it completes even if its events stop being read, e.g. when
+    an event stream client disconnects while the policy is being bought
+    :return: generator of the (event name, data dict) pairs, as transfer_and_buy
+    """
+    events = queue.Queue()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            for event in transfer_and_buy(polref, workers):
+                events.put(event)
+        except Exception as e:
+            logger.error('transact - {} failed, error: {}'.format(polref, e))
+            events.put(('result', {'Polref': polref, 'Refno': split_polref(polref)[0], 'status': 'Error'}))
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=context.run, args=(run,), name='transact-{}'.format(polref)).start()
+    return _read_events(events)
+
+
+def _read_events(events: queue.Queue):
+    while True:
+        event, data = events.get()
+        yield event, data
+        if event == 'result':
+            return
+
+
+def to_sse(events):
+    """
+    Formats (event, data) pairs as Server-Sent Events
+    """
+    for event, data in events:
+        yield 'event: {}\ndata: {}\n\n'.format(event, fast_json.dumps(data).decode('utf-8'))
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Lets clients negotiate text/event-stream, responses that are not already a stream are sent as one error event
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(to_sse([('error', data)])).encode(self.charset)
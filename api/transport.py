@@ -0,0 +1,190 @@
+import os
+import ssl
+import threading
+import requests
+import zeep
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from api.metrics import counters
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        counters.increment('xstream_connections_opened')
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        counters.increment('xstream_connections_opened')
+        return super()._new_conn()
+
+
+class ResumableSSLSocket(ssl.SSLSocket):
+    def _real_close(self):
+        # TLS 1.3 session tickets arrive after the handshake, so the session is kept again as the connection closes
+        self.context.keep_session(self)
+        super()._real_close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Client SSLContext that offers the TLS session of the last connection to a host when opening a new one, so
+    reconnects (after XStream closed an idle keep-alive connection, or as the pool grows) resume the session instead of
+    making a full handshake. Counts resumed handshakes in xstream_tls_sessions_resumed.
+    """
+    sslsocket_class = ResumableSSLSocket
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if session is None and not server_side:
+            with self._sessions_lock:
+                session = self._sessions.get(server_hostname)
+        ssl_sock = super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                       server_hostname, session)
+        if session is not None and ssl_sock.session_reused:
+            counters.increment('xstream_tls_sessions_resumed')
+        self.keep_session(ssl_sock)
+        return ssl_sock
+
+    def keep_session(self, ssl_sock: ssl.SSLSocket):
+        """
+        Keeps the session of an established client connection for the next connection to its host
+        """
+        if ssl_sock.server_side or ssl_sock.server_hostname is None:
+            return
+        try:
+            session = ssl_sock.session
+        except (ssl.SSLError, ValueError):
+            return
+        if session is not None and (session.has_ticket or session.id):
+            with self._sessions_lock:
+                self._sessions[ssl_sock.server_hostname] = session
+
+
+def create_ssl_context() -> ResumingSSLContext:
+    """
+    Same as ssl.create_default_context() for a client, with TLS session resumption
+    :return: ResumingSSLContext
+    """
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_default_certs()
+    return context
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that shares one ssl context (CA bundle loaded once, TLS sessions resumed) across connections and
+    counts new connections
+    """
+    def __init__(self, ssl_context: ssl.SSLContext = None, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        counters.increment('xstream_requests')
+        return super().send(request, **kwargs)
+
+
+class XStreamTransport(zeep.Transport):
+    """
+    zeep transport with separate connect and read timeouts on a shared keep-alive session
+    """
+    def __init__(self, session: requests.Session, connect_timeout: float, read_timeout: float, load_timeout: float):
+        super().__init__(timeout=load_timeout, operation_timeout=(connect_timeout, read_timeout), session=session)
+
+
+def build_session(pool_maxsize: int, pool_block: bool, ssl_context: ssl.SSLContext = None) -> requests.Session:
+    """
+    Creates a requests session with a bounded, keep-alive connection pool per host
+    :param pool_maxsize: max open connections per host
+    :param pool_block: wait for a free connection instead of opening one over the limit
+    :param ssl_context: defaults to create_ssl_context()
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = KeepAliveAdapter(
+        ssl_context=ssl_context or create_ssl_context(),
+        pool_connections=1,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=0
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process wide xstream session, creating it on first use (and again after a fork)
+    :return: requests.Session
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                config = settings.XSTREAM_TRANSPORT
+                _session = build_session(config['pool_maxsize'], config['pool_block'])
+                _session_pid = os.getpid()
+    return _session
+
+
+def get_transport() -> XStreamTransport:
+    config = settings.XSTREAM_TRANSPORT
+    return XStreamTransport(
+        session=get_session(),
+        connect_timeout=config['connect_timeout'],
+        read_timeout=config['read_timeout'],
+        load_timeout=config['load_timeout']
+    )
+
+
+def never_sent(error: Exception) -> bool:
+    """
+    True if error shows the request never reached XStream, because no connection could be opened (refused, unresolved
+    or timed out connecting). Read timeouts and dropped connections are ambiguous, XStream may have processed it
+    :param error: raised by zeep posting on an XStreamTransport
+    :return: bool
+    """
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    # NewConnectionError (refused, unresolved) is a ConnectTimeoutError
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def connection_reuse_ratio() -> float:
+    """
+    Fraction of xstream requests served on an already open connection, 1.0 means no new handshakes
+    :return: float
+    """
+    requests_sent = counters.get('xstream_requests')
+    if not requests_sent:
+        return 0.0
+    opened = counters.get('xstream_connections_opened')
+    return max(0.0, 1 - opened / requests_sent)
+
+
+_session = None  # type: requests.Session
+_session_pid = None
+_session_lock = threading.Lock()
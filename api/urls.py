@@ -1,8 +1,14 @@
 from django.urls import path
-from api.views import Prospect, Transact, Policy
+from api.views import Prospect, ProspectBulk, Transact, Policy, ProspectAndRisk, Quote, JobStatus, \
+    OutboxStatus
 
 urlpatterns = [
     path('prospect', Prospect.as_view()),
+    path('prospect/bulk', ProspectBulk.as_view()),
     path('risk', Policy.as_view()),
-    path('transact', Transact.as_view())
+    path('prospect-and-risk', ProspectAndRisk.as_view()),
+    path('quote', Quote.as_view()),
+    path('transact', Transact.as_view()),
+    path('jobs/<uuid:job_id>', JobStatus.as_view(), name='job'),
+    path('outbox/<int:message_id>', OutboxStatus.as_view(), name='outbox')
 ]
\ No newline at end of file
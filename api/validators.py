@@ -0,0 +1,98 @@
+import logging
+import threading
+from jsonschema.validators import validator_for
+from api.parsers import prospect_schema, policy_schema, transaction_schema, quote_schema, \
+    prospect_and_risk_schema
+
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledSchema:
+    """
+    A schema checked against its meta-schema once, with a reusable validator.
+
+    If codegen is requested and fastjsonschema is installed, valid documents are accepted by generated code and only
+    invalid ones go through jsonschema to collect every error.
+    """
+    def __init__(self, schema: dict, codegen: bool = False):
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        self.schema = schema
+        self.validator = cls(schema)
+        self.fast_validate = self._generate(schema) if codegen else None
+
+    @staticmethod
+    def _generate(schema: dict):
+        try:
+            import fastjsonschema
+        except ImportError:
+            logger.debug('CompiledSchema - fastjsonschema not installed, using jsonschema only')
+            return None
+        return fastjsonschema.compile(schema)
+
+    def is_valid(self, json) -> bool:
+        if self.fast_validate is not None:
+            try:
+                self.fast_validate(json)
+                return True
+            except Exception:
+                return False
+        return self.validator.is_valid(json)
+
+    def errors(self, json) -> list:
+        """
+        Returns every validation error, empty if json is valid
+        :param json:
+        :return: list of str
+        """
+        if self.is_valid(json):
+            return []
+        return [
+            '{}: {}'.format(_path(error), error.message)
+            for error in self.validator.iter_errors(json)
+        ]
+
+    def failed_checks(self, json) -> list:
+        """
+        Returns the path and validator of every validation error, without the messages, which quote the offending
+        values, so they are safe to log
+        :param json:
+        :return: list of str
+        """
+        if self.is_valid(json):
+            return []
+        return ['{}: {}'.format(_path(error), error.validator) for error in self.validator.iter_errors(json)]
+
+
+def _path(error) -> str:
+    return '/'.join(str(p) for p in error.absolute_path) or '<root>'
+
+
+class ValidatorRegistry:
+    """
+    Compiled schemas keyed by schema object, so callers can keep passing the schema dicts from api.parsers
+    """
+    def __init__(self):
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def register(self, schema: dict, codegen: bool = False) -> CompiledSchema:
+        compiled = CompiledSchema(schema, codegen=codegen)
+        with self._lock:
+            self._compiled[id(schema)] = compiled
+        return compiled
+
+    def get(self, schema: dict) -> CompiledSchema:
+        compiled = self._compiled.get(id(schema))
+        if compiled is None or compiled.schema is not schema:
+            compiled = self.register(schema)
+        return compiled
+
+
+registry = ValidatorRegistry()
+registry.register(prospect_schema, codegen=True)
+registry.register(policy_schema, codegen=True)
+registry.register(transaction_schema)
+registry.register(quote_schema, codegen=True)
+registry.register(prospect_and_risk_schema, codegen=True)
@@ -1,14 +1,60 @@
+import json
+import logging
+import math
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, renderers
-from api.services import validate_json, create_prospect, add_policy
-from api.parsers import prospect_schema, policy_schema, transaction_schema
+from rest_framework import status
+from api import batch, bulk, jobs, metrics, outbox, quotes, transact
+from api.circuit_breaker import CircuitOpenError
+from api.fast_json import FastJSONRenderer
+from api.idempotency import idempotent
+from api.models import Job, OutboxMessage
+from api.services import validate_json, create_prospect, add_policy, prospect_parser, policy_parser, \
+    build_prospect_xml, build_policy_xml, function_type_of, may_have_reached_xstream
+from api.parsers import prospect_schema, policy_schema, transaction_schema, quote_schema, \
+    prospect_and_risk_schema
+
+
+logger = logging.getLogger(__name__)
+
+
+def service_unavailable(retry_after: float) -> Response:
+    response = Response({'message': 'Service unavailable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def stored(message: OutboxMessage) -> Response:
+    response = Response({'outbox': message.id}, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = reverse('outbox', args=[message.id])
+    return response
+
+
+def defer(xml: str, key: str, error: IOError) -> Response:
+    """
+    Stores a message XStream never received in the outbox and answers 202, or fails as before if the outbox is disabled.
+    A message that may have reached XStream (e.g. a read timeout) is not stored, replaying it could create the prospect
+    or policy twice, the client gets a 500 and must check before sending it again
+    """
+    if not settings.OUTBOX['enabled']:
+        if isinstance(error, CircuitOpenError):
+            return service_unavailable(error.retry_after)
+        raise error
+    if may_have_reached_xstream(error):
+        logger.error('{} - not stored in the outbox, XStream may have processed it, error: {}'.format(
+            function_type_of(xml), error))
+        return Response({'message': 'Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return stored(outbox.store(xml, key, str(error)))
 
 
 class Prospect(APIView):
     http_method_names = ['post']
-    renderer_classes = [renderers.JSONRenderer]
+    renderer_classes = [FastJSONRenderer]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
 
         prospect_data = self.request.data
@@ -17,7 +63,10 @@ class Prospect(APIView):
         if not is_validated:
             return Response({'message': 'Malformed request'}, status=status.HTTP_400_BAD_REQUEST)
 
-        prospect_created = create_prospect(prospect_data)
+        try:
+            prospect_created = create_prospect(prospect_data)
+        except IOError as e:
+            return defer(build_prospect_xml(prospect_data), '', e)
 
         if not prospect_created.status:
             return Response({'message': 'Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -25,10 +74,32 @@ class Prospect(APIView):
         return Response(prospect_created.data, status=status.HTTP_200_OK)
 
 
+class ProspectBulk(APIView):
+    """
+    Accepts prospects as NDJSON (one per line) or a JSON array, and streams back one NDJSON result per row
+    """
+    http_method_names = ['post']
+    renderer_classes = [FastJSONRenderer]
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type.startswith('application/json'):
+            if not isinstance(request.data, list):
+                return Response({'message': 'Malformed request'}, status=status.HTTP_400_BAD_REQUEST)
+            rows = request.data
+        else:
+            rows = bulk.read_jsonl(request.stream or [])
+
+        results = bulk.import_prospects(
+            rows, workers=settings.BULK_IMPORT['workers'], rate_limit=settings.BULK_IMPORT['rate_limit']
+        )
+        return StreamingHttpResponse(bulk.to_ndjson(results), content_type='application/x-ndjson')
+
+
 class Policy(APIView):
     http_method_names = ['post']
-    renderer_classes = [renderers.JSONRenderer]
+    renderer_classes = [FastJSONRenderer]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         policy_data = self.request.data
         is_validated = validate_json(policy_data, policy_schema)
@@ -36,21 +107,175 @@ class Policy(APIView):
         if not is_validated:
             return Response({'message': 'Malformed request'}, status=status.HTTP_400_BAD_REQUEST)
 
-        policy_added = add_policy(policy_data)
+        if settings.JOB_QUEUE['policy_async'] or 'respond-async' in request.META.get('HTTP_PREFER', ''):
+            job = jobs.enqueue('add_policy', policy_data)
+            response = Response({'job': str(job.id)}, status=status.HTTP_202_ACCEPTED)
+            response['Location'] = reverse('job', args=[job.id])
+            return response
+
+        ref = policy_data.get('Ref', '')
+        if settings.OUTBOX['enabled'] and ref and outbox.has_pending(ref):
+            # Earlier messages for the client are still waiting, this one must follow them
+            return stored(outbox.store(build_policy_xml(policy_data), ref, 'Queued behind earlier messages'))
+
+        try:
+            policy_added = add_policy(policy_data)
+        except IOError as e:
+            return defer(build_policy_xml(policy_data), ref, e)
+
         return Response(policy_data, status=status.HTTP_200_OK)
 
 
+class ProspectAndRisk(APIView):
+    """
+    Creates a prospect and adds its policy in one request, sent to XStream as a single batch
+    """
+    http_method_names = ['post']
+    renderer_classes = [FastJSONRenderer]
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        request_data = self.request.data
+        is_validated = validate_json(request_data, prospect_and_risk_schema)
+
+        if not is_validated:
+            return Response({'message': 'Malformed request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        operations = batch.Batch()
+        prospect_index = operations.add(prospect_parser(request_data['Prospect']))
+        operations.add(policy_parser(request_data['Policy']), refno_from=prospect_index)
+
+        try:
+            prospect_created, policy_added = operations.run()
+        except CircuitOpenError as e:
+            return service_unavailable(e.retry_after)
+        except IOError as e:
+            logger.error('ProspectAndRisk - prospect envelope failed, error: {}'.format(e))
+            return Response({'message': 'Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if not prospect_created.status:
+            return Response({'message': 'Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if isinstance(policy_added, IOError) or not policy_added.status:
+            # The prospect exists, the policy can be retried on its own through /api/risk
+            return Response({'message': 'Error', 'Refno': prospect_created.data['Refno']},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            'Prospect': prospect_created.data,
+            'Policy': dict(request_data['Policy'], Ref=prospect_created.data['Refno'])
+        }, status=status.HTTP_200_OK)
+
+
+class JobStatus(APIView):
+    http_method_names = ['get']
+    renderer_classes = [FastJSONRenderer]
+
+    def get(self, request, job_id, *args, **kwargs):
+        try:
+            job = Job.objects.get(id=job_id)
+        except Job.DoesNotExist:
+            return Response({'message': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'id': str(job.id),
+            'status': job.status,
+            'result': json.loads(job.result) if job.result else None,
+            'error': job.error
+        }, status=status.HTTP_200_OK)
+
+
+class OutboxStatus(APIView):
+    http_method_names = ['get']
+    renderer_classes = [FastJSONRenderer]
+
+    def get(self, request, message_id, *args, **kwargs):
+        try:
+            message = OutboxMessage.objects.get(id=message_id)
+        except OutboxMessage.DoesNotExist:
+            return Response({'message': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'id': message.id,
+            'status': message.status,
+            'attempts': message.attempts,
+            'result': json.loads(message.result) if message.result else None,
+            'error': message.error
+        }, status=status.HTTP_200_OK)
+
+
+class Quote(APIView):
+    """
+    Rates the risk of a policy, unchanged risks are answered from the quote memo without calling XStream
+    """
+    http_method_names = ['post']
+    renderer_classes = [FastJSONRenderer]
+
+    def post(self, request, *args, **kwargs):
+        quote_data = self.request.data
+        is_validated = validate_json(quote_data, quote_schema)
+
+        if not is_validated:
+            return Response({'message': 'Malformed request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            quote = quotes.calculate_quote(quote_data)
+        except CircuitOpenError as e:
+            return service_unavailable(e.retry_after)
+        except IOError as e:
+            logger.error('Quote - {} not rated, error: {}'.format(quote_data['Polref'], e))
+            return Response({'message': 'Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if not quote.status:
+            return Response({'message': 'Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(quote.data, status=status.HTTP_200_OK)
+
+
 class Transact(APIView):
+    """
+    Transfers and buys the policy Polref. Clients that accept text/event-stream get each step's progress as
+    Server-Sent Events while it runs, others get the final result once it completes.
+    """
     http_method_names = ['post']
-    renderer_classes = [renderers.JSONRenderer]
+    renderer_classes = [FastJSONRenderer, transact.EventStreamRenderer]
 
     def post(self, request, *args, **kwargs):
         transaction_data = self.request.data
-        print(transaction_data)
         validated_data = validate_json(transaction_data, transaction_schema)
 
         if not validated_data:
             return Response({'message': 'Malformed request'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # result = create_prospect(prospect_data)
-        return Response(validated_data, status=status.HTTP_200_OK)
+        if request.accepted_renderer.format == transact.EventStreamRenderer.format:
+            # Only the progress is streamed, the transaction runs to the end if the client goes away
+            events = transact.run_detached(transaction_data['Polref'], workers=settings.TRANSACT['workers'])
+            response = StreamingHttpResponse(transact.to_sse(events), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            # Stops nginx buffering the stream
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        events = transact.transfer_and_buy(transaction_data['Polref'], workers=settings.TRANSACT['workers'])
+        outcome = [data for event, data in events][-1]
+        if outcome['status'] == 'Unavailable':
+            return service_unavailable(outcome['retry_after'])
+        if outcome['status'] != 'OK':
+            return Response({'message': 'Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(outcome, status=status.HTTP_200_OK)
+
+
+class Metrics(APIView):
+    """
+    This process's counters, gauges and timing histograms in the Prometheus text format.
+
+    Served without API key or rate limit, as AdmissionMiddleware serves it without shedding, so a scraper is never
+    refused while the API is loaded. It holds no client data, but restrict it to the scraper at the proxy or network.
+    """
+    http_method_names = ['get']
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = []
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
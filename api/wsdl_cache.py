@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse, urljoin
+from urllib.request import url2pathname
+import requests
+import zeep
+from django.conf import settings
+from lxml import etree
+
+
+logger = logging.getLogger(__name__)
+
+XSD_NS = 'http://www.w3.org/2001/XMLSchema'
+MANIFEST = 'manifest.json'
+
+
+def _wsdl_source_path() -> str:
+    return url2pathname(urlparse(settings.WSDL).path)
+
+
+def _sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _fetch(url: str) -> bytes:
+    response = requests.get(url, timeout=settings.WSDL_CACHE['fetch_timeout'])
+    response.raise_for_status()
+    return response.content
+
+
+def _vendor_imports(tree: etree._ElementTree, base_url: str, cache_dir: str, fetch, vendored: dict):
+    """
+    Fetches every remote xsd import/include in tree, writes it to cache_dir and points schemaLocation at the local copy
+    :param tree:
+    :param base_url: url the document was loaded from, used to resolve relative locations
+    :param cache_dir:
+    :param fetch: callable(url) -> bytes
+    :param vendored: remote url -> local file name, shared across the recursion
+    """
+    for node in tree.iter('{%s}import' % XSD_NS, '{%s}include' % XSD_NS):
+        location = node.get('schemaLocation')
+        if not location:
+            continue
+        url = urljoin(base_url, location)
+        if urlparse(url).scheme not in ('http', 'https'):
+            continue
+
+        if url not in vendored:
+            file_name = 'schema_{}.xsd'.format(len(vendored) + 1)
+            vendored[url] = file_name
+            logger.info('wsdl_cache - vendoring {} as {}'.format(url, file_name))
+            schema = etree.ElementTree(etree.fromstring(fetch(url)))
+            _vendor_imports(schema, url, cache_dir, fetch, vendored)
+            schema.write(os.path.join(cache_dir, file_name), xml_declaration=True, encoding='UTF-8')
+
+        node.set('schemaLocation', vendored[url])
+
+
+def build_cache(cache_dir: str = None, fetch=_fetch) -> str:
+    """
+    Vendors the wsdl and all of its remote schemas into cache_dir, so clients can be built without network access
+    :param cache_dir: defaults to settings.WSDL_CACHE['dir']
+    :param fetch: callable(url) -> bytes used to download schemas
+    :return: path of the vendored wsdl
+    """
+    cache_dir = cache_dir or settings.WSDL_CACHE['dir']
+    source = _wsdl_source_path()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    tree = etree.parse(source)
+    vendored = {}
+    _vendor_imports(tree, settings.WSDL, cache_dir, fetch, vendored)
+
+    wsdl_file = os.path.join(cache_dir, os.path.basename(source))
+    tree.write(wsdl_file, xml_declaration=True, encoding='UTF-8')
+
+    manifest = {
+        'source': source,
+        'source_sha256': _sha256(source),
+        'zeep_version': zeep.__version__,
+        'schemas': vendored,
+        'created': time.time(),
+    }
+    with open(os.path.join(cache_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    return wsdl_file
+
+
+def cached_wsdl(cache_dir: str = None):
+    """
+    Returns the file url of the vendored wsdl, or None if there is no cache or it is stale.
+    The cache is stale once the source wsdl or zeep version changes, or it is older than settings.WSDL_CACHE['max_age']
+    :param cache_dir: defaults to settings.WSDL_CACHE['dir']
+    :return: str or None
+    """
+    cache_dir = cache_dir or settings.WSDL_CACHE['dir']
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        source = _wsdl_source_path()
+        max_age = settings.WSDL_CACHE['max_age']
+        if manifest['source_sha256'] != _sha256(source):
+            logger.info('wsdl_cache - stale, {} has changed'.format(source))
+            return None
+        if manifest['zeep_version'] != zeep.__version__:
+            logger.info('wsdl_cache - stale, built with zeep {}'.format(manifest['zeep_version']))
+            return None
+        if max_age is not None and time.time() - manifest['created'] > max_age:
+            logger.info('wsdl_cache - stale, older than {}s'.format(max_age))
+            return None
+        wsdl_file = os.path.join(cache_dir, os.path.basename(source))
+        if not os.path.exists(wsdl_file):
+            return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug('wsdl_cache - no usable cache, error: {}'.format(e))
+        return None
+
+    return 'file://{}'.format(os.path.abspath(wsdl_file))
+
+
+def resolve_wsdl() -> str:
+    """
+    Returns the vendored wsdl if fresh, otherwise settings.WSDL (full parse, fetching remote schemas)
+    :return: str
+    """
+    return cached_wsdl() or settings.WSDL
@@ -0,0 +1,81 @@
+import copy
+from xml.sax.saxutils import escape, quoteattr
+import xmltodict
+
+
+ATTR_PREFIX = '@'
+CDATA_KEY = '#text'
+
+# Private use code points, never produced by escaping, mark where dynamic content goes in a compiled envelope
+_SLOT = '\ue000'
+
+
+def emit(key: str, value, out: list):
+    """
+    Appends the xml for key/value to out, producing exactly what xmltodict.unparse(full_document=False) would
+    :param key: element name
+    :param value: None, scalar, dict or iterable of those
+    :param out: list of str fragments
+    """
+    if not hasattr(value, '__iter__') or isinstance(value, (str, dict)):
+        value = (value,)
+
+    for v in value:
+        if v is None:
+            out.append('<{0}></{0}>'.format(key))
+            continue
+        if not isinstance(v, dict):
+            out.append('<{0}>{1}</{0}>'.format(key, escape(str(v))))
+            continue
+
+        cdata = None
+        attrs = ''
+        children = []
+        for ik, iv in v.items():
+            if ik == CDATA_KEY:
+                cdata = iv
+            elif ik.startswith(ATTR_PREFIX):
+                if ik == '@xmlns' and isinstance(iv, dict):
+                    for ns, uri in iv.items():
+                        attrs += ' xmlns{}={}'.format(':{}'.format(ns) if ns else '', quoteattr(str(uri)))
+                else:
+                    attrs += ' {}={}'.format(ik[len(ATTR_PREFIX):], quoteattr(str(iv)))
+            else:
+                children.append((ik, iv))
+
+        out.append('<{}{}>'.format(key, attrs))
+        for child_key, child_value in children:
+            emit(child_key, child_value, out)
+        if cdata is not None:
+            out.append(escape(cdata))
+        out.append('</{}>'.format(key))
+
+
+def compile_envelope(template: dict, slots: list) -> list:
+    """
+    Renders template once and splits it into the static fragments around each slot.
+
+    A slot is (path, static_keys): the element at path keeps only the children named in static_keys, and the
+    fragments are split where its next child would be written.
+    :param template: xmltodict style dict
+    :param slots: list of (key path, static child keys), in document order
+    :return: list of len(slots) + 1 str fragments
+    """
+    template = copy.deepcopy(template)
+    for index, (path, static_keys) in enumerate(slots):
+        parent = template
+        for key in path[:-1]:
+            parent = parent[key]
+        element = parent[path[-1]] or {}
+        slot = {k: element[k] for k in static_keys}
+        # Element text is written after element children, i.e. exactly where the next child would go
+        slot[CDATA_KEY] = '{0}{1}{0}'.format(_SLOT, index)
+        parent[path[-1]] = slot
+
+    rendered = xmltodict.unparse(template, full_document=False)
+    fragments = []
+    for index in range(len(slots)):
+        head, rendered = rendered.split('{0}{1}{0}'.format(_SLOT, index))
+        fragments.append(head)
+    fragments.append(rendered)
+    return fragments
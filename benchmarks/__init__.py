@@ -0,0 +1,54 @@
+"""
+Micro and end-to-end benchmarks for the api hot paths.
+
+Run a single benchmark from the project root, e.g. `python -m benchmarks.bench_wsdl_startup`, or the regression suite
+over the request path stages with `python -m benchmarks.suite --baseline <results.json>`
+"""
+import os
+import timeit
+
+
+def setup_django(settings_module: str = 'OpenGiWebService.dev_settings'):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    from django.apps import apps
+    if apps.ready:
+        # Imported by the test suite, its settings are left as they are
+        return
+    django.setup()
+
+    from django.conf import settings
+    # Benchmarks drive the api from this host far faster than a client's rate limit allows
+    rate_limit = settings.ADMISSION['rate_limit']
+    settings.ADMISSION = dict(settings.ADMISSION, rate_limit=dict(
+        rate_limit, clients=dict(rate_limit['clients'], **{'127.0.0.1': {'rate': None, 'burst': 0}})
+    ))
+
+
+def use_stub_wsdl(address: str):
+    """
+    Points soap clients at address using a wsdl cache built from the test schema, so no network access is needed
+    """
+    import tempfile
+    from django.conf import settings
+    from api import wsdl_cache
+
+    def fetch(url):
+        with open(os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'UAT.xsd'), 'rb') as f:
+            return f.read()
+
+    settings.WSDL_CACHE = dict(settings.WSDL_CACHE, dir=tempfile.mkdtemp())
+    settings.XSTREAM_ADDRESS = address
+    settings.XSTREAM_CREDENTIALS = ('benchmark', 'benchmark')
+    wsdl_cache.build_cache(fetch=fetch)
+
+
+def best_of(func, number: int, repeat: int = 5) -> float:
+    """
+    Runs func number times, repeat times, and returns the fastest mean time per call in seconds
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(name: str, seconds: float):
+    print('{:<50} {:>12.1f} us'.format(name, seconds * 1e6))
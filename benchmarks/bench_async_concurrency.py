@@ -0,0 +1,68 @@
+"""
+Throughput of the blocking SoapService on a fixed number of worker threads (WSGI workers) against a single event loop
+running AsyncSoapService, both talking to the XStream simulator with fixed upstream latency.
+
+    python -m benchmarks.bench_async_concurrency
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import setup_django, use_stub_wsdl
+
+setup_django()
+
+from api.async_services import AsyncSoapService
+from api.services import SoapService, build_prospect_xml
+from api.simulator import XStreamSimulator
+
+REQUESTS = 400
+WORKERS = 4
+LATENCY = 0.05
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+
+def run_sync(xml: str) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        results = list(executor.map(lambda _: SoapService.process_message(xml), range(REQUESTS)))
+    assert all(result.status for result in results)
+    return time.perf_counter() - start
+
+
+async def run_async(xml: str) -> float:
+    service = AsyncSoapService()
+    await service.process_message(xml)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(service.process_message(xml) for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    await service.close()
+    assert all(result.status for result in results)
+    return elapsed
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    simulator = XStreamSimulator(latency='fixed:{}'.format(LATENCY * 1000))
+    use_stub_wsdl(simulator.start())
+    xml = build_prospect_xml(PROSPECT)
+
+    sync_elapsed = run_sync(xml)
+    async_elapsed = asyncio.run(run_async(xml))
+    simulator.stop()
+
+    print('{} requests, {}ms upstream latency'.format(REQUESTS, int(LATENCY * 1000)))
+    print('{:<40} {:>8.2f}s {:>8.0f} req/s'.format(
+        'sync, {} workers'.format(WORKERS), sync_elapsed, REQUESTS / sync_elapsed))
+    print('{:<40} {:>8.2f}s {:>8.0f} req/s'.format('async, 1 event loop', async_elapsed, REQUESTS / async_elapsed))
+
+
+if __name__ == '__main__':
+    main()
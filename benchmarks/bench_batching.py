@@ -0,0 +1,82 @@
+"""
+The website flow of creating a prospect then adding its policy, as two requests against /api/prospect-and-risk with
+and without the create-cliv merge rule, with the XStream simulator as upstream.
+
+    python -m benchmarks.bench_batching [--latency fixed:100] [--requests 50]
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+from benchmarks import setup_django, use_stub_wsdl
+
+setup_django()
+
+from django.conf import settings
+from django.test import Client
+from api.simulator import XStreamSimulator
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {
+    'Ptype': 'YT',
+    'Risk': {'CLT1': {'indem.yn': 'yes'}}
+}
+
+MERGE = [{'operations': ['create-cliv-prospect', 'create-cliv-policy'], 'function_type': 'create-cliv'}]
+
+
+def post(client: Client, path: str, body: dict) -> dict:
+    response = client.post(path, data=json.dumps(body), content_type='application/json')
+    assert response.status_code == 200, '{} returned {}'.format(path, response.status_code)
+    return response.json()
+
+
+def two_requests(client: Client):
+    refno = post(client, '/api/prospect', PROSPECT)['Refno']
+    post(client, '/api/risk', dict(POLICY, Ref=refno))
+
+
+def combined(client: Client):
+    post(client, '/api/prospect-and-risk', {'Prospect': PROSPECT, 'Policy': POLICY})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', default='fixed:100')
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    simulator = XStreamSimulator(latency=args.latency, seed=1)
+    use_stub_wsdl(simulator.start())
+    client = Client(HTTP_HOST='localhost')
+
+    print('{} flows each, upstream latency {}'.format(args.requests, args.latency))
+    print('{:<42} {:>9} {:>14}'.format('flow', 'p50 ms', 'XStream calls'))
+    for name, flow, merge in (('/api/prospect then /api/risk', two_requests, []),
+                              ('/api/prospect-and-risk, not merged', combined, []),
+                              ('/api/prospect-and-risk, create-cliv merged', combined, MERGE)):
+        settings.XSTREAM_BATCH = dict(settings.XSTREAM_BATCH, merge=merge)
+        flow(client)
+        calls = simulator.requests
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            flow(client)
+            latencies.append(time.perf_counter() - start)
+        print('{:<42} {:>9.1f} {:>14.1f}'.format(
+            name, statistics.median(latencies) * 1000, (simulator.requests - calls) / args.requests))
+
+    simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+End-to-end throughput and latency of /api/prospect and /api/risk, served by a threaded WSGI server with the XStream
+simulator as upstream, so every request goes through Django, DRF, validation, zeep and HTTP.
+
+    python -m benchmarks.bench_e2e_throughput [--latency lognormal:120,0.5] [--error-rate 0.02] [--clients 8]
+"""
+import argparse
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+import requests
+from benchmarks import setup_django, use_stub_wsdl
+
+setup_django()
+
+from django.core.wsgi import get_wsgi_application
+from api.simulator import XStreamSimulator
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {
+    'Ref': 'BOBT01X',
+    'Ptype': 'YT',
+    'Risk': {'CLT1': {'indem.yn': 'yes'}}
+}
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(url: str, body: dict, requests_count: int, clients: int):
+    local = threading.local()
+
+    def call(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.post(url, json=body)
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(call, range(requests_count)))
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', default='lognormal:120,0.5')
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--fault-rate', type=float, default=0)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--clients', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    simulator = XStreamSimulator(latency=args.latency, error_rate=args.error_rate, fault_rate=args.fault_rate, seed=1)
+    use_stub_wsdl(simulator.start())
+
+    server = make_server('127.0.0.1', 0, get_wsgi_application(), ThreadingWSGIServer, QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    print('{} requests per endpoint, {} clients, upstream latency {}, error rate {}, fault rate {}'.format(
+        args.requests, args.clients, args.latency, args.error_rate, args.fault_rate))
+    print('{:<16} {:>9} {:>9} {:>9} {:>9} {:>7}'.format('endpoint', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'non-2xx'))
+    for path, body in (('/api/prospect', PROSPECT), ('/api/risk', POLICY)):
+        run(base + path, body, args.clients, args.clients)
+        elapsed, results = run(base + path, body, args.requests, args.clients)
+        latencies = sorted(latency for latency, status_code in results)
+        failed = sum(1 for latency, status_code in results if status_code >= 300)
+        print('{:<16} {:>9.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+            path, len(results) / elapsed, statistics.median(latencies) * 1000,
+            percentile(latencies, 0.95) * 1000, percentile(latencies, 0.99) * 1000, failed))
+
+    server.shutdown()
+    simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+DRF's JSONParser / JSONRenderer (stdlib json) against api.fast_json (orjson) on prospect, policy and bulk payloads.
+
+    python -m benchmarks.bench_json
+"""
+import io
+import json
+from benchmarks import setup_django, best_of, report
+
+setup_django()
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from api import bulk, fast_json
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Addr2': 'Testville',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {
+    'Ref': 'ABCD01X',
+    'Ptype': 'YT',
+    'Risk': {'CLT1': {'indem.yn': 'yes'}}
+}
+
+BULK = [dict(PROSPECT, Name='Bob Test {}'.format(i)) for i in range(1000)]
+
+BULK_RESULTS = [{'row': i, 'status': 'created', 'Refno': 'BOBT{:02d}A'.format(i % 99 + 1)} for i in range(1000)]
+
+CONTEXT = {'encoding': 'utf-8'}
+
+
+def main():
+    for name, document, number in (('prospect', PROSPECT, 20000), ('policy', POLICY, 20000), ('bulk x1000', BULK, 50)):
+        body = json.dumps(document).encode('utf-8')
+        report('{} - parse, DRF'.format(name),
+               best_of(lambda: JSONParser().parse(io.BytesIO(body), parser_context=CONTEXT), number))
+        report('{} - parse, fast_json'.format(name),
+               best_of(lambda: fast_json.FastJSONParser().parse(io.BytesIO(body), parser_context=CONTEXT), number))
+        report('{} - render, DRF'.format(name), best_of(lambda: JSONRenderer().render(document), number))
+        report('{} - render, fast_json'.format(name),
+               best_of(lambda: fast_json.FastJSONRenderer().render(document), number))
+
+    report('bulk ndjson x1000 - json.dumps per row',
+           best_of(lambda: [json.dumps(result) + '\n' for result in BULK_RESULTS], 50))
+    report('bulk ndjson x1000 - bulk.to_ndjson', best_of(lambda: list(bulk.to_ndjson(BULK_RESULTS)), 50))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Latency of interactive prospect creation while a bulk import is running, with the XStream priority scheduler off and
+on, against the XStream simulator.
+
+    python -m benchmarks.bench_priority [--latency fixed:50] [--clients 2] [--requests 50] [--bulk-workers 8]
+
+Interactive calls are made the way the /api/prospect view makes them, bulk rows through api.bulk.import_prospects with
+no rate limit, so both compete for the same soap client pool.
+"""
+import argparse
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import setup_django, use_stub_wsdl
+
+setup_django()
+
+from django.conf import settings
+from api import bulk, scheduler
+from api.services import create_prospect
+from api.simulator import XStreamSimulator
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def interactive(client: int, requests_count: int) -> list:
+    latencies = []
+    for n in range(requests_count):
+        # Distinct messages, so none are coalesced
+        prospect = dict(PROSPECT, Name='Interactive {} {}'.format(client, n))
+        start = time.perf_counter()
+        result = create_prospect(prospect)
+        latencies.append(time.perf_counter() - start)
+        assert result.status is True
+    return latencies
+
+
+def run(clients: int, requests_count: int, bulk_workers: int, with_bulk: bool, enabled: bool):
+    settings.XSTREAM_SCHEDULER = dict(settings.XSTREAM_SCHEDULER, enabled=enabled)
+    scheduler._scheduler = scheduler._UNSET
+    stop = threading.Event()
+    imported = []
+
+    def rows():
+        for n in itertools.count():
+            if stop.is_set():
+                return
+            yield dict(PROSPECT, Name='Bulk {}'.format(n))
+
+    def import_rows():
+        for result in bulk.import_prospects(rows(), workers=bulk_workers):
+            imported.append(result)
+
+    importer = threading.Thread(target=import_rows)
+    if with_bulk:
+        importer.start()
+        time.sleep(0.5)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = list(itertools.chain.from_iterable(
+            executor.map(interactive, range(clients), [requests_count] * clients)
+        ))
+    elapsed = time.perf_counter() - start
+    imported_during = len(imported)
+
+    stop.set()
+    if with_bulk:
+        importer.join()
+    return latencies, imported_during / elapsed if with_bulk else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', default='fixed:50')
+    parser.add_argument('--clients', type=int, default=2, help='Concurrent interactive callers')
+    parser.add_argument('--requests', type=int, default=50, help='Interactive calls per client')
+    parser.add_argument('--bulk-workers', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    simulator = XStreamSimulator(latency=args.latency, seed=1)
+    use_stub_wsdl(simulator.start())
+    create_prospect(PROSPECT)
+
+    print('{} x {} interactive calls, upstream latency {}, soap client pool of {}, {} bulk workers'.format(
+        args.clients, args.requests, args.latency, settings.SOAP_CLIENT_POOL['size'], args.bulk_workers))
+    print('{:<34} {:>9} {:>9} {:>12}'.format('run', 'p50 ms', 'p99 ms', 'bulk rows/s'))
+    for name, with_bulk, enabled in (('interactive alone', False, True),
+                                     ('with bulk import, scheduler off', True, False),
+                                     ('with bulk import, scheduler on', True, True)):
+        latencies, bulk_rate = run(args.clients, args.requests, args.bulk_workers, with_bulk, enabled)
+        print('{:<34} {:>9.1f} {:>9.1f} {:>12.1f}'.format(
+            name, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, bulk_rate))
+
+    simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
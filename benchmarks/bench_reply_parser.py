@@ -0,0 +1,41 @@
+"""
+SoapService._handle_response (incremental ReplyParser) against the previous xmltodict.parse of the whole reply, over
+the replies in templates/test_xml/replies.
+
+    python -m benchmarks.bench_reply_parser
+"""
+import os
+from benchmarks import setup_django, best_of, report
+
+setup_django()
+
+import logging
+import xmltodict
+from django.conf import settings
+from api.services import SoapService
+
+REPLIES = os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'replies')
+
+
+def legacy_handle_response(response: str):
+    parsed_response = xmltodict.parse(response)['xmlreply']
+    response_result = parsed_response['messages']['result']
+    if response_result == 'OK':
+        return parsed_response['apmdata']['prospect']['p.cm']['refno']
+    return parsed_response['messages'].get('error')
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    for name in sorted(os.listdir(REPLIES)):
+        with open(os.path.join(REPLIES, name), encoding='utf-8') as f:
+            reply = f.read()
+        number = 50 if len(reply) > 10000 else 2000
+        report('{} ({} bytes) - xmltodict.parse'.format(name, len(reply)),
+               best_of(lambda: legacy_handle_response(reply), number))
+        report('{} ({} bytes) - ReplyParser'.format(name, len(reply)),
+               best_of(lambda: SoapService._handle_response(reply), number))
+
+
+if __name__ == '__main__':
+    main()
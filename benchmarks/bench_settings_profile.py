@@ -0,0 +1,86 @@
+"""
+Per-request overhead and worker boot time of the lean OpenGiWebService.api_settings profile against the full
+settings, each measured in fresh interpreters.
+
+    python -m benchmarks.bench_settings_profile [--boots 5] [--requests 2000]
+
+Requests are POSTs of an invalid body to /api/prospect, so they go through the middleware, DRF and validation but
+never reach XStream, and are made by calling the WSGI application directly. Rate limiting is turned off, it would
+refuse the benchmark and its buckets need a migrated database.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROFILES = ('OpenGiWebService.dev_settings', 'OpenGiWebService.api_settings')
+
+
+def child(requests_count: int):
+    start = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    boot = time.perf_counter() - start
+
+    from django.conf import settings
+    settings.ADMISSION['rate_limit']['rate'] = None
+    import logging
+    logging.disable(logging.CRITICAL)
+    body = b'{}'
+
+    def start_response(status, headers, exc_info=None):
+        assert status.startswith('400'), status
+
+    def request():
+        environ = {
+            'REQUEST_METHOD': 'POST', 'PATH_INFO': '/api/prospect', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+            'HTTP_HOST': 'localhost', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+        }
+        for _ in application(environ, start_response):
+            pass
+
+    for _ in range(100):
+        request()
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(requests_count):
+            request()
+        timings.append((time.perf_counter() - start) / requests_count)
+    print(json.dumps({'boot': boot, 'request': min(timings)}))
+
+
+def measure(profile: str, boots: int, requests_count: int) -> dict:
+    results = []
+    for _ in range(boots):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_settings_profile', '--child', '--requests', str(requests_count)],
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE=profile), stdout=subprocess.PIPE, check=True
+        ).stdout
+        results.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+    return {key: min(result[key] for result in results) for key in ('boot', 'request')}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boots', type=int, default=5, help='Fresh interpreters per profile, the best is reported')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.requests)
+        return
+
+    print('{:<34} {:>12} {:>14}'.format('settings', 'boot ms', 'request us'))
+    for profile in PROFILES:
+        result = measure(profile, args.boots, args.requests)
+        print('{:<34} {:>12.1f} {:>14.1f}'.format(profile, result['boot'] * 1000, result['request'] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
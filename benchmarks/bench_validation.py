@@ -0,0 +1,42 @@
+"""
+jsonschema.validate per request (meta-schema check and new validator every call) against the compiled registry.
+
+    python -m benchmarks.bench_validation
+"""
+from benchmarks import setup_django, best_of, report
+
+setup_django()
+
+from jsonschema import validate
+from api.parsers import prospect_schema, policy_schema, transaction_schema
+from api.validators import registry, CompiledSchema
+
+CASES = {
+    'prospect': (prospect_schema, {
+        'Name': 'Bob Test',
+        'Addr1': '3 Test Rd',
+        'Addr2': 'Testville',
+        'Pcode': 'TT1 TT2',
+        'Tel': '1234567890',
+        'Email': 'j@j.com',
+    }),
+    'policy': (policy_schema, {
+        'Ref': 'ABCD01X',
+        'Ptype': 'YT',
+        'Risk': {'CLT1': {'indem.yn': 'yes'}}
+    }),
+    'transaction': (transaction_schema, {'Polref': 'ABCD01XYT01'}),
+}
+
+
+def main():
+    for name, (schema, document) in CASES.items():
+        compiled = registry.get(schema)
+        plain = CompiledSchema(schema)
+        report('{} - validate per request'.format(name), best_of(lambda: validate(document, schema), 2000))
+        report('{} - compiled jsonschema'.format(name), best_of(lambda: plain.errors(document), 2000))
+        report('{} - registry'.format(name), best_of(lambda: compiled.errors(document), 2000))
+
+
+if __name__ == '__main__':
+    main()
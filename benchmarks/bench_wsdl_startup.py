@@ -0,0 +1,30 @@
+"""
+Client build time from the source wsdl (fetches remote schemas) against the vendored wsdl cache.
+
+    python manage.py vendor_wsdl
+    python -m benchmarks.bench_wsdl_startup
+"""
+from benchmarks import setup_django, best_of, report
+
+setup_django()
+
+import zeep
+from django.conf import settings
+from api import wsdl_cache
+
+
+def main():
+    cached = wsdl_cache.cached_wsdl()
+    if cached is None:
+        print('No fresh wsdl cache, run `python manage.py vendor_wsdl` first')
+    else:
+        report('cached load ({})'.format(settings.WSDL_CACHE['dir']), best_of(lambda: zeep.Client(wsdl=cached), 20))
+
+    try:
+        report('cold parse ({})'.format(settings.WSDL), best_of(lambda: zeep.Client(wsdl=settings.WSDL), 1, repeat=3))
+    except Exception as e:
+        print('cold parse failed, error: {}'.format(e))
+
+
+if __name__ == '__main__':
+    main()
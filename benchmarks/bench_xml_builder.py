@@ -0,0 +1,57 @@
+"""
+XStreamParser build + parse_to_xml against the previous deepcopy(XSTREAM_TEMPLATE) + xmltodict.unparse path.
+
+    python -m benchmarks.bench_xml_builder
+"""
+import copy
+from benchmarks import setup_django, best_of, report
+
+setup_django()
+
+import xmltodict
+from api.services import build_prospect_xml, build_policy_xml, XSTREAM_TEMPLATE
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Addr2': 'Testville',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {
+    'Ref': 'ABCD01X',
+    'Ptype': 'YT',
+    'Risk': {'CLT1': {'indem.yn': 'yes'}}
+}
+
+
+def legacy_prospect_xml(prospect_json: dict) -> str:
+    template = copy.deepcopy(XSTREAM_TEMPLATE)
+    template['xmlexecute']['apmdata']['prospect']['p.cm'] = prospect_json
+    template['xmlexecute']['parameters']['yzt']['char20.1'] = 'create-cliv-prospect'
+    return xmltodict.unparse(template, full_document=False)
+
+
+def legacy_policy_xml(policy_json: dict) -> str:
+    template = copy.deepcopy(XSTREAM_TEMPLATE)
+    template['xmlexecute']['apmdata']['prospect']['p.cm'] = {'Refno': policy_json['Ref']}
+    template['xmlexecute']['apmpolicy']['p.py']['Ptype'] = policy_json['Ptype']
+    for k, v in policy_json['Risk'].items():
+        template['xmlexecute']['apmpolicy'][k] = v
+    template['xmlexecute']['parameters']['yzt']['char20.1'] = 'create-cliv-policy'
+    return xmltodict.unparse(template, full_document=False)
+
+
+def main():
+    assert legacy_prospect_xml(PROSPECT) == build_prospect_xml(PROSPECT)
+    assert legacy_policy_xml(POLICY) == build_policy_xml(POLICY)
+    report('prospect - deepcopy + xmltodict.unparse', best_of(lambda: legacy_prospect_xml(PROSPECT), 2000))
+    report('prospect - compiled envelope', best_of(lambda: build_prospect_xml(PROSPECT), 2000))
+    report('policy - deepcopy + xmltodict.unparse', best_of(lambda: legacy_policy_xml(POLICY), 2000))
+    report('policy - compiled envelope', best_of(lambda: build_policy_xml(POLICY), 2000))
+
+
+if __name__ == '__main__':
+    main()
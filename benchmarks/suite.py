@@ -0,0 +1,236 @@
+"""
+Regression suite over the request path stages, with JSON results and a per-stage comparison against a baseline.
+
+    python -m benchmarks.suite --output main.json                      # e.g. on main
+    python -m benchmarks.suite --output pr.json --baseline main.json   # on a branch, exits 1 if a stage regressed
+
+Stages are timed as the best of several repeats (mean seconds per call), which is far less noisy than a single mean.
+The view stages run Prospect.post / Policy.post through the Django test client against the XStream simulator with no
+added latency, so they include zeep and local HTTP but no upstream wait. Policy.post checks the outbox, so they run
+against a freshly migrated test database, as the tests do.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import timeit
+from collections import OrderedDict, namedtuple
+from benchmarks import setup_django
+
+setup_django()
+
+import django
+import zeep
+from django.conf import settings
+from django.test import Client
+from api.parsers import prospect_schema, policy_schema, transaction_schema
+from api.services import SoapService, XStreamParser, validate_json
+
+REPLIES = os.path.join(settings.BASE_DIR, 'templates', 'test_xml', 'replies')
+
+PROSPECT = {
+    'Name': 'Bob Test',
+    'Addr1': '3 Test Rd',
+    'Addr2': 'Testville',
+    'Pcode': 'TT1 TT2',
+    'Tel': '1234567890',
+    'Email': 'j@j.com',
+}
+
+POLICY = {
+    'Ref': 'ABCD01X',
+    'Ptype': 'YT',
+    'Risk': {'CLT1': {'indem.yn': 'yes'}}
+}
+
+TRANSACTION = {'Polref': 'ABCD01XYT01'}
+
+Stage = namedtuple('Stage', ['name', 'func', 'number'])
+
+Change = namedtuple('Change', ['stage', 'baseline', 'current', 'ratio', 'status'])
+
+
+def _read_reply(name: str) -> str:
+    with open(os.path.join(REPLIES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _prospect_xml() -> str:
+    parser = XStreamParser()
+    parser.add_apm(PROSPECT)
+    parser.add_function_type('create-cliv-prospect')
+    return parser.parse_to_xml()
+
+
+def _policy_xml() -> str:
+    parser = XStreamParser()
+    parser.add_ref(POLICY['Ref'])
+    parser.add_policy_type(POLICY['Ptype'])
+    parser.add_risk_data(POLICY['Risk'])
+    parser.add_function_type('create-cliv-policy')
+    return parser.parse_to_xml()
+
+
+def _view(client: Client, path: str, body: dict, expected_status: int = 200):
+    encoded = json.dumps(body)
+
+    def post():
+        response = client.post(path, data=encoded, content_type='application/json')
+        assert response.status_code == expected_status, '{} returned {}'.format(path, response.status_code)
+
+    return post
+
+
+def build_stages(view_stages: bool = True) -> list:
+    stages = [
+        Stage('validate_json.prospect', lambda: validate_json(PROSPECT, prospect_schema), 2000),
+        Stage('validate_json.policy', lambda: validate_json(POLICY, policy_schema), 2000),
+        Stage('validate_json.transaction', lambda: validate_json(TRANSACTION, transaction_schema), 2000),
+        Stage('xstream_parser.prospect', _prospect_xml, 2000),
+        Stage('xstream_parser.policy', _policy_xml, 2000),
+    ]
+    for name in ('prospect_ok', 'policy_ok', 'error'):
+        reply = _read_reply('{}.xml'.format(name))
+        stages.append(Stage('handle_response.{}'.format(name), lambda reply=reply: SoapService._handle_response(reply),
+                            2000))
+    if view_stages:
+        # testserver is only an allowed host under the test runner
+        client = Client(HTTP_HOST='localhost')
+        stages.append(Stage('view.prospect_post', _view(client, '/api/prospect', PROSPECT), 100))
+        stages.append(Stage('view.policy_post', _view(client, '/api/risk', POLICY), 100))
+    return stages
+
+
+def run(stages: list, repeat: int = 5) -> OrderedDict:
+    """
+    :return: OrderedDict of stage name to {'seconds': best mean per call, 'stdev': across repeats, 'number', 'repeat'}
+    """
+    results = OrderedDict()
+    for stage in stages:
+        stage.func()
+        timings = [t / stage.number for t in timeit.repeat(stage.func, number=stage.number, repeat=repeat)]
+        results[stage.name] = {
+            'seconds': min(timings),
+            'stdev': statistics.stdev(timings) if len(timings) > 1 else 0,
+            'number': stage.number,
+            'repeat': repeat
+        }
+    return results
+
+
+def environment() -> dict:
+    return {
+        'created': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'zeep': zeep.__version__,
+        'machine': platform.machine(),
+        'node': platform.node(),
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Compares two result sets stage by stage
+    :param baseline: results dict, as written by run()
+    :param current: results dict, as written by run()
+    :param threshold: fractional slowdown that counts as a regression, e.g. 0.1 for 10%
+    :return: list of Change, status is one of ok, slower, faster, new or missing
+    """
+    changes = []
+    for name, result in current.items():
+        if name not in baseline:
+            changes.append(Change(name, None, result['seconds'], None, 'new'))
+            continue
+        before = baseline[name]['seconds']
+        ratio = result['seconds'] / before if before else float('inf')
+        if ratio > 1 + threshold:
+            status = 'slower'
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        else:
+            status = 'ok'
+        changes.append(Change(name, before, result['seconds'], ratio, status))
+    for name, result in baseline.items():
+        if name not in current:
+            changes.append(Change(name, result['seconds'], None, None, 'missing'))
+    return changes
+
+
+def _us(seconds) -> str:
+    return '-' if seconds is None else '{:.1f}'.format(seconds * 1e6)
+
+
+def format_changes(changes: list) -> str:
+    lines = ['{:<32} {:>14} {:>14} {:>9}  {}'.format('stage', 'baseline us', 'current us', 'change', 'status')]
+    for change in changes:
+        lines.append('{:<32} {:>14} {:>14} {:>9}  {}'.format(
+            change.stage, _us(change.baseline), _us(change.current),
+            '-' if change.ratio is None else '{:+.1%}'.format(change.ratio - 1),
+            change.status.upper() if change.status == 'slower' else change.status))
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against this JSON results file')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Fractional slowdown of any stage that fails the run (default 0.15)')
+    parser.add_argument('--filter', default='', help='Only run stages starting with this prefix')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-views', action='store_true', help='Skip the view stages (no simulator needed)')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    simulator = None
+    old_name = None
+    if not args.no_views:
+        from django.db import connection
+        from benchmarks import use_stub_wsdl
+        from api.simulator import XStreamSimulator
+
+        simulator = XStreamSimulator(seed=1)
+        use_stub_wsdl(simulator.start())
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+
+    try:
+        stages = [stage for stage in build_stages(not args.no_views) if stage.name.startswith(args.filter)]
+        results = run(stages, repeat=args.repeat)
+    finally:
+        if simulator is not None:
+            simulator.stop()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+    if not args.baseline:
+        for name, result in results.items():
+            print('{:<32} {:>12.1f} us  (+/- {:.1f})'.format(name, result['seconds'] * 1e6, result['stdev'] * 1e6))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.filter:
+        baseline['results'] = {k: v for k, v in baseline['results'].items() if k.startswith(args.filter)}
+    changes = compare(baseline['results'], results, args.threshold)
+    print('baseline: {}'.format(', '.join('{} {}'.format(k, v) for k, v in baseline.get('environment', {}).items())))
+    print(format_changes(changes))
+
+    regressions = [change for change in changes if change.status == 'slower']
+    if regressions:
+        print('\n{} stage(s) more than {:.0%} slower than baseline: {}'.format(
+            len(regressions), args.threshold, ', '.join(change.stage for change in regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())